@@ -0,0 +1,118 @@
+import os
+from dotenv import load_dotenv
+
+# Settings can be overridden through environment variables or a local .env file
+load_dotenv()
+
+
+def _get_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _get_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Root log level; DEBUG adds full prompts, scores and retrieved documents
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Ollama model server
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+OLLAMA_CONNECT_TIMEOUT = _get_float("OLLAMA_CONNECT_TIMEOUT", 5.0)
+OLLAMA_READ_TIMEOUT = _get_float("OLLAMA_READ_TIMEOUT", 300.0)
+OLLAMA_MAX_CONNECTIONS = _get_int("OLLAMA_MAX_CONNECTIONS", 16)
+OLLAMA_MAX_KEEPALIVE = _get_int("OLLAMA_MAX_KEEPALIVE", 8)
+OLLAMA_MAX_CONCURRENCY = _get_int("OLLAMA_MAX_CONCURRENCY", 8)
+# Resilience of LLM calls: a deadline per call (including retries and queueing),
+# retries with jittered exponential backoff for connection errors and 5xx/429,
+# fail-fast beyond OLLAMA_MAX_IN_FLIGHT running plus queued calls, a circuit
+# breaker that rejects calls for OLLAMA_BREAKER_RESET seconds after
+# OLLAMA_BREAKER_FAILURES consecutive failures, and sharing one model call
+# between identical concurrent prompts
+OLLAMA_DEADLINE = _get_float("OLLAMA_DEADLINE", 300.0)
+OLLAMA_MAX_RETRIES = _get_int("OLLAMA_MAX_RETRIES", 2)
+OLLAMA_RETRY_BACKOFF = _get_float("OLLAMA_RETRY_BACKOFF", 0.5)
+OLLAMA_RETRY_BACKOFF_MAX = _get_float("OLLAMA_RETRY_BACKOFF_MAX", 8.0)
+OLLAMA_MAX_IN_FLIGHT = _get_int("OLLAMA_MAX_IN_FLIGHT", 64)
+OLLAMA_BREAKER_FAILURES = _get_int("OLLAMA_BREAKER_FAILURES", 5)
+OLLAMA_BREAKER_RESET = _get_float("OLLAMA_BREAKER_RESET", 30.0)
+OLLAMA_COALESCE = _get_bool("OLLAMA_COALESCE", True)
+
+# FAISS indexes and documentation chunks built by scripts/preprocess_docs.py
+INDEX_DIR = os.getenv("INDEX_DIR", "data/faiss_index")
+# Unset: use the document store recorded in index_meta.json, else documentation_chunks.json
+DOCS_FILE = os.getenv("DOCS_FILE")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+FAISS_NPROBE = _get_int("FAISS_NPROBE", 16)
+FAISS_EF_SEARCH = _get_int("FAISS_EF_SEARCH", 64)
+# Memory-map index files so that several workers share them through the page cache
+FAISS_MMAP = _get_bool("FAISS_MMAP", True)
+
+# When to load indexes and models: "eager" (before serving), "background"
+# (serve immediately, /ready reports 503 until loaded) or "lazy" (on the first
+# request, or the first /ready probe)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+
+# Documents kept per syntax element, and the minimum dense similarity for a match
+RETRIEVAL_TOP_K = _get_int("RETRIEVAL_TOP_K", 2)
+RETRIEVAL_SCORE_THRESHOLD = _get_float("RETRIEVAL_SCORE_THRESHOLD", 0.6)
+# Fuse dense results with the BM25 index written by preprocess_docs (when present)
+HYBRID_SEARCH = _get_bool("HYBRID_SEARCH", True)
+HYBRID_CANDIDATES = _get_int("HYBRID_CANDIDATES", 10)
+HYBRID_RRF_K = _get_int("HYBRID_RRF_K", 60)
+# Minimum share of a query's term weight (0-1) a BM25 result must match to be fused
+HYBRID_LEXICAL_THRESHOLD = _get_float("HYBRID_LEXICAL_THRESHOLD", 0.5)
+
+# Prompt size limits (estimated tokens) for retrieved documentation and for
+# code sent to be explained; near-duplicate snippets above the overlap share are dropped
+CONTEXT_TOKEN_BUDGET = _get_int("CONTEXT_TOKEN_BUDGET", 1500)
+CONTEXT_OVERLAP_THRESHOLD = _get_float("CONTEXT_OVERLAP_THRESHOLD", 0.8)
+EXPLANATION_CODE_TOKEN_BUDGET = _get_int("EXPLANATION_CODE_TOKEN_BUDGET", 1500)
+
+# Thread pool used for CPU-bound embedding and FAISS search
+RETRIEVAL_WORKERS = _get_int("RETRIEVAL_WORKERS", 2)
+# Micro-batching of queries from concurrent requests: a batch is retrieved once it
+# holds RETRIEVAL_BATCH_SIZE queries or RETRIEVAL_BATCH_WAIT_MS has passed (1 disables)
+RETRIEVAL_BATCH_SIZE = _get_int("RETRIEVAL_BATCH_SIZE", 32)
+RETRIEVAL_BATCH_WAIT_MS = _get_float("RETRIEVAL_BATCH_WAIT_MS", 2.0)
+
+# Explanation handling: "inline", "background" or "lazy"
+EXPLANATION_MODE = os.getenv("EXPLANATION_MODE", "inline")
+EXPLANATION_STORE_SIZE = _get_int("EXPLANATION_STORE_SIZE", 1000)
+
+# /generate/batch and scripts/batch_generate.py: prompts parsed or generated at
+# once (LLM calls are also capped by OLLAMA_MAX_CONCURRENCY) and requests per upload
+BATCH_MAX_CONCURRENCY = _get_int("BATCH_MAX_CONCURRENCY", 8)
+BATCH_MAX_REQUESTS = _get_int("BATCH_MAX_REQUESTS", 10000)
+
+# Parse prompts locally by matching their clauses to known syntax elements (chunk
+# titles, built by preprocess_docs); the LLM is only asked when a clause's cosine
+# similarity to its best element is below FAST_PARSE_THRESHOLD
+FAST_PARSE_ENABLED = _get_bool("FAST_PARSE_ENABLED", True)
+FAST_PARSE_THRESHOLD = _get_float("FAST_PARSE_THRESHOLD", 0.75)
+FAST_PARSE_MAX_CLAUSES = _get_int("FAST_PARSE_MAX_CLAUSES", 4)
+
+# Cache of parsed syntax elements per prompt
+PARSE_CACHE_ENABLED = _get_bool("PARSE_CACHE_ENABLED", True)
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "data/cache/parse_cache.json")
+PARSE_CACHE_SIZE = _get_int("PARSE_CACHE_SIZE", 4096)
+PARSE_CACHE_TTL = _get_float("PARSE_CACHE_TTL", 7 * 24 * 3600)
+PARSE_CACHE_SEMANTIC = _get_bool("PARSE_CACHE_SEMANTIC", False)
+PARSE_CACHE_SIMILARITY = _get_float("PARSE_CACHE_SIMILARITY", 0.95)
+
+# Cache of complete /generate results, in memory and on disk
+RESPONSE_CACHE_ENABLED = _get_bool("RESPONSE_CACHE_ENABLED", False)
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "data/cache/response_cache.sqlite3")
+RESPONSE_CACHE_SIZE = _get_int("RESPONSE_CACHE_SIZE", 512)
+RESPONSE_CACHE_TTL = _get_float("RESPONSE_CACHE_TTL", 30 * 24 * 3600)
+
+# Write-behind log of generations (prompt, documents, code, explanation, timings),
+# flushed in batches every HISTORY_FLUSH_MS and served by GET /history/{id}
+HISTORY_ENABLED = _get_bool("HISTORY_ENABLED", True)
+HISTORY_PATH = os.getenv("HISTORY_PATH", "data/history/generations.sqlite3")
+HISTORY_FLUSH_MS = _get_float("HISTORY_FLUSH_MS", 200.0)
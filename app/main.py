@@ -1,17 +1,43 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from app.schemas.api_schemas import CodeRequest, CodeResponse
-from app.services.query_parser import SyntaxQueryParser
-from app.services.document_retrieval import DocumentRetriever
-from app.services.syntax_merger import CodeMerger
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app import config
+from app.models.resilience import LLMError, LLMTimeoutError, LLMUnavailableError
+from app.schemas.api_schemas import CodeRequest, CodeResponse, ExplanationResponse, HistoryRecord
+from app.services.batch_generator import read_requests
+from app.services.container import ServiceContainer
+from app.services.document_retrieval import rank_by_relevance
+from app.services.response_cache import ResponseCache
+from app.utils.metrics import REGISTRY, collect_timings, request_id_var, span
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import json
 import logging
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+# LOG_LEVEL=DEBUG turns on the verbose prompt/score/document logging
+logging.getLogger().setLevel(config.LOG_LEVEL)
+
+BASE_DIR = Path(__file__).parent.parent
+
+# Indexes, models and caches are built in the lifespan or on first use, not at import
+services = ServiceContainer(BASE_DIR)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.info(f"Starting up with STARTUP_MODE={config.STARTUP_MODE}")
+    if config.STARTUP_MODE == "eager":
+        await services.ensure_ready()
+    elif config.STARTUP_MODE == "background":
+        services.start_warm_up()
+    yield
+    await services.aclose()
 
 # Create the FastAPI app instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,58 +46,264 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-BASE_DIR = Path(__file__).parent.parent
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """Tag every span logged while serving a request with its id (X-Request-ID, or a new one)."""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
-# Initialize components
-logging.info("Initializing DocumentRetriever, SyntaxQueryParser, and CodeMerger...")
-retriever = DocumentRetriever(
-    docs_path="data/faiss_index/documentation_chunks.json",
-    summary_index_path="C:\\code_gen_backend\\backend2\\data\\faiss_index\\summary_index.index",
-    usecase_index_path="C:\\code_gen_backend\\backend2\\data\\faiss_index\\usecase_index.index"
-)
-parser = SyntaxQueryParser()
-merger = CodeMerger()
-logging.info("Components initialized successfully.")
+@app.exception_handler(LLMError)
+async def llm_error_handler(request: Request, exc: LLMError):
+    """Model failures that reach an endpoint: 504 for a missed deadline, 503 (with Retry-After when known) otherwise."""
+    logging.error(f"LLM call failed while serving {request.url.path}: {exc}")
+    headers = {}
+    if isinstance(exc, LLMUnavailableError) and exc.retry_after is not None:
+        headers["Retry-After"] = str(max(1, round(exc.retry_after)))
+    status_code = 504 if isinstance(exc, LLMTimeoutError) else 503
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)}, headers=headers)
+
+async def parse_and_retrieve(prompt: str) -> tuple:
+    """
+    Parse the prompt into syntax elements and fetch the matching document ids and snippets.
+
+    Documents are returned best first with a relevance score (see
+    `rank_by_relevance`).
+    """
+    await services.ensure_ready()
+    # Parse query into syntax components
+    syntax_elements = await services.parser.aparse(prompt)
+    logging.info(f"Parsed syntax elements: {syntax_elements}")
+
+    # Retrieve relevant docs for all elements in one batched encode/search
+    with span("retrieve", elements=len(syntax_elements)):
+        batch_indices = await services.retriever.aretrieve_batch(syntax_elements, k=config.RETRIEVAL_TOP_K)
+    for element, retrieved_indices in zip(syntax_elements, batch_indices):
+        logging.info(f"Retrieved {len(retrieved_indices)} snippets for element: {element}")
+
+    doc_indices, scores = rank_by_relevance(batch_indices)
+    snippets = services.retriever.fetch_docs(doc_indices)
+    return syntax_elements, doc_indices, snippets, scores
 
 @app.post("/generate", response_model=CodeResponse)
 async def generate_code(request: CodeRequest):
-    try:
-        logging.info(f"Received request: {request.prompt}")
-        
-        # Parse query into syntax components
-        syntax_elements = parser.parse(request.prompt)
-        logging.info(f"Parsed syntax elements: {syntax_elements}")
+    timings = collect_timings()
+    with span("request", endpoint="/generate") as request_span:
+        try:
+            logging.info(f"Received request: {request.prompt}")
         
-        doc_indices = set()
+            syntax_elements, doc_indices, snippets, scores = await parse_and_retrieve(request.prompt)
+            references = list({s['source'] for s in snippets})
+            explanation_mode = request.explanation_mode or config.EXPLANATION_MODE
+            loop = asyncio.get_running_loop()
+            merger, explanations, response_cache = services.merger, services.explanations, services.response_cache
 
-        # Retrieve relevant docs
-        for element in syntax_elements:
-            retrieved_indices = retriever.retrieve(element, k=2)
-            doc_indices.update(retrieved_indices)
-            logging.info(f"Retrieved {len(retrieved_indices)} snippets for element: {element}")
-        
-        snippets = retriever.fetch_docs(list(doc_indices))
+            # Identical prompt + documents + model settings produce a reusable result
+            cache_key, cached = None, None
+            if response_cache is not None:
+                cache_key = ResponseCache.make_key(request.prompt, doc_indices, merger.llama.model_name, merger.llama.options)
+                cached = await loop.run_in_executor(None, response_cache.get, cache_key)
+            request_span.set(explanation_mode=explanation_mode, response_cache_hit=cached is not None)
+
+            def cache_response(code: str, explanation):
+                # Unordered writes; put() does not let a later (code, None) erase the explanation
+                if response_cache is not None:
+                    loop.run_in_executor(None, response_cache.put, cache_key, code, explanation, references)
 
-        # Generate final code
-        code, explanation = merger.merge_code(snippets, request.prompt)
-        logging.info(f"Generated code of length {len(code)} characters.")
+            def on_explained(explanation: str):
+                cache_response(code, explanation)
+                if services.history is not None:
+                    services.history.update_explanation(generation_id, explanation)
+
+            # Generate final code; prompt_tokens reports the prompt size (empty on a cache hit)
+            prompt_tokens = {}
+            if cached is not None:
+                code = cached["generated_code"]
+                logging.info("Serving generated code from the response cache.")
+            else:
+                code = await merger.agenerate_code(snippets, request.prompt, scores=scores, usage=prompt_tokens)
+                logging.info(f"Generated code of length {len(code)} characters.")
+                if explanation_mode != "inline":
+                    cache_response(code, None)
+
+            # Explanation is either generated now or deferred to /generate/{id}/explanation
+            cached_explanation = cached["explanation"] if cached is not None else None
+            generation_id = explanations.register(
+                code,
+                background=explanation_mode == "background",
+                explanation=cached_explanation,
+                on_explained=on_explained,
+            )
+            explanation = ""
+            explanation_pending = explanations.is_pending(generation_id)
+            if explanation_mode == "inline" or not explanation_pending:
+                explanation = await explanations.get(generation_id)
+                explanation_pending = False
         
-        # Properly format response for canvas-like display
-        formatted_response = CodeResponse(
-            generated_code=code,  # Raw code string (not inside markdown)
-            explanation=explanation,
-            references=list({s['source'] for s in snippets})
-        )
-        with open("./output_code.md", "w", encoding="utf-8") as f:
-            f.write(code)
-        with open("./output_explanation.md", "w", encoding="utf-8") as f:
-            f.write(explanation)
-        logging.info("Code generation successful.")
-        return formatted_response
-    
-    except Exception as e:
-        logging.error(f"🔥 Error in generate_code: {str(e)}", exc_info=True)
-        return CodeResponse(
-            generated_code="",  # Ensure response model structure is maintained
-            explanation=f"An error occurred: {str(e)}",
-            references=[])
\ No newline at end of file
+            # Properly format response for canvas-like display
+            formatted_response = CodeResponse(
+                generated_code=code,  # Raw code string (not inside markdown)
+                explanation=explanation,
+                references=references,
+                generation_id=generation_id,
+                explanation_pending=explanation_pending,
+                prompt_tokens=prompt_tokens or None
+            )
+            # Persisted by a background writer; the response does not wait for the disk
+            if services.history is not None:
+                services.history.record(
+                    generation_id, "/generate", request.prompt, syntax_elements, doc_indices, references, code,
+                    explanation=None if explanation_pending else explanation,
+                    timings=timings, prompt_tokens=prompt_tokens,
+                )
+            logging.info("Code generation successful.")
+            return formatted_response
+
+        except LLMError:
+            # Answered by llm_error_handler with a 503/504
+            raise
+        except Exception as e:
+            logging.error(f"🔥 Error in generate_code: {str(e)}", exc_info=True)
+            request_span.set(exception=type(e).__name__)
+            return CodeResponse(
+                generated_code="",  # Ensure response model structure is maintained
+                explanation=f"An error occurred: {str(e)}",
+                references=[])
+
+@app.post("/generate/batch")
+async def generate_batch(file: UploadFile):
+    """
+    Generate code for every CodeRequest in an uploaded JSONL file.
+
+    Returns newline-delimited JSON in completion order, one line per input
+    request: its 0-based "index" in the file plus the /generate response
+    fields, or an "error". Duplicate requests are generated once and
+    retrieval for all prompts runs as one batch (see BatchGenerator).
+    """
+    try:
+        requests = read_requests((await file.read()).decode("utf-8").splitlines())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(requests) > config.BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"At most {config.BATCH_MAX_REQUESTS} requests per batch")
+    logging.info(f"Received batch of {len(requests)} requests")
+    await services.ensure_ready()
+
+    async def results():
+        with span("batch_request", requests=len(requests)):
+            async for result in services.batch_generator.run(requests):
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the server-side caches."""
+    return {
+        "parse_cache": services.parse_cache.stats() if services.parse_cache is not None else None,
+        "response_cache": services.response_cache.stats() if services.response_cache is not None else None,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms and LLM token counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once indexes and models are loaded, 503 while they are not.
+
+    In lazy startup mode the first probe starts loading, like a first
+    request would, so a service held back by readiness gating still becomes
+    ready. A failed load is reported, not retried, by later probes.
+    """
+    if config.STARTUP_MODE == "lazy" and services.status() == "not_started":
+        services.start_warm_up()
+    status = services.status()
+    if status != "ready":
+        return JSONResponse(status_code=503, content={"status": status, "error": services.error})
+    return {"status": status}
+
+@app.get("/history/{generation_id}", response_model=HistoryRecord)
+async def get_history(generation_id: str):
+    """Return the stored prompt, documents, code, explanation and stage timings of a past generation."""
+    record = await services.history.get(generation_id) if services.history is not None else None
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown generation id: {generation_id}")
+    return HistoryRecord(**record)
+
+@app.get("/generate/{generation_id}/explanation", response_model=ExplanationResponse)
+async def get_explanation(generation_id: str, wait: bool = True):
+    """
+    Return the explanation for a previous /generate call.
+
+    With wait=true (the default) the explanation is generated on demand if it
+    is not ready yet. With wait=false the call returns immediately and
+    explanation_pending tells the client to poll again.
+    """
+    explanations = services.explanations
+    if explanations is None or generation_id not in explanations:
+        raise HTTPException(status_code=404, detail=f"Unknown generation id: {generation_id}")
+
+    if not wait and explanations.is_pending(generation_id):
+        return ExplanationResponse(generation_id=generation_id, explanation="", explanation_pending=True)
+
+    explanation = await explanations.get(generation_id)
+    return ExplanationResponse(generation_id=generation_id, explanation=explanation)
+
+@app.post("/generate/stream")
+async def generate_code_stream(request: CodeRequest):
+    """
+    Streaming variant of /generate that returns newline-delimited JSON events.
+
+    Events are sent in order as they become available: "syntax_elements",
+    "references", one "code" event per code token, one "explanation" event
+    per explanation token and finally "done", carrying the generation id
+    (see /history/{generation_id}) and the prompt token report. Failures
+    are reported as an "error" event instead of an HTTP error, since
+    headers are already sent.
+    """
+    logging.info(f"Received streaming request: {request.prompt}")
+
+    def event(name: str, data=None) -> str:
+        return json.dumps({"event": name, "data": data}) + "\n"
+
+    async def event_stream():
+        timings = collect_timings()
+        with span("stream_request"):
+            async for line in stream_events(timings):
+                yield line
+
+    async def stream_events(timings: dict):
+        try:
+            syntax_elements, doc_indices, snippets, scores = await parse_and_retrieve(request.prompt)
+            references = list({s['source'] for s in snippets})
+            yield event("syntax_elements", syntax_elements)
+            yield event("references", references)
+
+            prompt_tokens = {}
+            generated = {"code": [], "explanation": []}
+            async for kind, token in services.merger.astream_merge_code(snippets, request.prompt, scores, prompt_tokens):
+                generated[kind].append(token)
+                yield event(kind, token)
+
+            generation_id = uuid.uuid4().hex
+            if services.history is not None:
+                services.history.record(
+                    generation_id, "/generate/stream", request.prompt, syntax_elements, doc_indices, references,
+                    "".join(generated["code"]), explanation="".join(generated["explanation"]),
+                    timings=timings, prompt_tokens=prompt_tokens,
+                )
+            yield event("done", {"generation_id": generation_id, "prompt_tokens": prompt_tokens})
+            logging.info("Streaming code generation successful.")
+        except Exception as e:
+            logging.error(f"🔥 Error in generate_code_stream: {str(e)}", exc_info=True)
+            yield event("error", f"An error occurred: {str(e)}")
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
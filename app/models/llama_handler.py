@@ -1,59 +1,377 @@
-import ollama
+import asyncio
+import itertools
+import json
+import httpx
 import requests
 import logging
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Optional
+from app import config
+from app.models.resilience import (
+    RETRYABLE_STATUS, CircuitBreaker, LLMError, LLMTimeoutError, LLMUnavailableError, backoff_delay,
+)
+from app.utils.metrics import LLM_CIRCUIT_OPEN, LLM_IN_FLIGHT, LLM_REQUESTS, LLM_RETRIES, record_llm_tokens
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
 
 class OllamaHandler:
-    def __init__(self, model_name="llama3.2:latest"):
+    """
+    Client for the Ollama generate and chat APIs, shared by all services.
+
+    Every call has a deadline covering queueing and retries. Connection
+    errors and 5xx/429 responses are retried with jittered exponential
+    backoff. Calls fail fast with LLMUnavailableError when `max_in_flight`
+    calls are already running or queued, or while the circuit breaker is
+    open after repeated failures. Identical concurrent async prompts share
+    one model call (`coalesce`). Failures raise LLMError subclasses instead
+    of returning empty text.
+    """
+
+    def __init__(
+        self,
+        model_name: str = config.OLLAMA_MODEL,
+        host: str = config.OLLAMA_HOST,
+        connect_timeout: float = config.OLLAMA_CONNECT_TIMEOUT,
+        read_timeout: float = config.OLLAMA_READ_TIMEOUT,
+        max_connections: int = config.OLLAMA_MAX_CONNECTIONS,
+        max_keepalive: int = config.OLLAMA_MAX_KEEPALIVE,
+        max_concurrency: int = config.OLLAMA_MAX_CONCURRENCY,
+        deadline: float = config.OLLAMA_DEADLINE,
+        max_retries: int = config.OLLAMA_MAX_RETRIES,
+        retry_backoff: float = config.OLLAMA_RETRY_BACKOFF,
+        retry_backoff_max: float = config.OLLAMA_RETRY_BACKOFF_MAX,
+        max_in_flight: int = config.OLLAMA_MAX_IN_FLIGHT,
+        breaker_failures: int = config.OLLAMA_BREAKER_FAILURES,
+        breaker_reset: float = config.OLLAMA_BREAKER_RESET,
+        coalesce: bool = config.OLLAMA_COALESCE,
+    ):
         logging.info(f"Initializing OllamaHandler with model: {model_name}")
         self.model_name = model_name
-        self.base_url = "http://localhost:11434/api/generate"
+        self.host = host.rstrip("/")
+        self.base_url = f"{self.host}/api/generate"
+        self.chat_url = f"{self.host}/api/chat"
+        # Sampling options sent with every generate call
+        self.options = {"temperature": 0.2, "top_p": 0.9}
+
+        # Blocking calls reuse one pooled session
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+
+        # Async client is created on first use so it binds to the running event loop
+        self.async_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.async_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.max_in_flight = max_in_flight
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.coalesce = coalesce
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Request key -> {"task", "waiters"} of async calls that identical prompts can join
+        self._shared_calls: Dict[str, dict] = {}
         logging.info("OllamaHandler initialized successfully.")
-        
-    def generate(self, prompt: str, max_tokens=1024) -> str:
-        logging.info(f"Generating response with model: {self.model_name}, max_tokens: {max_tokens}")
-        payload = {
+
+    def _generate_payload(self, prompt: str, max_tokens: int, stream: bool = False) -> dict:
+        return {
             "model": self.model_name,
             "prompt": prompt,
+            "stream": stream,
+            "options": {**self.options, "max_tokens": max_tokens}
+        }
+
+    def _chat_payload(self, system_prompt: str, user_prompt: str, model: Optional[str]) -> dict:
+        return {
+            "model": model or self.model_name,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
             "stream": False,
-            "options": {
-                "temperature": 0.2,
-                "max_tokens": max_tokens,
-                "top_p": 0.9
-            }
         }
-        
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(timeout=self.async_timeout, limits=self.async_limits)
+        return self._async_client
+
+    def _admit(self, endpoint: str) -> bool:
+        """Reserve an in-flight slot or raise LLMUnavailableError. Returns whether this is the breaker's trial call."""
+        with self._in_flight_lock:
+            try:
+                if self._in_flight >= self.max_in_flight:
+                    raise LLMUnavailableError(f"{self._in_flight} LLM calls already in flight", retry_after=1.0)
+                is_trial = self.breaker.check()
+            except LLMUnavailableError:
+                LLM_REQUESTS.inc(1, endpoint, "rejected")
+                raise
+            self._in_flight += 1
+        LLM_IN_FLIGHT.inc(1)
+        return is_trial
+
+    def _release(self, is_trial: bool):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+        LLM_IN_FLIGHT.inc(-1)
+        if is_trial:
+            # No-op if the trial recorded an outcome; otherwise (e.g. cancelled) let another call try
+            self.breaker.release()
+
+    def _record_attempt(self, server_failed: bool):
+        """Feed one request's result to the circuit breaker; every failed attempt counts, not just failed calls."""
+        if server_failed:
+            self.breaker.record_failure()
+        else:
+            # The server answered, even if it refused this request
+            self.breaker.record_success()
+        LLM_CIRCUIT_OPEN.set(1 if self.breaker.state == CircuitBreaker.OPEN else 0)
+
+    def _finish(self, endpoint: str, outcome: str, server_failed: Optional[bool] = None):
+        """Count a call's final outcome; `server_failed`, when given, also records its last attempt."""
+        LLM_REQUESTS.inc(1, endpoint, outcome)
+        if server_failed is not None:
+            self._record_attempt(server_failed)
+
+    def _reject_if_open(self, endpoint: str):
+        """Fail a call whose circuit opened while it was queued or backing off, instead of sending it."""
+        if self.breaker.state == CircuitBreaker.OPEN:
+            LLM_REQUESTS.inc(1, endpoint, "rejected")
+            raise LLMUnavailableError("Circuit open: the model server is failing", retry_after=self.breaker.reset_timeout)
+
+    def _retry_delay(self, error: Exception, attempt: int, endpoint: str) -> Optional[float]:
+        """Backoff before retrying after `error`, or None (with the failure recorded) if the call should fail."""
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        retryable = status is None or status in RETRYABLE_STATUS
+        self._record_attempt(server_failed=retryable or status is None or status >= 500)
+        if not retryable or attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+            self._finish(endpoint, "error")
+            return None
+        LLM_RETRIES.inc(1, endpoint)
+        delay = backoff_delay(attempt, self.retry_backoff, self.retry_backoff_max)
+        reason = f"HTTP {status}" if status is not None else (str(error) or type(error).__name__)
+        logging.warning(f"LLM {endpoint} call failed ({reason}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+    def _decode(self, response, endpoint: str, reply_keys: tuple) -> dict:
+        """
+        Parse a 2xx response body and check that it holds the reply at `reply_keys`.
+
+        The server did answer, so a malformed body fails the call without a
+        retry and without counting against the circuit breaker.
+        """
+        try:
+            data = response.json()
+            reply = data
+            for key in reply_keys:
+                reply = reply[key]
+            if not isinstance(reply, str):
+                raise TypeError(f"expected a string, got {type(reply).__name__}")
+        except (ValueError, KeyError, TypeError) as e:
+            self._finish(endpoint, "error", server_failed=False)
+            raise LLMError(f"LLM {endpoint} call returned an unexpected body: {e!r}") from e
+        self._finish(endpoint, "success", server_failed=False)
+        return data
+
+    def _post(self, url: str, payload: dict, endpoint: str, reply_keys: tuple) -> dict:
+        """Blocking POST with the deadline, retries and circuit breaker."""
+        is_trial = self._admit(endpoint)
+        deadline = time.monotonic() + self.deadline
         try:
-            response = requests.post(self.base_url, json=payload)
-            response.raise_for_status()
-            logging.info(f"Response received successfully. Length: {len(response.text)} characters")
-            return response.json()["response"]
-        except requests.RequestException as e:
-            logging.error(f"Request failed: {e}")
-            return ""
+            for attempt in itertools.count():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._finish(endpoint, "timeout", server_failed=True)
+                    raise LLMTimeoutError(f"LLM {endpoint} call exceeded its {self.deadline}s deadline")
+                self._reject_if_open(endpoint)
+                try:
+                    response = self.session.post(url, json=payload, timeout=(self.timeout[0], min(self.timeout[1], remaining)))
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    delay = self._retry_delay(e, attempt, endpoint)
+                    if delay is None:
+                        raise LLMError(f"LLM {endpoint} call failed: {e}") from e
+                    time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                    continue
+                return self._decode(response, endpoint, reply_keys)
+        finally:
+            self._release(is_trial)
 
-    def generate_response(self, system_prompt: str, user_prompt: str, model: str = "llama3.2:latest") -> str:
+    async def _apost_with_retries(self, url: str, payload: dict, endpoint: str, reply_keys: tuple) -> dict:
+        for attempt in itertools.count():
+            try:
+                async with self._semaphore:
+                    self._reject_if_open(endpoint)
+                    response = await self._get_async_client().post(url, json=payload)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(e, attempt, endpoint)
+                if delay is None:
+                    raise LLMError(f"LLM {endpoint} call failed: {e}") from e
+                # Back off without holding a connection slot
+                await asyncio.sleep(delay)
+                continue
+            return self._decode(response, endpoint, reply_keys)
+
+    async def _apost(self, url: str, payload: dict, endpoint: str, reply_keys: tuple) -> dict:
+        """Async POST with the deadline, retries and circuit breaker."""
+        is_trial = self._admit(endpoint)
+        try:
+            return await asyncio.wait_for(self._apost_with_retries(url, payload, endpoint, reply_keys), self.deadline)
+        except asyncio.TimeoutError:
+            self._finish(endpoint, "timeout", server_failed=True)
+            raise LLMTimeoutError(f"LLM {endpoint} call exceeded its {self.deadline}s deadline") from None
+        finally:
+            self._release(is_trial)
+
+    async def _shared_call(self, key: str, endpoint: str, call: Callable[[], "asyncio.Future"]) -> dict:
+        """
+        Run `call`, or join an identical call already in flight.
+
+        The call is cancelled only when every caller waiting on it has been
+        cancelled, so one disconnecting client does not fail the others.
+        """
+        entry = self._shared_calls.get(key)
+        if entry is None:
+            entry = {"task": asyncio.ensure_future(call()), "waiters": 0}
+            self._shared_calls[key] = entry
+
+            def forget(task, entry=entry):
+                if self._shared_calls.get(key) is entry:
+                    del self._shared_calls[key]
+                if not task.cancelled():
+                    task.exception()  # Retrieved here in case every waiter left
+
+            entry["task"].add_done_callback(forget)
+        else:
+            LLM_REQUESTS.inc(1, endpoint, "coalesced")
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+
+    async def _arequest(self, url: str, payload: dict, endpoint: str, reply_keys: tuple) -> dict:
+        if not self.coalesce:
+            return await self._apost(url, payload, endpoint, reply_keys)
+        key = json.dumps([url, payload], sort_keys=True)
+        return await self._shared_call(key, endpoint, lambda: self._apost(url, payload, endpoint, reply_keys))
+
+    def generate(self, prompt: str, max_tokens=1024) -> str:
+        logging.info(f"Generating response with model: {self.model_name}, max_tokens: {max_tokens}")
+        data = self._post(self.base_url, self._generate_payload(prompt, max_tokens), "generate", ("response",))
+        logging.info(f"Response received successfully. Length: {len(data['response'])} characters")
+        record_llm_tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return data["response"]
+
+    async def agenerate(self, prompt: str, max_tokens=1024) -> str:
+        """Non-blocking version of `generate` using the pooled async client."""
+        logging.info(f"Generating async response with model: {self.model_name}, max_tokens: {max_tokens}")
+        data = await self._arequest(self.base_url, self._generate_payload(prompt, max_tokens), "generate", ("response",))
+        logging.info(f"Response received successfully. Length: {len(data['response'])} characters")
+        record_llm_tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return data["response"]
+
+    async def _aopen_stream(self, payload: dict) -> httpx.Response:
+        """Send a streaming request, retrying until the response headers arrive without an error status."""
+        client = self._get_async_client()
+        for attempt in itertools.count():
+            self._reject_if_open("generate_stream")
+            try:
+                response = await client.send(client.build_request("POST", self.base_url, json=payload), stream=True)
+                if response.is_error:
+                    await response.aclose()
+                    response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(e, attempt, "generate_stream")
+                if delay is None:
+                    raise LLMError(f"LLM generate_stream call failed: {e}") from e
+                await asyncio.sleep(delay)
+
+    async def astream_generate(self, prompt: str, max_tokens=1024) -> AsyncIterator[str]:
+        """
+        Yield response tokens from Ollama's streaming generate API as they arrive.
+
+        Retries and the deadline apply until the stream starts; once tokens
+        have been yielded, a failure raises LLMError instead of retrying.
+        """
+        logging.info(f"Streaming response with model: {self.model_name}, max_tokens: {max_tokens}")
+        payload = self._generate_payload(prompt, max_tokens, stream=True)
+
+        is_trial = self._admit("generate_stream")
+        try:
+            async with self._semaphore:
+                try:
+                    response = await asyncio.wait_for(self._aopen_stream(payload), self.deadline)
+                except asyncio.TimeoutError:
+                    self._finish("generate_stream", "timeout", server_failed=True)
+                    raise LLMTimeoutError(f"LLM generate_stream call exceeded its {self.deadline}s deadline") from None
+                try:
+                    # Ollama streams one JSON object per line until "done" is true
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        try:
+                            chunk = json.loads(line)
+                            token = chunk.get("response", "") if isinstance(chunk, dict) else None
+                            if not isinstance(token, str):
+                                raise ValueError(f"unexpected chunk {line[:200]!r}")
+                        except ValueError as e:
+                            # The server answered, so a malformed chunk does not count against the breaker
+                            self._finish("generate_stream", "error", server_failed=False)
+                            raise LLMError(f"LLM generate_stream call returned an unexpected chunk: {e}") from e
+                        if token:
+                            yield token
+                        if chunk.get("done"):
+                            # The final chunk carries the token counts for the whole generation
+                            record_llm_tokens(chunk.get("prompt_eval_count"), chunk.get("eval_count"))
+                            break
+                except httpx.HTTPError as e:
+                    self._finish("generate_stream", "error", server_failed=True)
+                    raise LLMError(f"LLM generate_stream call failed mid-stream: {e}") from e
+                finally:
+                    await response.aclose()
+            self._finish("generate_stream", "success", server_failed=False)
+        finally:
+            self._release(is_trial)
+
+    def generate_response(self, system_prompt: str, user_prompt: str, model: Optional[str] = None) -> str:
         """
         Generate a response using the specified Ollama model with system and user roles.
 
         Parameters:
         - system_prompt (str): Instructional message to set the system behavior.
         - user_prompt (str): User's message or query.
-        - model (str): The Ollama model to use (default is 'llama3.2:latest').
+        - model (str): The Ollama model to use (defaults to the handler's model).
 
         Returns:
         - str: The response from the model.
         """
-        print(f"system prompt: {system_prompt}")
-        print(f"user prompt: {user_prompt}")
-        response = ollama.chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-        return response["message"]["content"]
+        logging.debug("system prompt: %s", system_prompt)
+        logging.debug("user prompt: %s", user_prompt)
+        data = self._post(self.chat_url, self._chat_payload(system_prompt, user_prompt, model), "chat", ("message", "content"))
+        record_llm_tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return data["message"]["content"]
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, model: Optional[str] = None) -> str:
+        """Non-blocking version of `generate_response` using Ollama's chat API."""
+        logging.info(f"Generating async chat response with model: {model or self.model_name}")
+        data = await self._arequest(self.chat_url, self._chat_payload(system_prompt, user_prompt, model), "chat", ("message", "content"))
+        record_llm_tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return data["message"]["content"]
 
+    async def aclose(self):
+        """Close pooled connections held by the async client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.session.close()
@@ -0,0 +1,100 @@
+import time
+import random
+import logging
+import threading
+from typing import Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+# HTTP statuses worth retrying: the model server is overloaded, restarting or timed out
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """A model call failed, after any retries."""
+
+
+class LLMTimeoutError(LLMError):
+    """A model call did not finish within its deadline."""
+
+
+class LLMUnavailableError(LLMError):
+    """A model call was rejected without reaching the server (circuit open or too many calls in flight)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter for retry `attempt` (0 for the first retry)."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing server for a while instead of queueing more work on it.
+
+    After `failure_threshold` consecutive failed calls the circuit opens and
+    `check` rejects calls for `reset_timeout` seconds. Then a single trial
+    call is let through (half-open): its success closes the circuit, its
+    failure opens it again. Thread-safe, so blocking and async calls share
+    one breaker.
+
+    Parameters:
+        failure_threshold: Consecutive failures that open the circuit.
+        reset_timeout: Seconds the circuit stays open before a trial call.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def check(self) -> bool:
+        """Raise LLMUnavailableError if a call may not be made now. Returns True for the half-open trial call."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise LLMUnavailableError("Circuit open: the model server is failing", retry_after=remaining)
+            if self._trial_running:
+                raise LLMUnavailableError("Circuit half-open: waiting for the trial call", retry_after=1.0)
+            self._state = self.HALF_OPEN
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info("Circuit closed: the model server is responding again")
+            self._state, self.failures, self._trial_running = self.CLOSED, 0, False
+
+    def release(self):
+        """Forget a trial call that ended without an outcome, e.g. because it was cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logging.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self._state, self._opened_at = self.OPEN, time.monotonic()
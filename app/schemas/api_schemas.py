@@ -1,10 +1,34 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Literal, Optional
 
 class CodeRequest(BaseModel):
     prompt: str
+    # "inline" waits for the explanation, "background" computes it after the code is
+    # returned and "lazy" only computes it when requested. None uses the server default.
+    explanation_mode: Optional[Literal["inline", "background", "lazy"]] = None
 
 class CodeResponse(BaseModel):
     generated_code: str  # Changed from 'code' to match your implementation
     explanation: str
-    references: List[str]
\ No newline at end of file
+    references: List[str]
+    generation_id: Optional[str] = None
+    explanation_pending: bool = False  # True when the explanation must be fetched separately
+    prompt_tokens: Optional[Dict[str, int]] = None  # Estimated prompt size and snippets used, when code was generated
+
+class ExplanationResponse(BaseModel):
+    generation_id: str
+    explanation: str
+    explanation_pending: bool = False
+
+class HistoryRecord(BaseModel):
+    generation_id: str
+    created_at: float  # Unix time the generation finished
+    endpoint: str
+    prompt: str
+    syntax_elements: List[str]
+    doc_ids: List[int]
+    references: List[str]
+    generated_code: str
+    explanation: Optional[str] = None  # None while a deferred explanation has not been generated
+    timings: Dict[str, float]  # Milliseconds per pipeline stage
+    prompt_tokens: Dict[str, int]
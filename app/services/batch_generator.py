@@ -0,0 +1,144 @@
+import json
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from app.schemas.api_schemas import CodeRequest
+from app.services.query_parser import SyntaxQueryParser
+from app.services.document_retrieval import DocumentRetriever, rank_by_relevance
+from app.services.syntax_merger import CodeMerger
+from app.services.explanation_store import ExplanationStore
+from app.services.history_store import HistoryStore
+from app.utils.metrics import collect_timings, span
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+
+def read_requests(lines: Iterable[str]) -> List[CodeRequest]:
+    """Parse JSONL lines into CodeRequests, skipping blank lines. Raises ValueError naming the bad line."""
+    requests = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            requests.append(CodeRequest(**json.loads(line)))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid request on line {number}: {e}") from e
+    return requests
+
+
+class BatchGenerator:
+    """
+    Runs many /generate requests as one job.
+
+    Identical requests are generated once. All distinct prompts are parsed
+    first, then the syntax elements of every prompt are deduplicated and
+    retrieved in a single embedding and search batch. Code (and inline
+    explanations) is then generated for up to `max_concurrency` prompts at a
+    time, and results are yielded as they complete: one per input request,
+    tagged with its position in the input.
+
+    Parameters:
+        parser: Parser for the prompts' syntax elements.
+        retriever: Retriever for the documentation snippets.
+        merger: Generator of code and explanations.
+        explanations: Store for "background" and "lazy" explanations; without one they are skipped.
+        history: Store each generation is recorded in, if given.
+        max_concurrency: Prompts parsed or generated at once.
+        top_k: Documents retrieved per syntax element.
+        explanation_mode: Mode for requests that do not set one.
+    """
+
+    def __init__(self, parser: SyntaxQueryParser, retriever: DocumentRetriever, merger: CodeMerger,
+                 explanations: Optional[ExplanationStore] = None, history: Optional[HistoryStore] = None,
+                 max_concurrency: int = 4, top_k: int = 2, explanation_mode: str = "inline"):
+        self.parser = parser
+        self.retriever = retriever
+        self.merger = merger
+        self.explanations = explanations
+        self.history = history
+        self.max_concurrency = max_concurrency
+        self.top_k = top_k
+        self.explanation_mode = explanation_mode
+
+    async def run(self, requests: List[CodeRequest]) -> AsyncIterator[dict]:
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault((request.prompt, request.explanation_mode or self.explanation_mode), []).append(index)
+        prompts = list(dict.fromkeys(prompt for prompt, _ in groups))
+        logging.info(f"Batch of {len(requests)} requests: {len(groups)} distinct, {len(prompts)} distinct prompts")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def parse(prompt: str) -> list:
+            async with semaphore:
+                return await self.parser.aparse(prompt)
+
+        with span("batch_parse", prompts=len(prompts)):
+            parsed = await asyncio.gather(*(parse(prompt) for prompt in prompts), return_exceptions=True)
+        elements_by_prompt = dict(zip(prompts, parsed))
+
+        elements = list(dict.fromkeys(
+            element for result in parsed if not isinstance(result, BaseException) for element in result))
+        with span("batch_retrieve", elements=len(elements)):
+            retrieved = dict(zip(elements, await self.retriever.aretrieve_batch(elements, k=self.top_k)))
+
+        async def generate(key: Tuple[str, str]) -> Tuple[Tuple[str, str], dict]:
+            try:
+                return key, await self._generate(key[0], key[1], elements_by_prompt[key[0]], retrieved, semaphore)
+            except Exception as e:
+                logging.error(f"🔥 Error in batch generation for {key[0]!r}: {str(e)}")
+                return key, {"error": f"An error occurred: {str(e)}"}
+
+        tasks = [asyncio.ensure_future(generate(key)) for key in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result = await next_done
+                for index in groups[key]:
+                    yield {"index": index, **result}
+        finally:
+            # The consumer stopped early (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def _generate(self, prompt: str, mode: str, syntax_elements, retrieved: Dict[str, List[int]],
+                        semaphore: asyncio.Semaphore) -> dict:
+        if isinstance(syntax_elements, BaseException):
+            raise syntax_elements
+        timings = collect_timings()
+        doc_indices, scores = rank_by_relevance([retrieved[element] for element in syntax_elements])
+        snippets = self.retriever.fetch_docs(doc_indices)
+        references = list({s['source'] for s in snippets})
+
+        prompt_tokens = {}
+        async with semaphore:
+            code = await self.merger.agenerate_code(snippets, prompt, scores=scores, usage=prompt_tokens)
+            explanation = await self.merger.agenerate_explanation(code) if mode == "inline" else None
+
+        def on_explained(text: str):
+            if self.history is not None:
+                self.history.update_explanation(generation_id, text)
+
+        generation_id, explanation_pending = uuid.uuid4().hex, False
+        if self.explanations is not None:
+            generation_id = self.explanations.register(
+                code,
+                background=mode == "background",
+                explanation=explanation,
+                on_explained=on_explained,
+            )
+            explanation_pending = self.explanations.is_pending(generation_id)
+        if self.history is not None:
+            self.history.record(
+                generation_id, "/generate/batch", prompt, syntax_elements, doc_indices, references, code,
+                explanation=explanation, timings=timings, prompt_tokens=prompt_tokens,
+            )
+        # Same fields as a CodeResponse from /generate
+        return {
+            "generated_code": code,
+            "explanation": explanation or "",
+            "references": references,
+            "generation_id": generation_id,
+            "explanation_pending": explanation_pending,
+            "prompt_tokens": prompt_tokens or None,
+        }
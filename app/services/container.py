@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+from app import config
+from app.models.llama_handler import OllamaHandler
+from app.services.context_builder import ContextBuilder
+from app.services.query_parser import SyntaxQueryParser
+from app.services.fast_parser import FastSyntaxParser
+from app.services.parse_cache import ParseCache
+from app.services.document_retrieval import DocumentRetriever
+from app.services.syntax_merger import CodeMerger
+from app.services.explanation_store import ExplanationStore
+from app.services.response_cache import ResponseCache, fingerprint_files
+from app.services.history_store import HistoryStore
+from app.services.batch_generator import BatchGenerator
+from app.utils.faiss_utils import read_index_meta
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+
+class ServiceContainer:
+    """
+    Builds the services behind the API once, on first use instead of at import.
+
+    Creating the container is free; `warm_up` loads the FAISS indexes, the
+    embedding model and the caches, and wires a single OllamaHandler (one
+    connection pool) into both the parser and the merger. `ensure_ready` runs
+    the warm-up in a thread so the event loop keeps serving, and concurrent
+    callers wait on the same warm-up. A failed warm-up is retried by the next
+    caller.
+
+    Parameters:
+        base_dir: Repository root that the configured data paths are relative to.
+    """
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        self.llama: Optional[OllamaHandler] = None
+        self.retriever: Optional[DocumentRetriever] = None
+        self.parse_cache: Optional[ParseCache] = None
+        self.parser: Optional[SyntaxQueryParser] = None
+        self.merger: Optional[CodeMerger] = None
+        self.explanations: Optional[ExplanationStore] = None
+        self.response_cache: Optional[ResponseCache] = None
+        self.history: Optional[HistoryStore] = None
+        self.batch_generator: Optional[BatchGenerator] = None
+        self.error: Optional[str] = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self._warm_up_task: Optional[asyncio.Future] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def status(self) -> str:
+        if self._ready:
+            return "ready"
+        if self._warm_up_task is not None:
+            return "starting"
+        return "failed" if self.error else "not_started"
+
+    def warm_up(self):
+        """Build every service. Blocking; safe to call from several threads."""
+        with self._lock:
+            if self._ready:
+                return
+            logging.info("Initializing DocumentRetriever, SyntaxQueryParser, and CodeMerger...")
+            index_dir = self.base_dir / config.INDEX_DIR
+            # index_meta.json records whether preprocess_docs built split or fused indexes
+            index_meta = read_index_meta(str(index_dir))
+            self.retriever = DocumentRetriever(
+                docs_path=str(index_dir / (config.DOCS_FILE or index_meta.get("doc_store", "documentation_chunks.json"))),
+                summary_index_path=str(index_dir / index_meta.get("summary_index", "summary_index.index")),
+                usecase_index_path=str(index_dir / index_meta.get("usecase_index", "usecase_index.index")),
+                fused_index_path=str(index_dir / index_meta["fused_index"]) if index_meta["layout"] == "fused" else None,
+                model_name=config.EMBEDDING_MODEL,
+                nprobe=config.FAISS_NPROBE,
+                ef_search=config.FAISS_EF_SEARCH,
+                mmap=config.FAISS_MMAP,
+                batch_size=config.RETRIEVAL_BATCH_SIZE,
+                batch_wait_ms=config.RETRIEVAL_BATCH_WAIT_MS,
+                lexical_index_path=str(index_dir / index_meta["lexical_index"])
+                if config.HYBRID_SEARCH and "lexical_index" in index_meta else None,
+                score_threshold=config.RETRIEVAL_SCORE_THRESHOLD,
+                hybrid_candidates=config.HYBRID_CANDIDATES,
+                rrf_k=config.HYBRID_RRF_K,
+                lexical_threshold=config.HYBRID_LEXICAL_THRESHOLD,
+            )
+            if config.PARSE_CACHE_ENABLED:
+                self.parse_cache = ParseCache(
+                    path=str(self.base_dir / config.PARSE_CACHE_PATH),
+                    max_entries=config.PARSE_CACHE_SIZE,
+                    ttl_seconds=config.PARSE_CACHE_TTL,
+                    embed_fn=self.retriever.embed if config.PARSE_CACHE_SEMANTIC else None,
+                    similarity_threshold=config.PARSE_CACHE_SIMILARITY,
+                )
+            fast_parser = None
+            if config.FAST_PARSE_ENABLED and "syntax_elements" in index_meta:
+                fast_parser = FastSyntaxParser.load(
+                    str(index_dir / index_meta["syntax_elements"]),
+                    embed_batch=self.retriever.model.encode,
+                    threshold=config.FAST_PARSE_THRESHOLD,
+                    max_clauses=config.FAST_PARSE_MAX_CLAUSES,
+                )
+            self.llama = OllamaHandler()
+            self.parser = SyntaxQueryParser(cache=self.parse_cache, llama=self.llama, fast_parser=fast_parser)
+            self.merger = CodeMerger(
+                llama=self.llama,
+                context_builder=ContextBuilder(config.CONTEXT_TOKEN_BUDGET, config.CONTEXT_OVERLAP_THRESHOLD),
+                explanation_code_tokens=config.EXPLANATION_CODE_TOKEN_BUDGET,
+            )
+            self.explanations = ExplanationStore(self.merger, max_entries=config.EXPLANATION_STORE_SIZE)
+            if config.RESPONSE_CACHE_ENABLED:
+                self.response_cache = ResponseCache(
+                    db_path=str(self.base_dir / config.RESPONSE_CACHE_PATH),
+                    index_version=fingerprint_files(self.retriever.source_paths),
+                    max_entries=config.RESPONSE_CACHE_SIZE,
+                    ttl_seconds=config.RESPONSE_CACHE_TTL,
+                )
+            if config.HISTORY_ENABLED:
+                self.history = HistoryStore(str(self.base_dir / config.HISTORY_PATH), config.HISTORY_FLUSH_MS)
+            self.batch_generator = BatchGenerator(
+                self.parser, self.retriever, self.merger,
+                explanations=self.explanations,
+                history=self.history,
+                max_concurrency=config.BATCH_MAX_CONCURRENCY,
+                top_k=config.RETRIEVAL_TOP_K,
+                explanation_mode=config.EXPLANATION_MODE,
+            )
+            self.error = None
+            self._ready = True
+            logging.info("Components initialized successfully.")
+
+    def start_warm_up(self) -> asyncio.Future:
+        """Start warming up in a worker thread, or return the warm-up already running."""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(None, self.warm_up))
+            self._warm_up_task.add_done_callback(self._on_warm_up_done)
+        return self._warm_up_task
+
+    def _on_warm_up_done(self, task: asyncio.Future):
+        self._warm_up_task = None
+        if not task.cancelled() and task.exception() is not None:
+            self.error = str(task.exception())
+            logging.error(f"🔥 Service warm-up failed: {self.error}")
+
+    async def ensure_ready(self) -> "ServiceContainer":
+        if not self._ready:
+            # Shielded so a cancelled request does not abort the shared warm-up
+            await asyncio.shield(self.start_warm_up())
+        return self
+
+    async def aclose(self):
+        """Persist caches and history and release pooled connections and retrieval threads."""
+        if self.history is not None:
+            await self.history.aclose()
+        if self.parse_cache is not None:
+            self.parse_cache.save()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.llama is not None:
+            await self.llama.aclose()
+        if self.retriever is not None:
+            self.retriever.executor.shutdown(wait=False)
@@ -0,0 +1,131 @@
+import re
+import logging
+import textwrap
+from typing import List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+TRUNCATION_MARKER = "# ... (truncated)"
+CODE_FENCE = "```"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count: one per word and per punctuation character."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def clean_code(code: str) -> str:
+    """Dedent code and drop trailing whitespace and repeated blank lines."""
+    lines = [line.rstrip() for line in textwrap.dedent(code.expandtabs(4)).strip("\n").splitlines()]
+    cleaned = []
+    for line in lines:
+        if line or (cleaned and cleaned[-1]):
+            cleaned.append(line)
+    return "\n".join(cleaned).strip("\n")
+
+
+def clean_text(text: str) -> str:
+    """Collapse runs of whitespace in prose to single spaces."""
+    return " ".join(text.split())
+
+
+def truncate_lines(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Keep whole leading lines of `text` within `max_tokens`. Returns the text and whether it was cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    budget = max_tokens - estimate_tokens(TRUNCATION_MARKER)
+    kept = []
+    for line in text.splitlines():
+        cost = estimate_tokens(line)
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    return "\n".join(kept + [TRUNCATION_MARKER]), True
+
+
+class ContextBuilder:
+    """
+    Turns retrieved documentation chunks into a compact prompt context.
+
+    Snippets are ordered by retrieval score, near-duplicates (e.g. chunks
+    that overlap after ingestion) are dropped, whitespace is normalised and
+    the result is cut to `max_tokens`. A snippet that does not fit is
+    truncated at a line boundary when at least `min_snippet_tokens` remain,
+    otherwise it and all lower-ranked snippets are left out.
+
+    Parameters:
+        max_tokens: Token budget for the documentation context.
+        overlap_threshold: Share of a snippet's tokens that, when already present in a kept snippet, marks it as duplicate.
+        min_snippet_tokens: Smallest remaining budget worth filling with a truncated snippet.
+    """
+
+    def __init__(self, max_tokens: int = 1500, overlap_threshold: float = 0.8, min_snippet_tokens: int = 48):
+        self.max_tokens = max_tokens
+        self.overlap_threshold = overlap_threshold
+        self.min_snippet_tokens = min_snippet_tokens
+
+    def format_snippet(self, snippet: dict) -> str:
+        parts = [f"### {clean_text(snippet.get('chunk_title') or '')}".rstrip()]
+        summary = clean_text(snippet.get("summary") or "")
+        if summary:
+            parts.append(summary)
+        code = clean_code(snippet.get("code_snippet") or "")
+        if code:
+            parts.append(f"{CODE_FENCE}python\n{code}\n{CODE_FENCE}")
+        return "\n".join(parts)
+
+    def _is_duplicate(self, tokens: set, kept: List[set]) -> bool:
+        if not tokens:
+            return True
+        return any(len(tokens & other) >= self.overlap_threshold * len(tokens) for other in kept)
+
+    def build(self, snippets: List[dict], scores: Optional[List[float]] = None) -> Tuple[str, dict]:
+        """
+        Build the context for `snippets`, best first by `scores` (default: the given order).
+
+        Returns the context and a report with the number of snippets given,
+        dropped as duplicates and used, and the context's token estimate.
+        """
+        order = list(range(len(snippets)))
+        if scores is not None:
+            order.sort(key=lambda i: scores[i], reverse=True)
+
+        sections, kept_tokens = [], []
+        duplicates, truncated = 0, False
+        remaining = self.max_tokens
+        for i in order:
+            section = self.format_snippet(snippets[i])
+            tokens = set(TOKEN_PATTERN.findall(section.lower()))
+            if self._is_duplicate(tokens, kept_tokens):
+                duplicates += 1
+                continue
+            cost = estimate_tokens(section)
+            if cost > remaining:
+                if remaining < self.min_snippet_tokens:
+                    break
+                # Leave room to close a code fence the cut falls inside
+                section, truncated = truncate_lines(section, remaining - estimate_tokens(CODE_FENCE))
+                if section.count(CODE_FENCE) % 2:
+                    section += f"\n{CODE_FENCE}"
+                if len(section.splitlines()) < 3:
+                    # Only the title and the marker survived
+                    break
+                cost = estimate_tokens(section)
+            sections.append(section)
+            kept_tokens.append(tokens)
+            remaining -= cost
+            if truncated:
+                break
+
+        context = "\n\n".join(sections)
+        report = {
+            "snippets_retrieved": len(snippets),
+            "snippets_duplicate": duplicates,
+            "snippets_used": len(sections),
+            "context_tokens": estimate_tokens(context),
+        }
+        logging.info(f"Built prompt context: {report}")
+        return context, report
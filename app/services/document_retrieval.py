@@ -1,27 +1,104 @@
 import json
-import faiss
+import asyncio
+import contextvars
 import logging
-from typing import List, Dict,Any
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
-from rich import print
+from app import config
+from app.services.retrieval_batcher import RetrievalBatcher
+from app.utils.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.utils.doc_store import DOC_STORE_SUFFIX, DocStore
+from app.utils.metrics import span
+from app.utils.faiss_utils import configure_search, fused_chunk_index, read_index
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
 
+def rank_by_relevance(rankings: List[List[int]]) -> Tuple[List[int], List[float]]:
+    """
+    Merge per-element retrieval results into one document list, best first.
+
+    A document's relevance is the sum of 1 / rank over every element that
+    retrieved it. Returns the document ids and their relevance scores.
+    """
+    relevance: Dict[int, float] = {}
+    for retrieved_indices in rankings:
+        for rank, doc_index in enumerate(retrieved_indices, start=1):
+            relevance[doc_index] = relevance.get(doc_index, 0.0) + 1.0 / rank
+    doc_indices = sorted(relevance, key=relevance.get, reverse=True)
+    return doc_indices, [relevance[i] for i in doc_indices]
+
+
 class DocumentRetriever:
-    def __init__(self, summary_index_path: str, usecase_index_path: str, docs_path: str, model_name: str = "all-MiniLM-L6-v2"):
-        logging.info(f"Initializing DocumentRetriever with summary index: {summary_index_path} and docs: {docs_path}")
-        logging.info(f"Initializing DocumentRetriever with usecase index: {usecase_index_path} and docs: {docs_path}")
-        self.summary_index = faiss.read_index(summary_index_path)
-        self.usecase_index = faiss.read_index(usecase_index_path)
+    def __init__(self, summary_index_path: Optional[str], usecase_index_path: Optional[str], docs_path: str,
+                 model_name: str = "all-MiniLM-L6-v2", fused_index_path: Optional[str] = None,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None, mmap: bool = False,
+                 batch_size: int = 1, batch_wait_ms: float = 0.0, lexical_index_path: Optional[str] = None,
+                 score_threshold: float = 0.6, hybrid_candidates: int = 10, rrf_k: int = 60,
+                 lexical_threshold: float = 0.5):
+        """
+        Load the FAISS indexes, documentation chunks and embedding model.
+
+        Either the separate summary/use-case indexes or a single fused index
+        (built with `preprocess_docs.py --fused`) can be used. `docs_path` may
+        be the JSON array or a memory-mapped `.store` file (see DocStore). Any index type
+        written by preprocess_docs loads here; `nprobe` and `ef_search` tune
+        IVF and HNSW indexes at query time, and `mmap` maps index files
+        read-only so worker processes share their pages. With `batch_size` > 1
+        `aretrieve_batch` calls from concurrent requests are micro-batched
+        (see RetrievalBatcher).
+
+        Dense matches must score above `score_threshold`. When a BM25
+        `lexical_index_path` is given, the top `hybrid_candidates` dense and
+        lexical matches are combined with reciprocal-rank fusion (constant
+        `rrf_k`), so exact API names are found even when embeddings miss them.
+        Lexical matches must reach `lexical_threshold` (see BM25Index.search),
+        so a chunk sharing one common word with the query is not fused in.
+        """
+        # source_paths lists the files retrieval results depend on, used to version downstream caches
+        self.summary_index = self.usecase_index = self.fused_index = None
+        if fused_index_path:
+            logging.info(f"Initializing DocumentRetriever with fused index: {fused_index_path} and docs: {docs_path}")
+            self.source_paths = [fused_index_path, docs_path]
+            self.fused_index = configure_search(read_index(fused_index_path, mmap), nprobe, ef_search)
+        else:
+            logging.info(f"Initializing DocumentRetriever with summary index: {summary_index_path} and docs: {docs_path}")
+            logging.info(f"Initializing DocumentRetriever with usecase index: {usecase_index_path} and docs: {docs_path}")
+            self.source_paths = [summary_index_path, usecase_index_path, docs_path]
+            self.summary_index = configure_search(read_index(summary_index_path, mmap), nprobe, ef_search)
+            self.usecase_index = configure_search(read_index(usecase_index_path, mmap), nprobe, ef_search)
+        self.lexical_index = None
+        if lexical_index_path:
+            self.source_paths.append(lexical_index_path)
+            self.lexical_index = BM25Index.load(lexical_index_path)
+        self.score_threshold = score_threshold
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self.lexical_threshold = lexical_threshold
         self.model = SentenceTransformer(model_name)
         logging.info(f"Loaded FAISS index and SentenceTransformer model: {model_name}")
         
-        with open(docs_path, "r") as f:
-            self.docs = json.load(f)
-            logging.info(f"Loaded {len(self.docs)} documentation snippets from {docs_path}")
+        if docs_path.endswith(DOC_STORE_SUFFIX):
+            # Memory-mapped store: records are only read when fetched
+            self.docs = DocStore(docs_path)
+        else:
+            with open(docs_path, "r") as f:
+                self.docs = json.load(f)
+        logging.info(f"Loaded {len(self.docs)} documentation snippets from {docs_path}")
+
+        # Encoding and FAISS search are CPU-bound; run them off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = RetrievalBatcher(self.retrieve_batch, self.executor, batch_size, batch_wait_ms)
     
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single piece of text with the retrieval model."""
+        return self.model.encode([text]).astype('float32')[0]
+
     def retrieve_from_index(self, task: str, index: Any, k: int = 2) -> List[Dict]:
         """Retrieve the closest match from each FAISS index, ensuring score > 0.53."""
         logging.info(f"Retrieving {k} most relevant snippets for task: {task}")
@@ -30,13 +107,12 @@ class DocumentRetriever:
         logging.info("Generated embedding for task query.")
 
         scores, indices = index.search(embedding, k )  # Retrieve extra for filtering
-        logging.info(f"Retrieved {len(indices[0])} snippets before filtering with scores: {scores[0].tolist()}")
-
-        print(f"scores: {scores}")
-        print(f"indices: {indices}")
+        logging.info(f"Retrieved {len(indices[0])} snippets before filtering.")
+        logging.debug("scores: %s", scores)
+        logging.debug("indices: %s", indices)
 
-        # Filter out results where the similarity score is <= 0.53
-        valid_results = [(i, scores[0][j]) for j, i in enumerate(indices[0]) if scores[0][j] > 0.6]
+        # Filter out results where the similarity score is <= score_threshold
+        valid_results = [(i, scores[0][j]) for j, i in enumerate(indices[0]) if scores[0][j] > self.score_threshold]
 
         # Ensure we have at least 2 valid results
         # if len(valid_results) < 2:
@@ -45,8 +121,6 @@ class DocumentRetriever:
 
         # Sort results by similarity score (highest first)
         valid_results.sort(key=lambda x: x[1], reverse=True)
-        
-        retrieved_docs = [self.docs[index[0]] for index in valid_results]
 
         # Select the two closest matches
         # best_match_index_1 = valid_results[0][0]
@@ -56,15 +130,27 @@ class DocumentRetriever:
         # print(f"best match index 2: {best_match_index_2}")
 
         # retrieved_docs = [self.docs[best_match_index_1], self.docs[best_match_index_2]]
-        print(f"retrieve docs: {retrieved_docs}")
-        logging.info(f"Returning {len(retrieved_docs)} relevant documentation snippets.")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            # Reading the documents is only worth it when they are logged
+            logging.debug("retrieve docs: %s", [self.docs[index[0]] for index in valid_results])
+        logging.info(f"Returning {len(valid_results)} relevant documentation snippets.")
 
         return valid_results
     
-    def retrieve(self, task: str, k: int = 2) -> List[Dict]:
-        summary_valid_results = self.retrieve_from_index(task, self.summary_index, k)
-        usecase_valid_results = self.retrieve_from_index(task, self.usecase_index, k)
-        
+    def search_index_batch(self, embeddings: np.ndarray, index: Any, k: int = 2) -> List[List[Tuple[int, float]]]:
+        """Search one FAISS index with a matrix of query embeddings, one result list per row."""
+        scores, indices = index.search(embeddings, k)
+        logging.info(f"Searched {len(embeddings)} queries against index in a single call.")
+
+        batch_results = []
+        for row_scores, row_indices in zip(scores, indices):
+            # Same filtering as retrieve_from_index: keep matches above the threshold, best first
+            valid_results = [(i, row_scores[j]) for j, i in enumerate(row_indices) if row_scores[j] > self.score_threshold]
+            valid_results.sort(key=lambda x: x[1], reverse=True)
+            batch_results.append(valid_results)
+        return batch_results
+
+    def _merge_results(self, summary_valid_results: List, usecase_valid_results: List, k: int) -> List[int]:
         # Combine results from both indices
         combined_results = summary_valid_results + usecase_valid_results
         
@@ -75,17 +161,88 @@ class DocumentRetriever:
         top_results = combined_results[:k]
         
         # Extract document indices
-        doc_indices = [result[0] for result in top_results]
+        return [result[0] for result in top_results]
+
+    def retrieve(self, task: str, k: int = 2) -> List[int]:
+        if self.fused_index is not None or self.lexical_index is not None:
+            return self.retrieve_batch([task], k)[0]
+        summary_valid_results = self.retrieve_from_index(task, self.summary_index, k)
+        usecase_valid_results = self.retrieve_from_index(task, self.usecase_index, k)
+        
+        doc_indices = self._merge_results(summary_valid_results, usecase_valid_results, k)
         
         # # Fetch the corresponding documents
         # retrieved_docs = [self.docs[i] for i in doc_indices if i < len(self.docs)]
         
         # logging.info(f"Returning {len(retrieved_docs)} relevant documentation snippets.")
         return doc_indices
+
+    def retrieve_batch(self, tasks: List[str], k: int = 2) -> List[List[int]]:
+        """
+        Retrieve document indices for several tasks at once.
+
+        All tasks are encoded in a single forward pass and each FAISS index is
+        searched once with the whole embedding matrix. The per-task results are
+        identical to calling `retrieve` for every task. With a lexical index
+        the dense and BM25 candidates of each task are fused by rank.
+
+        Parameters:
+        - tasks (List[str]): Syntax elements to look up.
+        - k (int): Number of results to keep per task.
+
+        Returns:
+        - List[List[int]]: Document indices for each task, in input order.
+        """
+        if not tasks:
+            return []
+
+        logging.info(f"Retrieving {k} most relevant snippets for {len(tasks)} tasks in one batch.")
+        with span("embed", queries=len(tasks)):
+            embeddings = self.model.encode(tasks).astype('float32')
+        logging.info(f"Generated {len(tasks)} embeddings in a single encode call.")
+
+        # Fusion needs a deeper candidate list than the final k
+        candidates = max(k, self.hybrid_candidates) if self.lexical_index is not None else k
+
+        with span("faiss_search", queries=len(tasks), k=candidates):
+            if self.fused_index is not None:
+                # Fused ids encode the chunk position; the top k over both vector kinds
+                # equals the top k of the merged per-index results
+                fused_batch = self.search_index_batch(embeddings, self.fused_index, candidates)
+                dense = [
+                    self._merge_results([(fused_chunk_index(i), score) for i, score in results], [], candidates)
+                    for results in fused_batch
+                ]
+            else:
+                summary_batch = self.search_index_batch(embeddings, self.summary_index, candidates)
+                usecase_batch = self.search_index_batch(embeddings, self.usecase_index, candidates)
+                dense = [
+                    self._merge_results(summary_valid_results, usecase_valid_results, candidates)
+                    for summary_valid_results, usecase_valid_results in zip(summary_batch, usecase_batch)
+                ]
+
+        if self.lexical_index is None:
+            return dense
+        with span("lexical_search", queries=len(tasks), k=candidates):
+            lexical = [[i for i, _ in self.lexical_index.search(task, candidates, self.lexical_threshold)] for task in tasks]
+            return [
+                reciprocal_rank_fusion([dense_ids, lexical_ids], k, self.rrf_k)
+                for dense_ids, lexical_ids in zip(dense, lexical)
+            ]
     
+    async def aretrieve_batch(self, tasks: List[str], k: int = 2) -> List[List[int]]:
+        """Run `retrieve_batch` in the retrieval thread pool without blocking the event loop."""
+        if self.batcher is not None:
+            return await self.batcher.submit(tasks, k)
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so spans keep the request id
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, self.retrieve_batch, tasks, k)
+
     def fetch_docs(self, indices):
-        retrieved_docs = [self.docs[i] for i in indices if i < len(self.docs)]
-        
+        with span("fetch_docs", documents=len(indices)):
+            retrieved_docs = [self.docs[i] for i in indices if i < len(self.docs)]
+
         logging.info(f"Returning {len(retrieved_docs)} relevant documentation snippets.")
         return retrieved_docs
 
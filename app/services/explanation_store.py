@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+from app.services.syntax_merger import CodeMerger
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+class ExplanationStore:
+    """
+    Keeps generated code by generation id so its explanation can be produced
+    after the code response has been sent.
+
+    Explanations are either started in the background as soon as the code is
+    registered, or computed lazily on the first request for them. The store is
+    bounded; the oldest generations are evicted first.
+    """
+
+    def __init__(self, merger: CodeMerger, max_entries: int = 1000):
+        logging.info(f"Initializing ExplanationStore with capacity: {max_entries}")
+        self.merger = merger
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def register(self, code: str, background: bool = False, explanation: Optional[str] = None,
+                 on_explained: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Store generated code and return its generation id.
+
+        A known `explanation` (e.g. from a cache) is stored as-is. Otherwise
+        `on_explained` is called with the explanation once it is generated.
+        """
+        generation_id = uuid.uuid4().hex
+        entry = {"code": code, "explanation": explanation, "task": None, "on_explained": on_explained}
+        self._entries[generation_id] = entry
+        if background and explanation is None:
+            entry["task"] = asyncio.create_task(self._explain(generation_id, entry))
+        self._evict()
+        logging.info(f"Registered generation {generation_id} (background={background}).")
+        return generation_id
+
+    def __contains__(self, generation_id: str) -> bool:
+        return generation_id in self._entries
+
+    def is_pending(self, generation_id: str) -> bool:
+        return self._entries[generation_id]["explanation"] is None
+
+    async def get(self, generation_id: str) -> str:
+        """Return the explanation, waiting for or starting its generation if needed."""
+        entry = self._entries[generation_id]
+        self._entries.move_to_end(generation_id)
+        if entry["explanation"] is not None:
+            return entry["explanation"]
+        if entry["task"] is None:
+            entry["task"] = asyncio.create_task(self._explain(generation_id, entry))
+        # Shield so a disconnecting client does not cancel work other callers may share
+        return await asyncio.shield(entry["task"])
+
+    async def _explain(self, generation_id: str, entry: dict) -> str:
+        logging.info(f"Generating explanation for generation {generation_id}")
+        try:
+            entry["explanation"] = await self.merger.agenerate_explanation(entry["code"])
+        except Exception as e:
+            logging.error(f"Explanation for generation {generation_id} failed: {e}")
+            # Allow a later request to retry
+            entry["task"] = None
+            raise
+        if entry["on_explained"] is not None:
+            entry["on_explained"](entry["explanation"])
+        return entry["explanation"]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            generation_id, entry = self._entries.popitem(last=False)
+            if entry["task"] is not None and not entry["task"].done():
+                entry["task"].cancel()
+            logging.info(f"Evicted generation {generation_id} from ExplanationStore.")
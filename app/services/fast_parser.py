@@ -0,0 +1,105 @@
+import re
+import logging
+import numpy as np
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+# Clause boundaries in prompts such as "read a csv file and sort the rows, then write json"
+CLAUSE_SPLIT = re.compile(r"\s*(?:[,;]|\band then\b|\bthen\b|\band\b)\s*", re.IGNORECASE)
+# Lead-ins that carry no syntax requirement
+LEAD_IN = re.compile(
+    r"^(?:(?:how (?:do i|can i|to)|i want to|i need to|please|write (?:a )?(?:python )?(?:code|program|script|function)"
+    r"(?: (?:to|that))?)\s+)+",
+    re.IGNORECASE,
+)
+
+
+def split_clauses(query: str) -> List[str]:
+    """Split a prompt into its requirement clauses, without lead-ins such as "how to"."""
+    clauses = []
+    for clause in CLAUSE_SPLIT.split(query.strip().rstrip("?.!")):
+        clause = LEAD_IN.sub("", clause).strip()
+        if clause:
+            clauses.append(clause)
+    return clauses
+
+
+def element_text(title: str) -> str:
+    """Text embedded for a chunk title: the title without markdown code quotes."""
+    return " ".join(title.replace("`", "").split())
+
+
+def syntax_elements_from_chunks(chunks: Sequence[dict]) -> List[str]:
+    """Distinct chunk titles, in first-seen order, as the table of known syntax elements."""
+    seen = {}
+    for chunk in chunks:
+        title = (chunk.get("chunk_title") or "").strip()
+        if title and element_text(title).lower() not in seen:
+            seen[element_text(title).lower()] = title
+    return list(seen.values())
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def save_syntax_elements(path: str, elements: List[str], vectors: np.ndarray):
+    with open(path, "wb") as f:
+        np.savez(f, elements=np.array(elements, dtype=str), vectors=_normalize(vectors))
+    logging.info(f"Saved {len(elements)} syntax elements at {path}")
+
+
+class FastSyntaxParser:
+    """
+    Maps a prompt to known syntax elements without calling the LLM.
+
+    The prompt is split into clauses and each clause is matched to its
+    nearest known element (a chunk title) by embedding cosine similarity.
+    The prompt's confidence is its weakest clause match. `parse` returns the
+    matched elements only when the confidence reaches `threshold`, and None
+    otherwise, so the caller can fall back to the LLM.
+
+    Parameters:
+        elements: Known syntax elements.
+        vectors: Their embeddings, one row per element.
+        embed_batch: Function embedding a list of texts into a 2-D array with the same model.
+        threshold: Minimum cosine similarity of every clause to its element.
+        max_clauses: Prompts with more clauses than this are left to the LLM.
+    """
+
+    def __init__(self, elements: List[str], vectors: np.ndarray, embed_batch: Callable[[List[str]], np.ndarray],
+                 threshold: float = 0.75, max_clauses: int = 4):
+        self.elements = list(elements)
+        self.vectors = _normalize(vectors).reshape(len(self.elements), -1)
+        self.embed_batch = embed_batch
+        self.threshold = threshold
+        self.max_clauses = max_clauses
+
+    @classmethod
+    def load(cls, path: str, embed_batch: Callable[[List[str]], np.ndarray], **kwargs) -> "FastSyntaxParser":
+        with np.load(path) as data:
+            parser = cls(data["elements"].tolist(), data["vectors"], embed_batch, **kwargs)
+        logging.info(f"Loaded {len(parser.elements)} syntax elements for the fast parser from {path}")
+        return parser
+
+    def match(self, query: str) -> Tuple[List[str], float]:
+        """Best element per clause (deduplicated) and the lowest clause similarity."""
+        clauses = split_clauses(query)
+        if not clauses or not self.elements or len(clauses) > self.max_clauses:
+            return [], 0.0
+        similarities = _normalize(self.embed_batch(clauses)) @ self.vectors.T
+        best = similarities.argmax(axis=1)
+        elements = list(dict.fromkeys(self.elements[i] for i in best))
+        return elements, float(similarities[np.arange(len(clauses)), best].min())
+
+    def parse(self, query: str) -> Optional[List[str]]:
+        elements, confidence = self.match(query)
+        if confidence < self.threshold:
+            logging.info(f"Fast parse confidence {confidence:.3f} below {self.threshold}; using the LLM")
+            return None
+        logging.info(f"Fast parse matched {elements} with confidence {confidence:.3f}")
+        return elements
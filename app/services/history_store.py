@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+JSON_FIELDS = ("syntax_elements", "doc_ids", "references", "timings", "prompt_tokens")
+COLUMNS = ("generation_id", "created_at", "endpoint", "prompt", "generated_code", "explanation") + JSON_FIELDS
+
+
+class HistoryStore:
+    """
+    Write-behind SQLite log of finished generations.
+
+    `record` and `update_explanation` only touch memory and return
+    immediately. A background task flushes everything recorded within
+    `flush_interval_ms` in one transaction on a dedicated writer thread, so
+    request handlers never wait on disk and concurrent requests never
+    interleave partial writes. `get` also sees records that are not yet on
+    disk. `aclose` flushes what is left.
+
+    Parameters:
+        db_path: SQLite database file; its directory is created if needed.
+        flush_interval_ms: How long records are collected before a flush.
+    """
+
+    def __init__(self, db_path: str, flush_interval_ms: float = 200.0):
+        logging.info(f"Initializing HistoryStore at {db_path}")
+        self.flush_interval = flush_interval_ms / 1000
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # All database access happens on this one thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "generation_id TEXT PRIMARY KEY, created_at REAL, endpoint TEXT, prompt TEXT, generated_code TEXT, "
+            "explanation TEXT, syntax_elements TEXT, doc_ids TEXT, refs TEXT, timings TEXT, prompt_tokens TEXT)"
+        )
+        self._db.commit()
+
+        # generation id -> record waiting to be written; "partial" records only update the explanation
+        self._pending: Dict[str, dict] = {}
+        self._inflight: Dict[str, dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.records_written = 0
+
+    def record(self, generation_id: str, endpoint: str, prompt: str, syntax_elements: List[str], doc_ids: List[int],
+               references: List[str], generated_code: str, explanation: Optional[str] = None,
+               timings: Optional[dict] = None, prompt_tokens: Optional[dict] = None):
+        """Queue a generation for writing. Must be called from the event loop."""
+        if explanation is None:
+            # Keep an explanation that finished before the generation was recorded
+            explanation = self._pending.get(generation_id, {}).get("explanation")
+        self._pending[generation_id] = {
+            "generation_id": generation_id, "created_at": time.time(), "endpoint": endpoint, "prompt": prompt,
+            "generated_code": generated_code, "explanation": explanation,
+            "syntax_elements": list(syntax_elements), "doc_ids": [int(i) for i in doc_ids],
+            "references": list(references), "timings": dict(timings or {}), "prompt_tokens": dict(prompt_tokens or {}),
+        }
+        self._schedule_flush()
+
+    def update_explanation(self, generation_id: str, explanation: str):
+        """Set the explanation of a recorded generation, e.g. once a background explanation finishes."""
+        entry = self._pending.get(generation_id)
+        if entry is None:
+            entry = self._pending[generation_id] = {"generation_id": generation_id, "partial": True}
+        entry["explanation"] = explanation
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Let records from concurrent requests accumulate into one transaction
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            self._inflight.update(batch)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._writer, self._write, list(batch.values()))
+            except sqlite3.Error as e:
+                logging.error(f"🔥 Failed to write {len(batch)} history records: {e}")
+            finally:
+                for generation_id in batch:
+                    self._inflight.pop(generation_id, None)
+
+    def _write(self, records: List[dict]):
+        full = [r for r in records if not r.get("partial")]
+        updates = [(r["explanation"], r["generation_id"]) for r in records if r.get("partial")]
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO generations VALUES ({', '.join('?' * len(COLUMNS))})",
+            [[r[c] for c in COLUMNS[:6]] + [json.dumps(r[c]) for c in JSON_FIELDS] for r in full],
+        )
+        self._db.executemany("UPDATE generations SET explanation = ? WHERE generation_id = ?", updates)
+        self._db.commit()
+        self.flushes += 1
+        self.records_written += len(records)
+        logging.info(f"Flushed {len(full)} history records and {len(updates)} explanation updates")
+
+    def _read(self, generation_id: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT generation_id, created_at, endpoint, prompt, generated_code, explanation, "
+            "syntax_elements, doc_ids, refs, timings, prompt_tokens FROM generations WHERE generation_id = ?",
+            (generation_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(COLUMNS[:6], row[:6]))
+        record.update({field: json.loads(value) for field, value in zip(JSON_FIELDS, row[6:])})
+        return record
+
+    async def get(self, generation_id: str) -> Optional[dict]:
+        # Unwritten changes win over what is on disk
+        overlay = {**self._inflight.get(generation_id, {}), **self._pending.get(generation_id, {})}
+        if overlay and not overlay.get("partial"):
+            return overlay
+        record = await asyncio.get_running_loop().run_in_executor(self._writer, self._read, generation_id)
+        if record is not None and overlay:
+            record["explanation"] = overlay["explanation"]
+        return record
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushes": self.flushes, "records_written": self.records_written}
+
+    async def aclose(self):
+        """Write everything still pending and close the database."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._db.close)
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+from typing import Callable, List, Optional
+from app.utils.cache_utils import LRUCache, normalize_prompt, write_json_atomic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+class ParseCache:
+    """
+    Cache of SyntaxQueryParser results keyed on the normalised prompt.
+
+    Exact matches are looked up first. When an `embed_fn` is given, prompts
+    whose embedding is at least `similarity_threshold` cosine-similar to a
+    cached prompt are treated as hits too. Entries are evicted LRU-first and
+    after `ttl_seconds`, and the cache is persisted to `path` as JSON every
+    `flush_every` new entries and on `save()`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        embed_fn: Optional[Callable[[str], np.ndarray]] = None,
+        similarity_threshold: float = 0.95,
+        flush_every: int = 16,
+    ):
+        logging.info(f"Initializing ParseCache at {path} (max_entries={max_entries}, semantic={embed_fn is not None})")
+        self.path = path
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.flush_every = flush_every
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._matrix = None
+        self._matrix_keys: List[str] = []
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.embed_fn(text), dtype="float32")
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def get(self, prompt: str) -> Optional[list]:
+        key = normalize_prompt(prompt)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            logging.info(f"Parse cache hit for prompt: {key}")
+            return list(entry["elements"])
+
+        if self.embed_fn is not None:
+            match = self._nearest(self._embed(key))
+            if match is not None:
+                self.semantic_hits += 1
+                logging.info(f"Parse cache semantic hit for prompt: {key}")
+                return list(match["elements"])
+
+        self.misses += 1
+        return None
+
+    def put(self, prompt: str, elements: list):
+        key = normalize_prompt(prompt)
+        embedding = self._embed(key).tolist() if self.embed_fn is not None else None
+        self._cache.put(key, {"elements": list(elements), "embedding": embedding})
+        with self._lock:
+            self._matrix = None
+            self._unsaved += 1
+            should_flush = self.path is not None and self._unsaved >= self.flush_every
+        if should_flush:
+            self.save()
+
+    def _nearest(self, embedding: np.ndarray) -> Optional[dict]:
+        with self._lock:
+            if self._matrix is None:
+                rows = [(key, entry["embedding"]) for key, entry, _ in self._cache.items() if entry.get("embedding")]
+                self._matrix_keys = [key for key, _ in rows]
+                self._matrix = np.array([vector for _, vector in rows], dtype="float32").reshape(len(rows), -1)
+            matrix, keys = self._matrix, self._matrix_keys
+
+        if not keys:
+            return None
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        # May be None if the entry was evicted or expired since the matrix was built
+        return self._cache.get(keys[best])
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            entries = [
+                {"prompt": key, "elements": entry["elements"], "embedding": entry["embedding"], "stored_at": stored_at}
+                for key, entry, stored_at in self._cache.items()
+            ]
+            write_json_atomic(self.path, entries)
+            with self._lock:
+                self._unsaved = 0
+        logging.info(f"Saved {len(entries)} parse cache entries to {self.path}")
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not load parse cache from {self.path}: {e}")
+            return
+
+        for item in entries:
+            embedding = item.get("embedding")
+            # Entries saved while semantic matching was off have no embedding yet
+            if self.embed_fn is not None and embedding is None:
+                embedding = self._embed(item["prompt"]).tolist()
+            self._cache.put(item["prompt"], {"elements": item["elements"], "embedding": embedding}, stored_at=item["stored_at"])
+        logging.info(f"Loaded {len(self._cache)} parse cache entries from {self.path}")
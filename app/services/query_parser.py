@@ -1,19 +1,27 @@
+import asyncio
 import logging
 import json
+from typing import Optional
 from app.models.llama_handler import OllamaHandler
+from app.services.parse_cache import ParseCache
+from app.services.fast_parser import FastSyntaxParser
+from app.utils.metrics import span
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
 
 class SyntaxQueryParser:
-    def __init__(self):
+    def __init__(self, cache: Optional[ParseCache] = None, llama: Optional[OllamaHandler] = None,
+                 fast_parser: Optional[FastSyntaxParser] = None):
         logging.info("Initializing SyntaxQueryParser with OllamaHandler...")
-        self.llama = OllamaHandler()
+        # A handler passed in is shared with other services (one connection pool)
+        self.llama = llama or OllamaHandler()
+        self.cache = cache
+        # Confident local matches skip the LLM; only LLM results are cached
+        self.fast_parser = fast_parser
         logging.info("SyntaxQueryParser initialized successfully.")
         
-    def parse(self, query: str) -> list:
-        logging.info(f"Parsing query: {query}")
-        
+    def _build_prompts(self, query: str) -> tuple:
         system_prompt = f"""Analyze this programming query and extract atomic syntax requirements:
         Input Format: 
         User Query: Complex Programming Task Query
@@ -38,6 +46,19 @@ class SyntaxQueryParser:
         user_prompt = f"""
         User Query: {query}. In python
         """
+        return system_prompt, user_prompt
+
+    def parse(self, query: str) -> list:
+        logging.info(f"Parsing query: {query}")
+        if self.cache is not None:
+            cached = self.cache.get(query)
+            if cached is not None:
+                return cached
+        if self.fast_parser is not None:
+            elements = self.fast_parser.parse(query)
+            if elements:
+                return elements
+        system_prompt, user_prompt = self._build_prompts(query)
         
         logging.info("Generating syntax elements using OllamaHandler...")
         response = self.llama.generate_response(system_prompt, user_prompt)
@@ -45,8 +66,42 @@ class SyntaxQueryParser:
         
         parsed_response = self._clean_response(response)
         logging.info(f"Extracted {len(parsed_response)} syntax elements.")
-        print(f"parsed response: {parsed_response}")
+        logging.debug("parsed response: %s", parsed_response)
         
+        if self.cache is not None:
+            self.cache.put(query, parsed_response)
+        return parsed_response
+
+    async def aparse(self, query: str) -> list:
+        """Non-blocking version of `parse` for use inside the event loop."""
+        logging.info(f"Parsing query: {query}")
+        loop = asyncio.get_running_loop()
+        with span("parse") as parse_span:
+            if self.cache is not None:
+                # Cache lookups may embed the prompt, so keep them off the event loop
+                cached = await loop.run_in_executor(None, self.cache.get, query)
+                parse_span.set(cache_hit=cached is not None)
+                if cached is not None:
+                    return cached
+            if self.fast_parser is not None:
+                # Embeds the prompt, so also off the event loop
+                elements = await loop.run_in_executor(None, self.fast_parser.parse, query)
+                parse_span.set(fast_path=bool(elements))
+                if elements:
+                    parse_span.set(elements=len(elements))
+                    return elements
+            system_prompt, user_prompt = self._build_prompts(query)
+
+            logging.info("Generating syntax elements using OllamaHandler...")
+            response = await self.llama.agenerate_response(system_prompt, user_prompt)
+            logging.info(f"Generated response: {response[:100]}... (truncated for logging)")
+
+            parsed_response = self._clean_response(response)
+            parse_span.set(elements=len(parsed_response))
+            logging.info(f"Extracted {len(parsed_response)} syntax elements.")
+
+        if self.cache is not None:
+            await loop.run_in_executor(None, self.cache.put, query, parsed_response)
         return parsed_response
     
     def _clean_response(self, response: str) -> list:
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+from app.utils.cache_utils import LRUCache, normalize_prompt
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+
+def fingerprint_files(paths: Iterable[str]) -> str:
+    """Version string that changes whenever any of the given files is rewritten."""
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Two-tier cache of finished /generate results.
+
+    The key covers everything that determines the model output: the
+    normalised prompt, the sorted retrieved document ids, the model name and
+    its sampling options. Hot entries live in an in-memory LRU; every entry is
+    also written to SQLite so it survives restarts. Entries written against a
+    different `index_version` (FAISS indexes or documentation chunks changed)
+    are purged on startup and never returned.
+    """
+
+    def __init__(self, db_path: Optional[str], index_version: str, max_entries: int = 512, ttl_seconds: Optional[float] = None):
+        logging.info(f"Initializing ResponseCache at {db_path} for index version {index_version}")
+        self.index_version = index_version
+        self.ttl_seconds = ttl_seconds
+        self._memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, index_version TEXT, generated_code TEXT, "
+                "explanation TEXT, refs TEXT, stored_at REAL)"
+            )
+            purged = self._db.execute("DELETE FROM responses WHERE index_version != ?", (index_version,)).rowcount
+            self._db.commit()
+            if purged:
+                logging.info(f"Purged {purged} cached responses built against an older index version.")
+
+    @staticmethod
+    def make_key(prompt: str, doc_indices: List[int], model_name: str, options: dict) -> str:
+        payload = json.dumps({
+            "prompt": normalize_prompt(prompt),
+            "doc_indices": sorted(int(i) for i in doc_indices),
+            "model": model_name,
+            "options": options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            return dict(entry)
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self.disk_hits += 1
+            self._memory.put(key, entry)
+            return dict(entry)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, generated_code: str, explanation: Optional[str], references: List[str]):
+        """
+        Store a result. Writes may arrive out of order from executor threads,
+        so a put without an explanation keeps one already stored for the same code.
+        """
+        with self._lock:
+            if explanation is None:
+                existing = self._memory.get(key) or self._read_disk_locked(key)
+                if existing is not None and existing["generated_code"] == generated_code:
+                    explanation = existing["explanation"]
+            entry = {"generated_code": generated_code, "explanation": explanation, "references": list(references)}
+            self._memory.put(key, entry)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.index_version, generated_code, explanation, json.dumps(entry["references"]), time.time()),
+            )
+            self._db.commit()
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._read_disk_locked(key)
+
+    def _read_disk_locked(self, key: str) -> Optional[dict]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT generated_code, explanation, refs, stored_at FROM responses WHERE key = ? AND index_version = ?",
+            (key, self.index_version),
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl_seconds is not None and time.time() - row[3] > self.ttl_seconds:
+            return None
+        return {"generated_code": row[0], "explanation": row[1], "references": json.loads(row[2])}
+
+    def stats(self) -> dict:
+        return {"entries": len(self._memory), "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
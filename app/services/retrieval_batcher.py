@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+from app.utils.metrics import add_timings, collect_timings, request_id_var
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+
+class RetrievalBatcher:
+    """
+    Micro-batches retrieval queries from concurrent requests.
+
+    Queries submitted within `max_wait_ms` of each other are collected until
+    `max_batch_size` queries are pending or the wait expires, then encoded and
+    searched with a single `retrieve_batch` call in `executor`. Duplicate
+    queries in a batch are only retrieved once. Each caller gets back exactly
+    the results it would have got from calling `retrieve_batch` itself.
+    Spans opened by the batch carry the ids of all requests it serves, and
+    their durations are added to each of those requests' timings.
+
+    Parameters:
+        retrieve_batch: Blocking function mapping (tasks, k) to per-task results.
+        executor: Thread pool the blocking function runs in.
+        max_batch_size: Number of pending queries that triggers an immediate flush.
+        max_wait_ms: Longest time the first query of a batch waits for company.
+    """
+
+    def __init__(self, retrieve_batch: Callable[[List[str], int], List[List[int]]], executor: Executor,
+                 max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        logging.info(f"Initializing RetrievalBatcher with max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}")
+        self.retrieve_batch = retrieve_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[List[str], int, asyncio.Future, contextvars.Context]] = []
+        self._pending_size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Strong references so running dispatches are not garbage collected
+        self._dispatches = set()
+
+        self.batches = 0
+        self.queries = 0
+
+    async def submit(self, tasks: List[str], k: int = 2) -> List[List[int]]:
+        """Queue `tasks` for the next batch and wait for their results."""
+        if not tasks:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((list(tasks), k, future, contextvars.copy_context()))
+        self._pending_size += len(tasks)
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_size = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    def _retrieve_for(self, request_ids: List[str], tasks: List[str], k: int) -> Tuple[List[List[int]], Dict[str, float]]:
+        """Run `retrieve_batch` with the batch's request ids on its spans, returning the results and span timings."""
+        request_id_var.set(",".join(request_ids) or None)
+        timings = collect_timings()
+        return self.retrieve_batch(tasks, k), timings
+
+    async def _dispatch(self, batch: List[Tuple[List[str], int, asyncio.Future, contextvars.Context]]):
+        # Callers may ask for different k; each k is one retrieve_batch call
+        by_k: Dict[int, list] = {}
+        for item in batch:
+            by_k.setdefault(item[1], []).append(item)
+
+        loop = asyncio.get_running_loop()
+        for k, items in by_k.items():
+            unique_tasks = list(dict.fromkeys(task for tasks, _, _, _ in items for task in tasks))
+            request_ids = list(dict.fromkeys(filter(None, (context.get(request_id_var) for _, _, _, context in items))))
+            self.batches += 1
+            self.queries += sum(len(tasks) for tasks, _, _, _ in items)
+            logging.info(f"Retrieving a batch of {len(unique_tasks)} unique queries from {len(items)} requests (k={k})")
+            try:
+                results, timings = await loop.run_in_executor(
+                    self.executor, contextvars.copy_context().run, self._retrieve_for, request_ids, unique_tasks, k)
+            except Exception as e:
+                for _, _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            by_task = dict(zip(unique_tasks, results))
+            for tasks, _, future, context in items:
+                context.run(add_timings, timings)
+                # A caller that was cancelled while waiting no longer wants its result
+                if not future.done():
+                    future.set_result([list(by_task[task]) for task in tasks])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+        }
@@ -1,5 +1,8 @@
 import logging
+from typing import AsyncIterator, List, Optional, Tuple
 from app.models.llama_handler import OllamaHandler
+from app.services.context_builder import ContextBuilder, clean_code, estimate_tokens, truncate_lines
+from app.utils.metrics import span
 
 # Configure logging
 logging.basicConfig(
@@ -9,71 +12,141 @@ logging.basicConfig(
 
 
 class CodeMerger:
-    def __init__(self):
+    def __init__(self, llama: Optional[OllamaHandler] = None, context_builder: Optional[ContextBuilder] = None,
+                 explanation_code_tokens: int = 1500):
         logging.info("Initializing CodeMerger with OllamaHandler...")
-        self.llama = OllamaHandler()
+        # A handler passed in is shared with other services (one connection pool)
+        self.llama = llama or OllamaHandler()
+        self.context_builder = context_builder or ContextBuilder()
+        # Longer code is cut at a line boundary before it is sent for explanation
+        self.explanation_code_tokens = explanation_code_tokens
         logging.info("CodeMerger initialized successfully.")
 
     def format_document_chunk(self, snippet):
-        chunk = snippet.get("chunk", "")
-        summary = snippet.get("summary", "")
-        code_snippet = snippet.get("code_snippet", "")
-        chunk_title = snippet.get("chunk_title", "")
-        use_case = snippet.get("use_case", "")
-
-        return f"""
-        ######################################
-        Title: {chunk_title}
-        Summary: {summary}
-        Code:
-        {code_snippet}
-        ######################################
-        """
-
-    
+        return self.context_builder.format_snippet(snippet)
 
-    def merge_code(self, snippets: list, query: str) -> str:
-        logging.info(f"Merging {len(snippets)} code snippets for query: {query}")
+    def prepare_code_prompt(self, snippets: list, query: str, scores: Optional[List[float]] = None) -> Tuple[str, dict]:
+        """
+        Build the code prompt within the context token budget.
 
-        context = "\n=======================================\n".join(
-            [self.format_document_chunk(snippet) for snippet in snippets]
-        )
+        Returns the prompt and a token report: the context builder's counts
+        plus "code_prompt_tokens" for the whole prompt.
+        """
+        context, report = self.context_builder.build(snippets, scores)
         logging.debug(f"Generated context for merging:")
         logging.debug(context)
 
-        code_prompt = f"""Combine these code snippets into working Python code:
-        Query: {query}
-        Documentation:
-        {context}
-        
-        Requirements:
-        1. Include relevant imports
-        2. Follow PEP8 guidelines
-        3. Add type hints
-        4. Include error handling
-        5. Use relevant documentation code only
-        6. If documentation is not enough just give functions that can help in writing code
-        7. **Don't add any extra logic**
-        
-        **Return ONLY the code without explanations.**
-        """
+        code_prompt = f"""Combine these code snippets into working Python code.
+Query: {query}
+
+Documentation:
+{context}
+
+Requirements:
+1. Include relevant imports
+2. Follow PEP8 guidelines
+3. Add type hints
+4. Include error handling
+5. Use relevant documentation code only
+6. If documentation is not enough just give functions that can help in writing code
+7. **Don't add any extra logic**
+
+**Return ONLY the code without explanations.**"""
+        report["code_prompt_tokens"] = estimate_tokens(code_prompt)
+        return code_prompt, report
+
+    def build_code_prompt(self, snippets: list, query: str, scores: Optional[List[float]] = None) -> str:
+        return self.prepare_code_prompt(snippets, query, scores)[0]
+
+    def build_explanation_prompt(self, code: str) -> str:
+        code, truncated = truncate_lines(clean_code(code), self.explanation_code_tokens)
+        if truncated:
+            logging.info(f"Truncated code to {self.explanation_code_tokens} tokens for the explanation prompt.")
+        return f"""Explain the syntax choices in this code:
+```python
+{code}
+```
+
+Focus on:
+- Key Python features used
+- Standard library modules
+- Error handling patterns
+- Best practices followed"""
+
+    def merge_code(self, snippets: list, query: str) -> tuple:
+        logging.info(f"Merging {len(snippets)} code snippets for query: {query}")
+        code_prompt = self.build_code_prompt(snippets, query)
 
         logging.info("Generating code using OllamaHandler...")
         code = self.llama.generate(code_prompt)
         logging.info(f"Generated code of length {len(code)} characters.")
 
-        explanation_prompt = f"""Explain the syntax choices in this code:
-        {code}
-        
-        Focus on:
-        - Key Python features used
-        - Standard library modules
-        - Error handling patterns
-        - Best practices followed
-        """
+        explanation_prompt = self.build_explanation_prompt(code)
 
         logging.info("Generating explanation using OllamaHandler...")
         explanation = self.llama.generate(explanation_prompt)
         logging.info(f"Generated explanation of length {len(explanation)} characters.")
 
         return code, explanation
+
+    async def agenerate_code(self, snippets: list, query: str, scores: Optional[List[float]] = None,
+                             usage: Optional[dict] = None) -> str:
+        """
+        Generate only the merged code, leaving the explanation to the caller.
+
+        `scores` rank the snippets for the context budget; `usage`, when
+        given, is updated with the prompt token report.
+        """
+        logging.info(f"Merging {len(snippets)} code snippets for query: {query}")
+        code_prompt, report = self.prepare_code_prompt(snippets, query, scores)
+        if usage is not None:
+            usage.update(report)
+
+        logging.info("Generating code using OllamaHandler...")
+        with span("generate_code", **report):
+            code = await self.llama.agenerate(code_prompt)
+        logging.info(f"Generated code of length {len(code)} characters.")
+        return code
+
+    async def agenerate_explanation(self, code: str) -> str:
+        explanation_prompt = self.build_explanation_prompt(code)
+
+        logging.info("Generating explanation using OllamaHandler...")
+        with span("generate_explanation", explanation_prompt_tokens=estimate_tokens(explanation_prompt)):
+            explanation = await self.llama.agenerate(explanation_prompt)
+        logging.info(f"Generated explanation of length {len(explanation)} characters.")
+        return explanation
+
+    async def amerge_code(self, snippets: list, query: str) -> tuple:
+        """Non-blocking version of `merge_code` for use inside the event loop."""
+        code = await self.agenerate_code(snippets, query)
+        explanation = await self.agenerate_explanation(code)
+        return code, explanation
+
+    async def astream_merge_code(self, snippets: list, query: str, scores: Optional[List[float]] = None,
+                                 usage: Optional[dict] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Stream the code and explanation generations token by token.
+
+        Yields ("code", token) pairs while the code is generated, then
+        ("explanation", token) pairs for the explanation of the finished code.
+        `scores` and `usage` are as for `agenerate_code`.
+        """
+        logging.info(f"Streaming merge of {len(snippets)} code snippets for query: {query}")
+        code_prompt, report = self.prepare_code_prompt(snippets, query, scores)
+        if usage is not None:
+            usage.update(report)
+
+        code_tokens = []
+        with span("generate_code", streamed=True, **report):
+            async for token in self.llama.astream_generate(code_prompt):
+                code_tokens.append(token)
+                yield "code", token
+        code = "".join(code_tokens)
+        logging.info(f"Streamed code of length {len(code)} characters.")
+
+        explanation_prompt = self.build_explanation_prompt(code)
+        with span("generate_explanation", streamed=True, explanation_prompt_tokens=estimate_tokens(explanation_prompt)):
+            async for token in self.llama.astream_generate(explanation_prompt):
+                yield "explanation", token
+        logging.info("Finished streaming explanation.")
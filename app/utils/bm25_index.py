@@ -0,0 +1,161 @@
+import re
+import math
+import logging
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+# Identifiers, including dotted API paths such as csv.DictReader
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do for from how i in into is it of on or that the this to use using with".split()
+)
+
+# Chunk fields the lexical index is built over
+LEXICAL_FIELDS = ("chunk_title", "summary", "code_snippet")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased word and identifier tokens of `text`.
+
+    A dotted name is kept whole and also split into its parts, so
+    "csv.DictReader" matches both the exact API name and "DictReader" alone.
+    Single-character names (loop variables, file handles like `f`) are dropped.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text):
+        token = match.lower()
+        if token in STOP_WORDS or len(token) < 2:
+            continue
+        tokens.append(token)
+        if "." in token:
+            tokens.extend(part for part in token.split(".") if part not in STOP_WORDS and len(part) > 1)
+    return tokens
+
+
+def idf(num_docs: int, doc_freq: int) -> float:
+    """BM25 inverse document frequency of a term found in `doc_freq` of `num_docs` documents."""
+    return math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def chunk_text(chunk: dict) -> str:
+    return "\n".join(str(chunk.get(field) or "") for field in LEXICAL_FIELDS)
+
+
+class BM25Index:
+    """
+    Precomputed BM25 inverted index over documentation chunks.
+
+    Term weights are computed once at build time, so scoring a query is a
+    lookup of each query term's postings and a sum per document; there is no
+    per-query pass over the corpus. Postings are stored as flat arrays
+    (`offsets[t]:offsets[t + 1]` slices the doc ids and weights of term t).
+
+    Parameters:
+        terms: Vocabulary, in posting order.
+        offsets: Start of each term's postings, plus the end offset.
+        doc_ids: Document positions of all postings.
+        weights: BM25 weight of each posting.
+        num_docs: Number of indexed documents.
+    """
+
+    def __init__(self, terms: Sequence[str], offsets: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, num_docs: int):
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        num_docs = len(lengths)
+        avg_length = (sum(lengths) / num_docs) if num_docs else 0.0
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        doc_ids, weights = [], []
+        for i, term in enumerate(terms):
+            entries = postings[term]
+            term_idf = idf(num_docs, len(entries))
+            for doc_id, tf in entries:
+                norm = k1 * (1 - b + b * lengths[doc_id] / avg_length) if avg_length else k1
+                doc_ids.append(doc_id)
+                weights.append(term_idf * tf * (k1 + 1) / (tf + norm))
+            offsets[i + 1] = len(doc_ids)
+
+        logging.info(f"Built BM25 index over {num_docs} documents with {len(terms)} terms")
+        return cls(terms, offsets, np.array(doc_ids, dtype="int32"), np.array(weights, dtype="float32"), num_docs)
+
+    def save(self, path: str):
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        with open(path, "wb") as f:
+            np.savez(f, terms=np.array(terms, dtype=str), offsets=self.offsets, doc_ids=self.doc_ids,
+                     weights=self.weights, num_docs=np.array(self.num_docs))
+        logging.info(f"BM25 index saved at {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            index = cls(data["terms"].tolist(), data["offsets"], data["doc_ids"], data["weights"], int(data["num_docs"]))
+        logging.info(f"Loaded BM25 index from {path} with {len(index.term_ids)} terms")
+        return index
+
+    def search(self, query: str, k: int, min_match: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Top `k` (doc id, score) pairs for documents sharing a term with `query`, best first.
+
+        `min_match` (0-1) drops weak matches before ranking: a document must
+        contain query terms carrying at least that share of the query's total
+        IDF. Terms the corpus does not contain count with the mean IDF of the
+        known ones. So a chunk sharing one common word with a longer query
+        is dropped, while one containing an exact API name is kept.
+        """
+        terms = set(tokenize(query))
+        spans = [(self.offsets[t], self.offsets[t + 1]) for t in
+                 (self.term_ids.get(term) for term in terms) if t is not None]
+        if not spans:
+            return []
+        ids = np.concatenate([self.doc_ids[start:end] for start, end in spans])
+        weights = np.concatenate([self.weights[start:end] for start, end in spans])
+        docs, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if min_match > 0:
+            term_idfs = [idf(self.num_docs, end - start) for start, end in spans]
+            query_idf = sum(term_idfs) * len(terms) / len(spans)
+            matched = np.bincount(inverse, weights=np.repeat(term_idfs, [end - start for start, end in spans]))
+            keep = matched >= min_match * query_idf
+            docs, scores = docs[keep], scores[keep]
+        if len(docs) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(docs[i]), float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int, rrf_k: int = 60) -> List[int]:
+    """
+    Fuse ranked lists of doc ids: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+
+    Ties keep the order in which ids were first seen, so the first ranking wins them.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, doc_id in enumerate(ranking, start=1):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
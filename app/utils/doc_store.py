@@ -0,0 +1,80 @@
+import os
+import json
+import mmap
+import logging
+import numpy as np
+from array import array
+from typing import Iterable, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+DOC_STORE_SUFFIX = ".store"
+
+
+def offsets_path(store_path: str) -> str:
+    return f"{store_path}.idx"
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped store of documentation chunks.
+
+    Records are stored one JSON object per line in `<name>.store`, and
+    `<name>.store.idx` holds the byte offset of every record (plus the end
+    offset) as a uint64 .npy array. Both files are memory-mapped, so opening
+    the store costs no parsing and `store[i]` reads and decodes only record i.
+    Supports `len()` and integer indexing like the list it replaces.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = np.load(offsets_path(path), mmap_mode="r")
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        logging.info(f"Opened document store {path} with {len(self)} records")
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Document index {index} out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return json.loads(self._data[start:end])
+
+    def get_many(self, indices: Iterable[int]) -> List[dict]:
+        return [self[i] for i in indices]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+def write_doc_store(records: Iterable[dict], path: str) -> int:
+    """Write records to a DocStore at `path`, streaming them one at a time. Returns the record count."""
+    offsets = array("Q", [0])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+
+    tmp_offsets = f"{tmp_path}.idx.npy"
+    np.save(tmp_offsets, np.frombuffer(offsets, dtype=np.uint64))
+    os.replace(tmp_offsets, offsets_path(path))
+    os.replace(tmp_path, path)
+    logging.info(f"Wrote {len(offsets) - 1} records to document store {path}")
+    return len(offsets) - 1
+
+
+def convert_json_to_doc_store(json_path: str, store_path: str) -> int:
+    """Convert a documentation_chunks.json array into a DocStore."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    return write_doc_store(records, store_path)
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from typing import Callable, Iterable, List, Optional
+from app.utils.cache_utils import write_json_atomic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class EmbeddingStore:
+    """
+    Content-addressed on-disk cache of text embeddings.
+
+    Vectors are appended to a raw float32 file that is read through a memory
+    map; `manifest.json` maps each text hash to its row. Rows past the
+    manifest's count (e.g. from an interrupted run) are ignored. Once more
+    than half of the file is unused it is compacted into a new file, which
+    the manifest switches to atomically. The store is reset when the
+    embedding model or dimension changes. With no `dimension`, the store
+    keeps the cached one or takes it from the first encoded batch; encoded
+    vectors of any other width raise ValueError.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, directory: str, model_name: str, dimension: Optional[int] = None):
+        self.directory = directory
+        self.model_name = model_name
+        self.dimension = dimension
+        self.manifest_path = os.path.join(directory, self.MANIFEST_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+        self.rows = {}
+        self.count = 0
+        self.generation = 0
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("model") == model_name and dimension in (None, manifest.get("dimension")):
+                self.dimension = manifest["dimension"]
+                self.rows = manifest["rows"]
+                self.count = manifest["count"]
+                self.generation = manifest["generation"]
+            else:
+                logging.info("Embedding model changed; discarding cached embeddings.")
+                self.generation = manifest.get("generation", 0) + 1
+        self.vectors_path = self._vectors_path(self.generation)
+        # Drop anything written after the last saved manifest
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self.count * (self.dimension or 0) * 4)
+        logging.info(f"Opened embedding store at {directory} with {len(self.rows)} cached embeddings")
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"vectors-{generation}.f32")
+
+    def _matrix(self) -> np.ndarray:
+        if self.count == 0:
+            return np.empty((0, self.dimension or 0), dtype="float32")
+        return np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(self.count, self.dimension))
+
+    def get_or_encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for `texts` in order, encoding only texts not seen before."""
+        hashes = [content_hash(text) for text in texts]
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in self.rows and text_hash not in missing:
+                missing[text_hash] = text
+
+        if missing:
+            logging.info(f"Encoding {len(missing)} new texts ({len(texts) - len(missing)} served from the embedding store)")
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype="float32").reshape(len(missing), -1)
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Encoder returned {vectors.shape[1]}-d embeddings but the store at "
+                                 f"{self.directory} holds {self.dimension}-d ones; delete it to re-encode")
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            for offset, text_hash in enumerate(missing):
+                self.rows[text_hash] = self.count + offset
+            self.count += len(missing)
+        else:
+            logging.info(f"All {len(texts)} embeddings served from the embedding store")
+
+        matrix = self._matrix()
+        return np.array(matrix[[self.rows[h] for h in hashes]], dtype="float32").reshape(-1, self.dimension or 0)
+
+    def save(self, keep_hashes: Iterable[str] = None):
+        """Persist the manifest, compacting away embeddings no longer referenced by `keep_hashes`."""
+        if keep_hashes is not None:
+            keep = set(keep_hashes)
+            if len(keep) * 2 < self.count:
+                self._compact(keep)
+        write_json_atomic(self.manifest_path, {
+            "model": self.model_name, "dimension": self.dimension, "count": self.count,
+            "generation": self.generation, "rows": self.rows,
+        })
+        # Files from earlier generations are unreferenced once the manifest is written
+        for name in os.listdir(self.directory):
+            if name.startswith("vectors-") and os.path.join(self.directory, name) != self.vectors_path:
+                os.remove(os.path.join(self.directory, name))
+
+    def _compact(self, keep: set):
+        kept = [(text_hash, row) for text_hash, row in self.rows.items() if text_hash in keep]
+        logging.info(f"Compacting embedding store from {self.count} to {len(kept)} rows")
+        vectors = np.array(self._matrix()[[row for _, row in kept]], dtype="float32").reshape(-1, self.dimension)
+        self.generation += 1
+        self.vectors_path = self._vectors_path(self.generation)
+        vectors.tofile(self.vectors_path)
+        self.rows = {text_hash: new_row for new_row, (text_hash, _) in enumerate(kept)}
+        self.count = len(kept)
@@ -0,0 +1,162 @@
+import os
+import json
+import math
+import logging
+import faiss
+import numpy as np
+from typing import Callable, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+INDEX_META_FILE = "index_meta.json"
+
+# In a fused index each chunk contributes two vectors; the id encodes which one
+SUMMARY_KIND = 0
+USECASE_KIND = 1
+
+
+def fused_id(chunk_index: int, kind: int) -> int:
+    return chunk_index * 2 + kind
+
+
+def fused_chunk_index(vector_id: int) -> int:
+    return vector_id // 2
+
+
+def factory_string(index_type: str, num_vectors: int, dimension: int, nlist: int = 256, hnsw_m: int = 32,
+                   pq_m: int = 16, pq_bits: int = 8) -> str:
+    """
+    Translate an index type and its parameters into a FAISS index_factory string.
+
+    Parameters are clamped so small corpora can still be trained: IVF needs at
+    least one training vector per list and PQ at least 2**pq_bits vectors.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    if index_type in ("pq", "ivfpq") and dimension % pq_m != 0:
+        raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}")
+
+    nlist = max(1, min(nlist, num_vectors))
+    pq_bits = max(1, min(pq_bits, int(math.log2(max(num_vectors, 2)))))
+
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "pq":
+        return f"PQ{pq_m}x{pq_bits}"
+    return f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", ids: Optional[np.ndarray] = None,
+                ef_construction: int = 200, **params) -> faiss.Index:
+    """
+    Build an inner-product FAISS index of the requested type over `vectors`.
+
+    When `ids` are given, search results return those ids instead of row
+    positions. IVF indexes store ids natively; other types are wrapped in an
+    IndexIDMap2, whose remove_ids is only correct for indexes that compact
+    like a flat index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    num_vectors, dimension = vectors.shape
+    description = factory_string(index_type, num_vectors, dimension, **params)
+    if ids is not None and index_type not in ("ivf", "ivfpq"):
+        description = f"IDMap2,{description}"
+    logging.info(f"Building FAISS index '{description}' over {num_vectors} vectors")
+
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        _unwrap(index).hnsw.efConstruction = ef_construction
+    if not index.is_trained and num_vectors > 0:
+        index.train(vectors)
+    if num_vectors > 0:
+        if ids is not None:
+            index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+        else:
+            index.add(vectors)
+    return index
+
+
+def update_index(index: faiss.Index, old_hashes: List[str], new_hashes: List[str], vectors: np.ndarray,
+                 id_fn: Callable[[np.ndarray], np.ndarray]) -> bool:
+    """
+    Update an index built with ids in place from one build to the next.
+
+    `old_hashes`/`new_hashes` hold a content hash per position for the
+    previous and current build, `vectors` are the current position-aligned
+    vectors and `id_fn` maps positions to index ids. Only positions whose
+    hash changed are removed and re-added. Returns False when the index does
+    not support removal or adding by id (e.g. HNSW, or an index built without
+    ids), in which case the index may be partly updated and the caller rebuilds.
+    """
+    changed = np.array([i for i, h in enumerate(new_hashes) if i >= len(old_hashes) or old_hashes[i] != h], dtype="int64")
+    stale = np.concatenate([changed[changed < len(old_hashes)], np.arange(len(new_hashes), len(old_hashes), dtype="int64")])
+    logging.info(f"Index update: {len(changed)} vectors to (re)add, {len(stale)} to remove")
+
+    try:
+        if len(stale):
+            index.remove_ids(id_fn(stale))
+        if len(changed):
+            index.add_with_ids(np.ascontiguousarray(vectors[changed], dtype="float32"), id_fn(changed))
+    except RuntimeError as e:
+        logging.warning(f"Index cannot be updated by id, rebuilding instead: {e}")
+        return False
+    return True
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """Return the underlying index of an IDMap wrapper, downcast to its concrete type."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def configure_search(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> faiss.Index:
+    """Apply query-time parameters where the index type supports them."""
+    base = _unwrap(index)
+    if nprobe and hasattr(base, "nprobe"):
+        base.nprobe = nprobe
+        logging.info(f"Set FAISS nprobe={nprobe}")
+    if ef_search and hasattr(base, "hnsw"):
+        base.hnsw.efSearch = ef_search
+        logging.info(f"Set FAISS efSearch={ef_search}")
+    return index
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Read a FAISS index, optionally memory-mapping its data.
+
+    A memory-mapped index is read-only and its pages live in the OS page
+    cache, so several worker processes serving the same file share one copy.
+    IO_FLAG_MMAP_IFC (faiss >= 1.9) maps flat codes zero-copy; older
+    versions only map IVF inverted lists. Falls back to a normal read for
+    indexes that cannot be mapped.
+    """
+    if mmap:
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logging.warning(f"Could not memory-map {path}, reading it into memory instead: {e}")
+    return faiss.read_index(path)
+
+
+def write_index_meta(index_dir: str, meta: dict):
+    with open(os.path.join(index_dir, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_index_meta(index_dir: str) -> dict:
+    """Describe how the indexes in `index_dir` were built; defaults to the original split flat layout."""
+    path = os.path.join(index_dir, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return {"layout": "split", "index_type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,234 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(message)s")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Id of the API request being served, set by the request middleware in app.main
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+# Stage -> milliseconds for the request being served, when a caller collects them (see `collect_timings`)
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.setdefault(tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, le)} {cumulative}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Prometheus-style monotonically increasing counter, one series per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        with self._lock:
+            key = tuple(label_values)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Prometheus-style gauge: a value that goes up and down, one series per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        # An unlabelled gauge reports 0 until it is first set
+        self._series: Dict[Tuple[str, ...], float] = {} if self.label_names else {(): 0.0}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._series[tuple(label_values)] = value
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        with self._lock:
+            key = tuple(label_values)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for label_values, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "codegen_stage_duration_seconds", "Wall-clock time spent in each pipeline stage.", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "codegen_stage_errors_total", "Pipeline stages that raised an exception.", ["stage"]))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "codegen_llm_tokens_total", "Tokens processed by the LLM, as reported by Ollama.", ["stage", "kind"]))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "codegen_llm_requests_total", "LLM calls by API endpoint and outcome "
+    "(success, error, timeout, rejected, coalesced).", ["endpoint", "outcome"]))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "codegen_llm_retries_total", "LLM requests retried after a transient failure.", ["endpoint"]))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "codegen_llm_in_flight", "LLM calls running or waiting for a connection."))
+LLM_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "codegen_llm_circuit_open", "1 while the circuit breaker rejects LLM calls, else 0."))
+
+
+class Span:
+    """
+    Timing of one pipeline stage.
+
+    Attributes set with `set` (e.g. token counts) are included in the span's
+    log record. Spans nest through a context variable, so code deeper in the
+    call stack can annotate the stage it runs in via `current_span()`.
+    """
+
+    def __init__(self, stage: str, attributes: dict):
+        self.stage = stage
+        self.attributes = attributes
+        self.request_id = request_id_var.get()
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """
+    Time a pipeline stage and record it in the stage histogram.
+
+    Usable around awaits as well: the measured time is wall-clock time. A
+    structured JSON record with the request id, duration and attributes is
+    logged when the stage finishes.
+    """
+    current = Span(stage, attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield current
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Finished in a different context, e.g. an async generator closed by another task
+            pass
+        STAGE_SECONDS.observe(current.duration, stage)
+        add_timings({stage: current.duration * 1000})
+        if failed:
+            STAGE_ERRORS.inc(1, stage)
+        logging.info("span %s", json.dumps({
+            "stage": stage, "request_id": current.request_id, "duration_ms": round(current.duration * 1000, 3),
+            "error": failed, **current.attributes,
+        }, default=str))
+
+
+def collect_timings() -> Dict[str, float]:
+    """
+    Start collecting span durations for the current request.
+
+    Returns a dict that every span finished later in this context (and in
+    tasks started from it) adds its duration in milliseconds to, per stage.
+    """
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def add_timings(timings: Dict[str, float]):
+    """Add stage durations in milliseconds to the timings collected for the current request, if any."""
+    collected = _request_timings.get()
+    if collected is not None:
+        for stage, duration_ms in timings.items():
+            collected[stage] = round(collected.get(stage, 0.0) + duration_ms, 3)
+
+
+def record_llm_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Attach token counts reported by the LLM to the current span and the token counters."""
+    active = current_span()
+    stage = active.stage if active is not None else "unknown"
+    if prompt_tokens is not None:
+        LLM_TOKENS.inc(prompt_tokens, stage, "prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.inc(completion_tokens, stage, "completion")
+    if active is not None:
+        if prompt_tokens is not None:
+            active.set(llm_prompt_tokens=prompt_tokens)
+        if completion_tokens is not None:
+            active.set(llm_completion_tokens=completion_tokens)
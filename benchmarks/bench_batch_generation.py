@@ -0,0 +1,75 @@
+"""
+Throughput of /generate called once per prompt vs one /generate/batch job.
+
+Both modes use the configured indexes (INDEX_DIR) and a local stub Ollama
+server with a fixed latency per request. The prompt list has --distinct
+different prompts repeated up to --requests entries, like an offline job
+with repeated questions. The single-request mode calls the /generate
+handler sequentially, as a client looping over the endpoint would; the
+batch mode runs the same requests through BatchGenerator. The parse and
+response caches and the history store are disabled so that neither mode
+benefits from the other's run.
+
+Usage:
+    python -m benchmarks.bench_batch_generation --requests 200 --distinct 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from tests.stub_ollama import StubOllamaServer
+
+PROMPTS = [
+    "read a csv file", "parse json from a string", "sort a list of dicts by key", "open a sqlite database",
+    "format a datetime as iso", "split a path into parts", "start a thread pool", "compress a file with gzip",
+]
+
+
+def make_prompts(total: int, distinct: int) -> list:
+    prompts = [f"{PROMPTS[i % len(PROMPTS)]} ({i})" for i in range(distinct)]
+    return [prompts[i % distinct] for i in range(total)]
+
+
+async def run(args, url: str):
+    os.environ.update(OLLAMA_HOST=url, PARSE_CACHE_ENABLED="false", RESPONSE_CACHE_ENABLED="false",
+                      HISTORY_ENABLED="false", BATCH_MAX_CONCURRENCY=str(args.concurrency))
+    # Configuration is read at import
+    from app import main
+    from app.schemas.api_schemas import CodeRequest
+
+    requests = [CodeRequest(prompt=prompt) for prompt in make_prompts(args.requests, args.distinct)]
+    await main.services.ensure_ready()
+    try:
+        start = time.perf_counter()
+        for request in requests:
+            await main.generate_code(request)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [result async for result in main.services.batch_generator.run(requests)]
+        batch = time.perf_counter() - start
+        failed = sum("error" in result for result in results)
+    finally:
+        await main.services.aclose()
+
+    print(f"{'mode':<10}{'requests':>10}{'seconds':>10}{'req/s':>10}")
+    print(f"{'single':<10}{len(requests):>10}{single:>10.2f}{len(requests) / single:>10.1f}")
+    print(f"{'batch':<10}{len(requests):>10}{batch:>10.2f}{len(requests) / batch:>10.1f}")
+    print(f"speed-up: {single / batch:.1f}x, {args.distinct} distinct prompts, {failed} failed")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--distinct", type=int, default=50)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Stub model latency per request in seconds")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    args = arg_parser.parse_args()
+
+    with StubOllamaServer(latency=args.latency) as server:
+        asyncio.run(run(args, server.url))
+
+
+if __name__ == "__main__":
+    main()
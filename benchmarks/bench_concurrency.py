@@ -0,0 +1,53 @@
+"""
+Throughput of the async Ollama client as concurrency grows.
+
+Runs `OllamaHandler.agenerate` against a local stub Ollama server with a
+fixed per-request latency and reports requests/sec for each concurrency
+level, next to the blocking `generate` path for comparison.
+
+Usage:
+    python -m benchmarks.bench_concurrency --latency 0.1 --requests 64
+"""
+import argparse
+import asyncio
+import time
+
+from app.models.llama_handler import OllamaHandler
+from tests.stub_ollama import StubOllamaServer
+
+
+async def run_async(url: str, concurrency: int, total: int) -> float:
+    handler = OllamaHandler(host=url, max_connections=concurrency, max_keepalive=concurrency, max_concurrency=concurrency)
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(handler.agenerate(f"prompt {i}") for i in range(total)))
+        return total / (time.perf_counter() - start)
+    finally:
+        await handler.aclose()
+
+
+def run_blocking(url: str, total: int) -> float:
+    handler = OllamaHandler(host=url)
+    start = time.perf_counter()
+    for i in range(total):
+        handler.generate(f"prompt {i}")
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Stub model latency per request in seconds")
+    arg_parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    arg_parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = arg_parser.parse_args()
+
+    with StubOllamaServer(latency=args.latency) as server:
+        print(f"{'mode':<10}{'concurrency':>12}{'req/s':>10}")
+        print(f"{'blocking':<10}{1:>12}{run_blocking(server.url, args.requests):>10.1f}")
+        for level in args.levels:
+            rps = asyncio.run(run_async(server.url, level, args.requests))
+            print(f"{'async':<10}{level:>12}{rps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
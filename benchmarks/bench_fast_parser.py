@@ -0,0 +1,103 @@
+"""
+Latency of the fast (embedding) query parser vs the LLM parser, and how
+often they lead to the same documentation.
+
+Needs indexes built by preprocess_docs (with syntax_elements.npz) in
+INDEX_DIR and a running Ollama server (OLLAMA_HOST). Every prompt is parsed
+by both parsers. The fast parser's elements are accepted at a threshold
+when the prompt's confidence reaches it. Agreement is the overlap of the
+top-k documents retrieved for the fast elements with those retrieved for
+the LLM elements; the two element lists use different wording (chunk
+titles vs free text), so comparing them directly says little. For each
+threshold the benchmark reports the share of prompts the fast path
+answers and the mean agreement on those prompts.
+
+Usage:
+    python -m benchmarks.bench_fast_parser --prompts prompts.txt --thresholds 0.6 0.7 0.75 0.8
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROMPTS = [
+    "how to open csv file", "read a csv file into a list of dicts", "write rows to a csv file",
+    "parse json from a string", "pretty print json", "serialize a python object to json",
+    "handle json decode errors", "initialize an array and append an element into it",
+    "search an array for a value", "store binary data in an array", "read a csv file and convert it to json",
+    "handle special characters in csv", "write a custom json encoder for datetime",
+]
+
+
+def percentile_ms(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000
+
+
+async def run(args):
+    # Parse results must come from the parsers, not the cache
+    os.environ["PARSE_CACHE_ENABLED"] = "false"
+    from app.main import BASE_DIR
+    from app.services.container import ServiceContainer
+    from app.services.document_retrieval import rank_by_relevance
+    from app.services.query_parser import SyntaxQueryParser
+
+    prompts = PROMPTS
+    if args.prompts is not None:
+        prompts = [line.strip() for line in args.prompts.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    services = ServiceContainer(BASE_DIR)
+    await services.ensure_ready()
+    fast_parser = services.parser.fast_parser
+    if fast_parser is None:
+        raise SystemExit("No syntax element table in INDEX_DIR; re-run scripts/preprocess_docs.py")
+    llm_parser = SyntaxQueryParser(llama=services.llama)
+
+    def top_docs(elements: list) -> set:
+        doc_indices, _ = rank_by_relevance(services.retriever.retrieve_batch(elements, args.k) if elements else [])
+        return set(doc_indices[:args.top_docs])
+
+    rows, llm_times, fast_times = [], [], []
+    try:
+        for prompt in prompts:
+            start = time.perf_counter()
+            llm_elements = await llm_parser.aparse(prompt)
+            llm_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            fast_elements, confidence = fast_parser.match(prompt)
+            fast_times.append(time.perf_counter() - start)
+
+            llm_docs, fast_docs = top_docs(llm_elements), top_docs(fast_elements)
+            agreement = len(llm_docs & fast_docs) / len(llm_docs) if llm_docs else float(not fast_docs)
+            rows.append((confidence, agreement))
+            if args.verbose:
+                print(f"{confidence:.3f} {agreement:.2f} {prompt!r}\n    llm:  {llm_elements}\n    fast: {fast_elements}")
+    finally:
+        await services.aclose()
+
+    print(f"{'parser':<8}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'llm':<8}{percentile_ms(llm_times, 50):>10.1f}{percentile_ms(llm_times, 99):>10.1f}")
+    print(f"{'fast':<8}{percentile_ms(fast_times, 50):>10.1f}{percentile_ms(fast_times, 99):>10.1f}")
+    print(f"\n{'threshold':<10}{'fast-path share':>16}{'agreement':>11}")
+    for threshold in args.thresholds:
+        accepted = [agreement for confidence, agreement in rows if confidence >= threshold]
+        mean = f"{np.mean(accepted):.2f}" if accepted else "-"
+        print(f"{threshold:<10}{len(accepted) / len(rows):>16.2f}{mean:>11}")
+    print(f"\n{len(prompts)} prompts, agreement over the top {args.top_docs} documents")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--prompts", type=Path, help="Text file with one prompt per line")
+    arg_parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.75, 0.8, 0.9])
+    arg_parser.add_argument("--k", type=int, default=2, help="Documents retrieved per syntax element")
+    arg_parser.add_argument("--top-docs", type=int, default=4, help="Documents compared per prompt")
+    arg_parser.add_argument("--verbose", action="store_true", help="Print both parsers' elements per prompt")
+    asyncio.run(run(arg_parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Hit rate and latency of dense-only vs hybrid (dense + BM25) retrieval.
+
+Indexes are built from a documentation_chunks.json file with
+preprocess_docs.process_prebuilt_chunks into a temporary directory. Two
+query sets are derived from the chunks themselves:
+
+- api: dotted API names taken from each chunk's code snippet (e.g.
+  "csv.DictReader"); a hit is any chunk whose title, summary or code
+  contains the name.
+- title: each chunk's title; a hit is that chunk.
+
+Usage:
+    python -m benchmarks.bench_hybrid_retrieval --chunks data/faiss_index/documentation_chunks.json --k 2
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.document_retrieval import DocumentRetriever
+from app.utils.bm25_index import TOKEN_PATTERN, chunk_text, tokenize
+from scripts.preprocess_docs import process_prebuilt_chunks
+
+
+def build_queries(chunks: list) -> dict:
+    tokenized = [set(tokenize(chunk_text(chunk))) for chunk in chunks]
+    api_queries = {}
+    for chunk in chunks:
+        for name in TOKEN_PATTERN.findall(chunk.get("code_snippet") or ""):
+            if "." in name and name.lower() not in api_queries:
+                api_queries[name.lower()] = {i for i, tokens in enumerate(tokenized) if name.lower() in tokens}
+    title_queries = {chunk["chunk_title"]: {i} for i, chunk in enumerate(chunks) if chunk.get("chunk_title")}
+    return {"api": api_queries, "title": title_queries}
+
+
+def evaluate(retriever: DocumentRetriever, queries: dict, k: int) -> dict:
+    tasks = list(queries)
+    latencies = []
+    hits = 0
+    for task in tasks:
+        start = time.perf_counter()
+        found = retriever.retrieve_batch([task], k)[0]
+        latencies.append(time.perf_counter() - start)
+        hits += bool(set(found) & queries[task])
+    return {"hit_rate": hits / len(tasks), "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p99_ms": float(np.percentile(latencies, 99)) * 1000}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--chunks", type=Path, default=Path("data/faiss_index/documentation_chunks.json"))
+    arg_parser.add_argument("--k", type=int, default=2)
+    arg_parser.add_argument("--threshold", type=float, default=0.6)
+    arg_parser.add_argument("--candidates", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    with open(args.chunks, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    query_sets = build_queries(chunks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        chunks_json = Path(directory) / "documentation_chunks.json"
+        shutil.copy(args.chunks, chunks_json)
+        process_prebuilt_chunks(chunks_json, Path(directory) / "summary_index.index", Path(directory) / "usecase_index.index")
+        common = dict(
+            summary_index_path=os.path.join(directory, "summary_index.index"),
+            usecase_index_path=os.path.join(directory, "usecase_index.index"),
+            docs_path=os.path.join(directory, "documentation_chunks.store"),
+            score_threshold=args.threshold,
+            hybrid_candidates=args.candidates,
+        )
+        dense = DocumentRetriever(**common)
+        hybrid = DocumentRetriever(lexical_index_path=os.path.join(directory, "bm25_index.npz"), **common)
+
+        # Lexical scoring alone, to show the overhead it adds per query
+        all_tasks = [task for queries in query_sets.values() for task in queries]
+        start = time.perf_counter()
+        for task in all_tasks:
+            hybrid.lexical_index.search(task, args.candidates, hybrid.lexical_threshold)
+        lexical_ms = (time.perf_counter() - start) * 1000 / len(all_tasks)
+
+        print(f"{'queries':<8}{'count':>7}{'mode':>8}{'hit@k':>8}{'p50 ms':>9}{'p99 ms':>9}")
+        for name, queries in query_sets.items():
+            for mode, retriever in (("dense", dense), ("hybrid", hybrid)):
+                r = evaluate(retriever, queries, args.k)
+                print(f"{name:<8}{len(queries):>7}{mode:>8}{r['hit_rate']:>8.2f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+        print(f"BM25 scoring alone: {lexical_ms:.3f} ms/query over {len(chunks)} chunks")
+        dense.executor.shutdown()
+        hybrid.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
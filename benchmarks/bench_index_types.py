@@ -0,0 +1,70 @@
+"""
+Recall@k and query latency of approximate FAISS index types against the flat baseline.
+
+Vectors are synthetic, normalised and clustered so that IVF/PQ behave as
+they would on real sentence embeddings. Each index is built with
+`app.utils.faiss_utils.build_index`, the same code preprocess_docs uses.
+
+Usage:
+    python -m benchmarks.bench_index_types --num-vectors 50000 --queries 500 --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.utils.faiss_utils import INDEX_TYPES, build_index, configure_search
+
+
+def synthetic_vectors(num_vectors: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, num_vectors)] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--num-vectors", type=int, default=20000)
+    arg_parser.add_argument("--dimension", type=int, default=384)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--nlist", type=int, default=256)
+    arg_parser.add_argument("--nprobe", type=int, default=16)
+    arg_parser.add_argument("--ef-search", type=int, default=64)
+    arg_parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = arg_parser.parse_args()
+
+    vectors = synthetic_vectors(args.num_vectors, args.dimension, clusters=max(16, args.num_vectors // 500))
+    queries = synthetic_vectors(args.queries, args.dimension, clusters=max(16, args.num_vectors // 500), seed=1)
+
+    truth = None
+    print(f"{'index':<8}{'build s':>10}{'recall@k':>10}{'ms/query':>10}{'batch ms/query':>16}")
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, nlist=args.nlist)
+        build_seconds = time.perf_counter() - start
+        configure_search(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+        # One query at a time, as /generate did before batching
+        start = time.perf_counter()
+        for row in range(len(queries)):
+            index.search(queries[row:row + 1], args.k)
+        single_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        _, found = index.search(queries, args.k)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        if truth is None:
+            truth = found
+        print(f"{index_type:<8}{build_seconds:>10.2f}{recall_at_k(truth, found):>10.3f}{single_ms:>10.3f}{batch_ms:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Behaviour of the Ollama client when the model server misbehaves.
+
+Sends concurrent `OllamaHandler.agenerate` calls to a local stub Ollama
+server that fails a share of requests with 503, and reports the success
+rate and latency percentiles without retries and with the configured
+retry policy. Then simulates an outage (every request fails) and reports
+how long callers wait for their error with and without the circuit breaker.
+
+Usage:
+    python -m benchmarks.bench_llm_faults --error-rate 0.2 --requests 200
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from app import config
+from app.models.llama_handler import OllamaHandler
+from tests.stub_ollama import StubOllamaServer
+
+
+async def run_calls(handler: OllamaHandler, total: int) -> tuple:
+    async def timed(i: int):
+        start = time.perf_counter()
+        try:
+            await handler.agenerate(f"prompt {i}")
+            ok = True
+        except Exception:
+            ok = False
+        return ok, (time.perf_counter() - start) * 1000
+
+    try:
+        results = await asyncio.gather(*(timed(i) for i in range(total)))
+    finally:
+        await handler.aclose()
+    latencies = np.array([latency for _, latency in results])
+    return sum(ok for ok, _ in results) / total, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Stub model latency per request in seconds")
+    arg_parser.add_argument("--error-rate", type=float, default=0.2, help="Share of requests the stub fails with 503")
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    args = arg_parser.parse_args()
+    # Every failed and retried call logs; keep the report readable
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    common = dict(max_concurrency=args.concurrency, max_in_flight=args.requests, coalesce=False)
+    print(f"{'scenario':<28}{'success':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    with StubOllamaServer(latency=args.latency, error_rate=args.error_rate) as server:
+        for name, retries in (("flaky, no retries", 0), (f"flaky, {config.OLLAMA_MAX_RETRIES} retries", config.OLLAMA_MAX_RETRIES)):
+            handler = OllamaHandler(host=server.url, max_retries=retries, breaker_failures=args.requests, **common)
+            success, p50, p95 = asyncio.run(run_calls(handler, args.requests))
+            print(f"{name:<28}{success:>9.1%}{p50:>10.1f}{p95:>10.1f}")
+
+    with StubOllamaServer(latency=args.latency, error_rate=1.0) as server:
+        for name, failures in (("outage, no breaker", args.requests * 10), ("outage, breaker", config.OLLAMA_BREAKER_FAILURES)):
+            handler = OllamaHandler(host=server.url, breaker_failures=failures, **common)
+            server.request_count = 0
+            success, p50, p95 = asyncio.run(run_calls(handler, args.requests))
+            print(f"{name:<28}{success:>9.1%}{p50:>10.1f}{p95:>10.1f}   ({server.request_count} server requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Latency and throughput of retrieval with and without cross-request micro-batching.
+
+Builds synthetic split FAISS indexes and a document store in a temporary
+directory, loads them with DocumentRetriever and the real embedding model,
+then runs closed-loop clients that each call `aretrieve_batch` with a few
+syntax elements, as /generate does. Every concurrency level is run once
+with batching off and once per --batch-wait value.
+
+Usage:
+    python -m benchmarks.bench_retrieval_batching --concurrency 1 8 32 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from app.services.document_retrieval import DocumentRetriever
+from app.services.retrieval_batcher import RetrievalBatcher
+from app.utils.doc_store import write_doc_store
+from app.utils.faiss_utils import build_index
+from benchmarks.bench_index_types import synthetic_vectors
+
+VERBS = ["read", "parse", "sort", "filter", "merge", "serialize", "validate", "download", "compress", "plot"]
+NOUNS = ["csv file", "json payload", "list of dicts", "dataframe", "http response", "xml tree", "log lines", "image", "zip archive", "config"]
+
+
+def random_element(rng: random.Random) -> str:
+    return f"{rng.choice(VERBS)} {rng.choice(NOUNS)} {rng.randrange(10000)}"
+
+
+def build_fixture(directory: str, num_docs: int, dimension: int):
+    vectors = synthetic_vectors(num_docs, dimension, clusters=max(16, num_docs // 500))
+    faiss.write_index(build_index(vectors), os.path.join(directory, "summary_index.index"))
+    faiss.write_index(build_index(vectors[::-1].copy()), os.path.join(directory, "usecase_index.index"))
+    write_doc_store(({"chunk": f"chunk {i}", "source": f"doc{i}"} for i in range(num_docs)),
+                    os.path.join(directory, "docs.store"))
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000
+
+
+async def run_load(retriever: DocumentRetriever, concurrency: int, requests: int, elements: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    workload = [[random_element(rng) for _ in range(elements)] for _ in range(requests)]
+    latencies = []
+
+    async def client():
+        while workload:
+            tasks = workload.pop()
+            start = time.perf_counter()
+            await retriever.aretrieve_batch(tasks, k=2)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"throughput": len(latencies) / elapsed, "p50": percentile(latencies, 50), "p99": percentile(latencies, 99)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    arg_parser.add_argument("--num-docs", type=int, default=20000)
+    arg_parser.add_argument("--dimension", type=int, default=384)
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    arg_parser.add_argument("--requests", type=int, default=300)
+    arg_parser.add_argument("--elements", type=int, default=3, help="Syntax elements per request")
+    arg_parser.add_argument("--batch-size", type=int, default=32)
+    arg_parser.add_argument("--batch-wait", type=float, nargs="+", default=[1.0, 5.0], help="max_wait_ms values")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_fixture(directory, args.num_docs, args.dimension)
+        retriever = DocumentRetriever(
+            summary_index_path=os.path.join(directory, "summary_index.index"),
+            usecase_index_path=os.path.join(directory, "usecase_index.index"),
+            docs_path=os.path.join(directory, "docs.store"),
+            model_name=args.model,
+        )
+        # Warm up the model so the first measured request does not pay for it
+        retriever.retrieve_batch(["warm up"], k=2)
+
+        print(f"{'mode':<18}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'mean batch':>12}")
+        modes = [("unbatched", None)] + [(f"batched {wait:g}ms", wait) for wait in args.batch_wait]
+        for concurrency in args.concurrency:
+            for name, wait in modes:
+                retriever.batcher = None
+                if wait is not None:
+                    retriever.batcher = RetrievalBatcher(retriever.retrieve_batch, retriever.executor, args.batch_size, wait)
+                result = asyncio.run(run_load(retriever, concurrency, args.requests, args.elements, seed=concurrency))
+                mean_batch = retriever.batcher.stats()["mean_batch_size"] if retriever.batcher else args.elements
+                print(f"{name:<18}{concurrency:>8}{result['throughput']:>10.1f}{result['p50']:>10.2f}"
+                      f"{result['p99']:>10.2f}{mean_batch:>12.1f}")
+        retriever.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
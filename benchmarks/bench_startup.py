@@ -0,0 +1,121 @@
+"""
+Startup time and memory of 1 vs N API worker processes.
+
+Each worker is a separate Python process that imports `app.main` and warms
+up its services, as a uvicorn worker does on startup. All workers stay alive
+until every one has reported, so the proportional set size (PSS) shows how
+much memory is actually shared between them: pages of memory-mapped FAISS
+indexes and document stores are counted once across workers, private copies
+once per worker. Runs with FAISS_MMAP on and off.
+
+With --indexes-only the workers only load the FAISS indexes and document
+store, which isolates the effect of memory-mapping from the embedding model.
+
+Usage:
+    python -m benchmarks.bench_startup --workers 4
+    python -m benchmarks.bench_startup --workers 4 --indexes-only --index-dir data/faiss_index
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def memory_kb() -> dict:
+    """RSS and PSS of the current process in kB (Linux only)."""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                if name in ("Rss", "Pss"):
+                    usage[name.lower()] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
+
+
+def run_worker(indexes_only: bool):
+    start = time.perf_counter()
+    if indexes_only:
+        from app import config
+        from app.utils.doc_store import DocStore, DOC_STORE_SUFFIX
+        from app.utils.faiss_utils import read_index, read_index_meta
+
+        meta = read_index_meta(config.INDEX_DIR)
+        names = [meta["fused_index"]] if meta["layout"] == "fused" else [
+            meta.get("summary_index", "summary_index.index"), meta.get("usecase_index", "usecase_index.index")]
+        indexes = [read_index(os.path.join(config.INDEX_DIR, name), config.FAISS_MMAP) for name in names]
+        docs_file = config.DOCS_FILE or meta.get("doc_store", "documentation_chunks.json")
+        if docs_file.endswith(DOC_STORE_SUFFIX):
+            docs = DocStore(os.path.join(config.INDEX_DIR, docs_file))
+        else:
+            with open(os.path.join(config.INDEX_DIR, docs_file), "r", encoding="utf-8") as f:
+                docs = json.load(f)
+        # A search over a flat index reads every vector, as a busy worker eventually does
+        for index in indexes:
+            index.search(np.zeros((1, index.d), dtype="float32"), 1)
+    else:
+        from app.main import services
+        services.warm_up()
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, **memory_kb()}), flush=True)
+    # Stay alive until the parent has measured every worker
+    sys.stdin.read()
+
+
+def measure(workers: int, mmap: bool, indexes_only: bool) -> dict:
+    env = dict(os.environ, FAISS_MMAP=str(mmap), STARTUP_MODE="lazy")
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--worker"] + (["--indexes-only"] if indexes_only else [])
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    reports = []
+    for process in processes:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError("Worker exited before reporting; run it directly with --worker to see the error")
+        reports.append(json.loads(line))
+    wall = time.perf_counter() - start
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+
+    return {
+        "workers": workers,
+        "mmap": mmap,
+        "wall_seconds": wall,
+        "max_worker_seconds": max(r["seconds"] for r in reports),
+        "rss_mb": sum(r.get("rss", 0) for r in reports) / 1024,
+        "pss_mb": sum(r.get("pss", 0) for r in reports) / 1024,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--index-dir", help="Overrides INDEX_DIR for the workers")
+    arg_parser.add_argument("--indexes-only", action="store_true")
+    arg_parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        run_worker(args.indexes_only)
+        return
+    if args.index_dir:
+        os.environ["INDEX_DIR"] = args.index_dir
+
+    print(f"{'workers':>8}{'mmap':>6}{'wall s':>9}{'worker s':>10}{'total RSS MB':>14}{'total PSS MB':>14}")
+    for mmap in (False, True):
+        for workers in sorted({1, args.workers}):
+            r = measure(workers, mmap, args.indexes_only)
+            print(f"{r['workers']:>8}{str(r['mmap']):>6}{r['wall_seconds']:>9.2f}{r['max_worker_seconds']:>10.2f}"
+                  f"{r['rss_mb']:>14.1f}{r['pss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time-to-first-byte of streamed vs buffered code generation.
+
+Drives `CodeMerger.amerge_code` and `CodeMerger.astream_merge_code`
+against a local stub Ollama server that emits tokens with a fixed delay,
+and reports when the first code token arrives and when both generations
+finish.
+
+Usage:
+    python -m benchmarks.bench_streaming --token-latency 0.02 --runs 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.models.llama_handler import OllamaHandler
+from app.services.syntax_merger import CodeMerger
+from tests.stub_ollama import StubOllamaServer
+
+SNIPPETS = [{
+    "chunk_title": "Reading CSV files",
+    "summary": "csv.reader iterates over lines of a CSV file.",
+    "code_snippet": "import csv\nwith open('data.csv') as f:\n    rows = list(csv.reader(f))",
+    "source": "python-3.13-docs\\csv.txt",
+}]
+GENERATED = " ".join(["token"] * 100)
+
+
+async def measure(merger: CodeMerger, runs: int) -> dict:
+    buffered, first_token, streamed = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await merger.amerge_code(SNIPPETS, "how to open csv file")
+        buffered.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        first = None
+        async for kind, _token in merger.astream_merge_code(SNIPPETS, "how to open csv file"):
+            if first is None and kind == "code":
+                first = time.perf_counter() - start
+        first_token.append(first)
+        streamed.append(time.perf_counter() - start)
+    return {
+        "buffered_total": statistics.median(buffered),
+        "stream_first_token": statistics.median(first_token),
+        "stream_total": statistics.median(streamed),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="Stub delay before the first token in seconds")
+    arg_parser.add_argument("--token-latency", type=float, default=0.01, help="Stub delay between tokens in seconds")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    with StubOllamaServer(latency=args.latency, token_latency=args.token_latency, generate_text=GENERATED) as server:
+        merger = CodeMerger()
+        merger.llama = OllamaHandler(host=server.url)
+        results = asyncio.run(measure(merger, args.runs))
+
+    for name, seconds in results.items():
+        print(f"{name:<22}{seconds * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Retrieval and end-to-end benchmark suite with machine-readable results.
+
+For every corpus size a synthetic documentation corpus is generated and
+indexed with preprocess_docs.process_prebuilt_chunks. The suite then measures:
+
+- build: index build time and size on disk
+- load: DocumentRetriever load time and resident memory, before and after
+  querying
+- latency: single-query retrieval p50/p99 and batched queries per second
+- recall: hit rate@k of dense retrieval for each score threshold, and of
+  hybrid (dense + BM25) retrieval at the configured threshold
+
+Every synthetic chunk documents one (module, operation) pair, and each query
+asks for one pair, so a hit is any retrieved chunk about the queried pair.
+
+Finally /generate is run end-to-end, in a separate process, on the smallest
+corpus against a local stub Ollama server with a fixed latency.
+
+Results are written as JSON to --output. --compare prints the relative
+change of every metric against an earlier results file.
+
+--encoder hashing embeds with the deterministic bag-of-words encoder from
+tests/stub_encoder.py instead of the configured SentenceTransformer. It
+needs no model download and encodes a million chunks in minutes, which
+makes it suitable for regression runs. Its recall numbers are not
+comparable with those of the real model.
+
+Usage:
+    python -m benchmarks.bench_suite --sizes 1000 100000 1000000 --output results.json
+    python -m benchmarks.bench_suite --sizes 1000 --encoder hashing --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_startup import memory_kb
+
+MODULES = [
+    "csv", "json", "array", "sqlite3", "datetime", "pathlib", "re", "gzip", "zipfile", "socket", "threading",
+    "asyncio", "subprocess", "logging", "argparse", "collections", "itertools", "functools", "hashlib", "random",
+    "statistics", "decimal", "fractions", "heapq", "bisect", "struct", "pickle", "shelve", "tempfile", "shutil",
+    "glob", "urllib", "http", "email", "xml", "html", "unittest", "typing", "dataclasses", "enum",
+]
+OPERATIONS = [
+    "read", "write", "parse", "serialize", "sort", "filter", "search", "compress", "validate", "format",
+    "open", "close", "iterate", "merge", "split", "copy", "encode", "decode", "convert", "compare",
+    "cache", "schedule", "retry", "stream", "lock",
+]
+FILLER = [f"term{i}" for i in range(5000)]
+THRESHOLDS = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+
+
+def topic(i: int) -> tuple:
+    return MODULES[i % len(MODULES)], OPERATIONS[(i // len(MODULES)) % len(OPERATIONS)]
+
+
+def synthetic_chunks(size: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for i in range(size):
+        module, operation = topic(i)
+        filler = " ".join(FILLER[j] for j in rng.integers(0, len(FILLER), 8))
+        chunks.append({
+            "chunk_title": f"{operation.title()} data with {module} ({i})",
+            "summary": f"How to {operation} data using the {module} module. {filler}",
+            "use_case": f"Use {module} when you need to {operation} records. {filler}",
+            "code_snippet": f"import {module}\nresult = {module}.{operation}(data)",
+            "source": f"python-docs/{module}.txt",
+        })
+    return chunks
+
+
+def synthetic_queries(count: int, seed: int = 1) -> list:
+    """(query, module, operation) triples over pairs that exist in every corpus size."""
+    rng = np.random.default_rng(seed)
+    pairs = min(len(MODULES) * len(OPERATIONS), 1000)
+    queries = []
+    for i in rng.integers(0, pairs, count):
+        module, operation = topic(int(i))
+        queries.append((f"{operation} records with {module}", module, operation))
+    return queries
+
+
+def make_encoder(name: str):
+    if name == "hashing":
+        from tests.stub_encoder import HashingEncoder
+        return HashingEncoder()
+    from sentence_transformers import SentenceTransformer
+    from app import config
+    return SentenceTransformer(config.EMBEDDING_MODEL)
+
+
+def percentile_ms(values: list, q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+def build_corpus(directory: Path, size: int, args, encoder) -> dict:
+    from scripts.preprocess_docs import process_prebuilt_chunks
+
+    chunks_json = directory / "documentation_chunks.json"
+    with open(chunks_json, "w", encoding="utf-8") as f:
+        json.dump(synthetic_chunks(size), f)
+    start = time.perf_counter()
+    process_prebuilt_chunks(chunks_json, directory / "summary_index.index", directory / "usecase_index.index",
+                            index_type=args.index_type, fused=args.fused, model=encoder)
+    seconds = time.perf_counter() - start
+    chunks_json.unlink()
+    sizes = {path.name: path.stat().st_size for path in directory.iterdir() if path.is_file()}
+    return {"seconds": round(seconds, 3), "bytes": sum(sizes.values()), "files": sizes}
+
+
+def measure_retrieval(directory: Path, args, encoder) -> dict:
+    from app import config
+    from app.services import document_retrieval
+    from app.utils.faiss_utils import read_index_meta
+
+    meta = read_index_meta(str(directory))
+    # Reuse the already loaded encoder instead of loading the model again
+    document_retrieval.SentenceTransformer = lambda *a, **kw: encoder
+    before = memory_kb()
+    start = time.perf_counter()
+    retriever = document_retrieval.DocumentRetriever(
+        summary_index_path=str(directory / meta.get("summary_index", "summary_index.index")),
+        usecase_index_path=str(directory / meta.get("usecase_index", "usecase_index.index")),
+        fused_index_path=str(directory / meta["fused_index"]) if meta["layout"] == "fused" else None,
+        docs_path=str(directory / meta["doc_store"]),
+        nprobe=config.FAISS_NPROBE,
+        ef_search=config.FAISS_EF_SEARCH,
+        mmap=config.FAISS_MMAP,
+        score_threshold=config.RETRIEVAL_SCORE_THRESHOLD,
+        hybrid_candidates=config.HYBRID_CANDIDATES,
+        rrf_k=config.HYBRID_RRF_K,
+    )
+    load_seconds = time.perf_counter() - start
+    after = memory_kb()
+
+    queries = synthetic_queries(args.queries)
+    tasks = [query for query, _, _ in queries]
+    docs = retriever.docs
+
+    def hit_rate() -> dict:
+        hits, returned = 0, 0
+        for start_at in range(0, len(tasks), args.batch):
+            batch = queries[start_at:start_at + args.batch]
+            for (_, module, operation), found in zip(batch, retriever.retrieve_batch([q for q, _, _ in batch], args.k)):
+                returned += len(found)
+                hits += any(docs[i]["source"] == f"python-docs/{module}.txt"
+                            and docs[i]["chunk_title"].startswith(operation.title() + " ") for i in found)
+        return {"hit_rate": round(hits / len(queries), 4), "results_per_query": round(returned / len(queries), 3)}
+
+    try:
+        latencies = []
+        for task in tasks:
+            start = time.perf_counter()
+            retriever.retrieve_batch([task], args.k)
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for start_at in range(0, len(tasks), args.batch):
+            retriever.retrieve_batch(tasks[start_at:start_at + args.batch], args.k)
+        batched_qps = len(tasks) / (time.perf_counter() - start)
+
+        recall = {}
+        for threshold in args.thresholds:
+            retriever.score_threshold = threshold
+            recall[str(threshold)] = hit_rate()
+        retriever.score_threshold = config.RETRIEVAL_SCORE_THRESHOLD
+        hybrid = None
+        if "lexical_index" in meta:
+            from app.utils.bm25_index import BM25Index
+            retriever.lexical_index = BM25Index.load(str(directory / meta["lexical_index"]))
+            hybrid = {"threshold": config.RETRIEVAL_SCORE_THRESHOLD, **hit_rate()}
+        # Memory-mapped index pages are only resident once searched
+        searched = memory_kb()
+    finally:
+        retriever.executor.shutdown()
+
+    return {
+        "load": {"seconds": round(load_seconds, 3), "rss_kb": after.get("rss"),
+                 "rss_delta_kb": after.get("rss", 0) - before.get("rss", 0),
+                 "rss_after_queries_kb": searched.get("rss")},
+        "latency": {"queries": len(tasks), "p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99),
+                    "qps": round(len(tasks) / sum(latencies), 1), "batch_size": args.batch,
+                    "batched_qps": round(batched_qps, 1)},
+        "recall": {"k": args.k, "dense": recall, "hybrid": hybrid},
+    }
+
+
+async def run_e2e_worker(requests: int, concurrency: int) -> dict:
+    """Runs inside the worker process; configuration comes from its environment."""
+    import httpx
+    from app.main import app, services
+
+    await services.ensure_ready()
+    prompts = [query for query, _, _ in synthetic_queries(requests, seed=2)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        async def one(prompt: str):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/generate", json={"prompt": prompt})
+                latencies.append(time.perf_counter() - start)
+                failures += response.status_code != 200 or not response.json().get("generated_code")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(prompt) for prompt in prompts))
+        elapsed = time.perf_counter() - start
+    await services.aclose()
+    return {"requests": requests, "concurrency": concurrency, "failures": failures,
+            "p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99),
+            "rps": round(requests / elapsed, 2)}
+
+
+def measure_e2e(directory: Path, args) -> dict:
+    from tests.stub_ollama import StubOllamaServer
+
+    with StubOllamaServer(latency=args.stub_latency, chat_text='["read records", "csv module"]') as server:
+        env = dict(os.environ, INDEX_DIR=str(directory), OLLAMA_HOST=server.url, STARTUP_MODE="lazy",
+                   LOG_LEVEL="WARNING", PARSE_CACHE_ENABLED="false", RESPONSE_CACHE_ENABLED="false",
+                   HISTORY_ENABLED="false", FAST_PARSE_ENABLED="false")
+        command = [sys.executable, "-m", "benchmarks.bench_suite", "--e2e-worker", "--encoder", args.encoder,
+                   "--e2e-requests", str(args.e2e_requests), "--e2e-concurrency", str(args.e2e_concurrency)]
+        output = subprocess.run(command, env=env, stdout=subprocess.PIPE, check=True, text=True).stdout
+    return {"stub_latency_s": args.stub_latency, **json.loads(output.strip().splitlines()[-1])}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline_path: Path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = flatten(json.load(f))
+    current = flatten(results)
+    print(f"\nChange against {baseline_path}:")
+    for name, value in current.items():
+        if name.startswith("meta.") or name not in baseline:
+            continue
+        old = baseline[name]
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:<60}{old:>14}{value:>14}{change:>10}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="Corpus sizes in chunks")
+    arg_parser.add_argument("--encoder", choices=["model", "hashing"], default="model")
+    arg_parser.add_argument("--index-type", default="flat", help="FAISS index type (see preprocess_docs --index-type)")
+    arg_parser.add_argument("--fused", action="store_true", help="Build fused indexes")
+    arg_parser.add_argument("--queries", type=int, default=500)
+    arg_parser.add_argument("--batch", type=int, default=32, help="Queries per batch for batched QPS and recall")
+    arg_parser.add_argument("--k", type=int, default=2)
+    arg_parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS)
+    arg_parser.add_argument("--e2e-requests", type=int, default=50)
+    arg_parser.add_argument("--e2e-concurrency", type=int, default=8)
+    arg_parser.add_argument("--stub-latency", type=float, default=0.05, help="Stub model latency per request in seconds")
+    arg_parser.add_argument("--skip-e2e", action="store_true")
+    arg_parser.add_argument("--work-dir", type=Path, help="Keep the built corpora here instead of a temporary directory")
+    arg_parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    arg_parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    arg_parser.add_argument("--e2e-worker", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.e2e_worker:
+        if args.encoder == "hashing":
+            import sentence_transformers
+            from tests.stub_encoder import HashingEncoder
+            sentence_transformers.SentenceTransformer = HashingEncoder
+        print(json.dumps(asyncio.run(run_e2e_worker(args.e2e_requests, args.e2e_concurrency))), flush=True)
+        return
+
+    import faiss
+    from app import config
+
+    results = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "commit": git_commit(),
+                 "python": platform.python_version(), "faiss": faiss.__version__, "cpus": os.cpu_count(),
+                 "encoder": args.encoder if args.encoder == "hashing" else config.EMBEDDING_MODEL,
+                 "index_type": args.index_type, "fused": args.fused, "mmap": config.FAISS_MMAP},
+        "corpora": {},
+    }
+    encoder = make_encoder(args.encoder)
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="bench_suite_"))
+    try:
+        for size in sorted(args.sizes):
+            directory = work_dir / f"corpus_{size}"
+            directory.mkdir(parents=True, exist_ok=True)
+            print(f"Building and measuring a corpus of {size} chunks in {directory}", file=sys.stderr)
+            build = build_corpus(directory, size, args, encoder)
+            results["corpora"][str(size)] = {"build": build, **measure_retrieval(directory, args, encoder)}
+        if not args.skip_e2e:
+            results["e2e"] = measure_e2e(work_dir / f"corpus_{min(args.sizes)}", args)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'chunks':>9}{'build s':>9}{'MB':>8}{'load s':>8}{'RSS MB':>8}{'p50 ms':>8}{'p99 ms':>8}{'QPS':>9}"
+          f"{'batch QPS':>11}{'hit@k':>7}{'hybrid':>8}")
+    for size, corpus in results["corpora"].items():
+        dense = corpus["recall"]["dense"].get(str(config.RETRIEVAL_SCORE_THRESHOLD), {}).get("hit_rate", float("nan"))
+        hybrid = (corpus["recall"]["hybrid"] or {}).get("hit_rate", float("nan"))
+        print(f"{size:>9}{corpus['build']['seconds']:>9.1f}{corpus['build']['bytes'] / 2**20:>8.1f}"
+              f"{corpus['load']['seconds']:>8.2f}{(corpus['load']['rss_kb'] or 0) / 1024:>8.0f}"
+              f"{corpus['latency']['p50_ms']:>8.2f}{corpus['latency']['p99_ms']:>8.2f}{corpus['latency']['qps']:>9.1f}"
+              f"{corpus['latency']['batched_qps']:>11.1f}{dense:>7.2f}{hybrid:>8.2f}")
+    if "e2e" in results:
+        e2e = results["e2e"]
+        print(f"/generate: {e2e['requests']} requests at concurrency {e2e['concurrency']}: p50 {e2e['p50_ms']} ms, "
+              f"p99 {e2e['p99_ms']} ms, {e2e['rps']} req/s, {e2e['failures']} failed")
+    print(f"Results written to {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
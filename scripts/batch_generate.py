@@ -0,0 +1,74 @@
+"""
+Generate code for a JSONL file of CodeRequests without running the API.
+
+Uses the same services and BatchGenerator as POST /generate/batch and writes
+one JSON result per request, in completion order, to --output (default:
+stdout). Each result carries the request's 0-based "index" in the input.
+Explanations are generated inline, whatever the request's or the server's
+explanation mode, unless --no-explanations is given.
+
+Usage:
+    python -m scripts.batch_generate prompts.jsonl --output results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+from app import config
+from app.services.batch_generator import read_requests
+from app.services.container import ServiceContainer
+
+BASE_DIR = Path(__file__).parent.parent
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="JSONL file with one CodeRequest per line")
+    parser.add_argument("--output", type=Path, help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_MAX_CONCURRENCY,
+                        help="Prompts parsed or generated at once")
+    parser.add_argument("--no-explanations", action="store_true",
+                        help="Only generate code; requests that ask for an inline explanation still get one")
+    return parser.parse_args()
+
+
+async def run(args) -> int:
+    with open(args.input, "r", encoding="utf-8") as f:
+        requests = read_requests(f)
+    services = ServiceContainer(BASE_DIR)
+    await services.ensure_ready()
+    generator = services.batch_generator
+    generator.max_concurrency = args.concurrency
+    # Nobody can fetch a deferred explanation from a finished CLI run, so
+    # background and lazy explanations are generated inline instead
+    generator.explanations = None
+    generator.explanation_mode = "lazy" if args.no_explanations else "inline"
+    if not args.no_explanations:
+        for request in requests:
+            if request.explanation_mode in ("background", "lazy"):
+                request.explanation_mode = "inline"
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    start = time.perf_counter()
+    try:
+        async for result in generator.run(requests):
+            failed += "error" in result
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await services.aclose()
+    elapsed = time.perf_counter() - start
+    logging.info(f"Generated {len(requests)} results ({failed} failed) in {elapsed:.1f}s "
+                 f"({len(requests) / elapsed:.2f} requests/s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
@@ -1,88 +1,247 @@
 import os
+import re
+import sys
 import json
+import asyncio
+import argparse
 import logging
 from pathlib import Path
+from typing import Iterator, Optional
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.models.llama_handler import OllamaHandler  # noqa: E402
+from app.services.fast_parser import element_text, save_syntax_elements, syntax_elements_from_chunks  # noqa: E402
+from app.utils.bm25_index import BM25Index, chunk_text  # noqa: E402
+from app.utils.cache_utils import write_json_atomic  # noqa: E402
+from app.utils.doc_store import DOC_STORE_SUFFIX, write_doc_store  # noqa: E402
+from app.utils.embedding_store import EmbeddingStore, content_hash  # noqa: E402
+from app.utils.faiss_utils import (  # noqa: E402
+    INDEX_TYPES, SUMMARY_KIND, USECASE_KIND, build_index, fused_id, update_index, write_index_meta,
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# def extract_json(text: str) -> dict:
-#     """Extracts and parses JSON from text response."""
-#     try:
-#         match = re.search(r'```json\n(.*?)\n```', text, re.DOTALL)
-#         if match:
-#             json_content = match.group(1).strip()
-#             logging.info(f"json content: {json_content}")
-#             return json.loads(json_content)
-#     except json.JSONDecodeError as e:
-#         logging.error(f"Error decoding JSON: {e}")
-#     return {}
-
-# def generate_llama_response(prompt: str, text_chunk: str) -> dict:
-#     """Generates structured output using Ollama's LLaMA model."""
-#     try:
-#         response = ollama.chat(model="llama3.2:latest", messages=[
-#             {"role": "system", "content": prompt},
-#             {"role": "user", "content": text_chunk}
-#         ])
-        
-#         logging.info(f"Output of LLaMA response: {response}")
-        
-#         content = response.get("message", {}).get("content", "").strip()
-        
-#         result = extract_json(content)
-#         logging.info(f"extracted json: {result}")
-        
-#         return {
-#             "summary": result.get("summary", ""),
-#             "code_snippet": result.get("code_snippet", ""),
-#             "chunk_title": result.get("chunk_title", ""),
-#             "use_case": result.get("use_case", "")
-#         }
-#     except (KeyError, TypeError) as e:
-#         logging.error(f"Error processing LLaMA response: {e}")
-#         return {"summary": "", "code_snippet": "", "chunk_title": "", "use_case": ""}
-
-# def load_documentation(file_path: str) -> str:
-#     """Loads text from a documentation file."""
-#     logging.info(f"Loading documentation: {file_path}")
-#     try:
-#         with open(file_path, "r", encoding="utf-8") as f:
-#             return f.read()
-#     except Exception as e:
-#         logging.error(f"Error loading {file_path}: {e}")
-#         return ""
-
-# def split_into_chunks(text, chunk_size=2000, chunk_overlap=200):
-#     """Splits text into smaller chunks for processing."""
-#     logging.info("Splitting text into chunks...")
-#     try:
-#         text_splitter = RecursiveCharacterTextSplitter(
-#             chunk_size=chunk_size,
-#             chunk_overlap=chunk_overlap,
-#             separators=["\n\n", "\n", " ", ""]
-#         )
-#         return text_splitter.split_text(text)
-#     except Exception as e:
-#         logging.error(f"Error splitting text: {e}")
-#         return []
-
-# def generate_chunk_metadata(text_chunk):
-#     with open("C:\\code_gen_backend\\backend2\\scripts\\prompt.txt","r",encoding="utf-8") as f:
-#         prompt = f.read()
-#     try:
-#         response = generate_llama_response(prompt, text_chunk)
-#         logging.info(f"chunk metadata: {response}")
-#         return response
-#     except Exception:
-#         return None
-
-def process_prebuilt_chunks(chunks_json: Path, summary_faiss_path: Path, usecase_faiss_path: Path):
-    """Loads prebuilt chunks and generates FAISS indexes."""
+METADATA_FIELDS = ("summary", "code_snippet", "chunk_title", "use_case")
+
+def extract_json(text: str) -> dict:
+    """Extracts and parses JSON from text response."""
+    try:
+        match = re.search(r'```json\n(.*?)\n```', text, re.DOTALL)
+        json_content = match.group(1).strip() if match else text.strip()
+        return json.loads(json_content)
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON: {e}")
+    return {}
+
+def iter_paragraphs(lines: Iterator[str], max_length: int) -> Iterator[str]:
+    """Group lines into blank-line separated paragraphs no longer than max_length characters."""
+    paragraph = []
+    length = 0
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            if paragraph:
+                yield "\n".join(paragraph)
+                paragraph, length = [], 0
+            continue
+        # Split over-long lines (and paragraphs) on whitespace so no piece exceeds max_length
+        while len(line) > max_length:
+            cut = line.rfind(" ", 0, max_length)
+            cut = cut if cut > 0 else max_length
+            if paragraph:
+                yield "\n".join(paragraph)
+                paragraph, length = [], 0
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        if length + len(line) + 1 > max_length and paragraph:
+            yield "\n".join(paragraph)
+            paragraph, length = [], 0
+        paragraph.append(line)
+        length += len(line) + 1
+    if paragraph:
+        yield "\n".join(paragraph)
+
+def stream_chunks(file_path: Path, chunk_size: int = 2000, chunk_overlap: int = 200) -> Iterator[str]:
+    """
+    Split a documentation file into overlapping chunks while reading it line by line.
+
+    Memory use is bounded by roughly one chunk, whatever the file size. Chunks
+    break on paragraph boundaries where possible and each new chunk starts
+    with up to `chunk_overlap` characters from the end of the previous one.
+    """
+    buffer = ""
+    has_new_text = False
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for paragraph in iter_paragraphs(f, max_length=max(1, chunk_size - chunk_overlap - 2)):
+            if has_new_text and len(buffer) + len(paragraph) + 2 > chunk_size:
+                yield buffer
+                tail = buffer[-chunk_overlap:] if chunk_overlap else ""
+                # Start the overlap on a word boundary
+                buffer = tail[tail.find(" ") + 1:] if " " in tail else tail
+            buffer = f"{buffer}\n\n{paragraph}" if buffer else paragraph
+            has_new_text = True
+    if has_new_text and buffer.strip():
+        yield buffer
+
+def chunk_id(source: str, position: int, text: str) -> str:
+    return f"{source}#{position}:{content_hash(text)[:12]}"
+
+async def generate_chunk_metadata(llama: OllamaHandler, prompt: str, text_chunk: str) -> Optional[dict]:
+    """Generates structured metadata for one chunk using the LLaMA model."""
+    try:
+        content = await llama.agenerate_response(prompt, text_chunk)
+        result = extract_json(content)
+    except Exception as e:
+        logging.error(f"Error processing LLaMA response: {e}")
+        return None
+    if not result:
+        return None
+    return {field: result.get(field, "") for field in METADATA_FIELDS}
+
+def drop_partial_last_line(path: Path):
+    """Truncate an unterminated last line left by a crash so new records start on a fresh line."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            logging.warning(f"Dropping {end - position} bytes of an incomplete record at the end of {path}")
+            f.truncate(position)
+
+def load_completed_chunk_ids(output_jsonl: Path) -> set:
+    """Chunk ids already written by a previous (possibly interrupted) run."""
+    completed = set()
+    if not output_jsonl.exists():
+        return completed
+    drop_partial_last_line(output_jsonl)
+    with open(output_jsonl, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["chunk_id"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return completed
+
+async def ingest_raw_docs(raw_docs_dir: Path, output_jsonl: Path, prompt_path: Path, workers: int = 4,
+                          chunk_size: int = 2000, chunk_overlap: int = 200, llama: OllamaHandler = None) -> int:
+    """
+    Chunk every file under `raw_docs_dir` and generate metadata for each chunk with the LLM.
+
+    Files are streamed and chunked lazily; a bounded queue keeps at most a few
+    chunks per worker in memory while `workers` metadata requests run
+    concurrently. Each finished chunk is appended to `output_jsonl` right away,
+    so an interrupted run resumes where it stopped. Chunks whose metadata
+    could not be generated are not written and are retried on the next run.
+    Returns the number of chunks written.
+    """
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        prompt = f.read()
+    llama = llama or OllamaHandler(max_concurrency=workers)
+    completed = load_completed_chunk_ids(output_jsonl)
+    logging.info(f"Ingesting {raw_docs_dir} into {output_jsonl} ({len(completed)} chunks already done)")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    written = 0
+
+    async def produce():
+        for file_path in sorted(p for p in Path(raw_docs_dir).rglob("*") if p.is_file()):
+            source = os.path.relpath(file_path, raw_docs_dir)
+            for position, text in enumerate(stream_chunks(file_path, chunk_size, chunk_overlap)):
+                identifier = chunk_id(source, position, text)
+                if identifier not in completed:
+                    await queue.put((identifier, source, text))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume(out):
+        nonlocal written
+        while (item := await queue.get()) is not None:
+            identifier, source, text = item
+            metadata = await generate_chunk_metadata(llama, prompt, text)
+            if metadata is None:
+                logging.warning(f"Skipping chunk {identifier}; it will be retried on the next run")
+                continue
+            out.write(json.dumps({"chunk": text, **metadata, "source": source, "chunk_id": identifier}) + "\n")
+            out.flush()
+            written += 1
+            if written % 50 == 0:
+                logging.info(f"Ingested {written} chunks")
+
+    output_jsonl.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(output_jsonl, "a", encoding="utf-8") as out:
+            await asyncio.gather(produce(), *(consume(out) for _ in range(workers)))
+    finally:
+        await llama.aclose()
+    logging.info(f"Ingestion finished: {written} new chunks written to {output_jsonl}")
+    return written
+
+def jsonl_to_json(jsonl_path: Path, json_path: Path):
+    """Stream JSONL chunk records into the JSON array format used by process_prebuilt_chunks."""
+    tmp_path = Path(f"{json_path}.tmp")
+    count = 0
+    with open(jsonl_path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        dst.write("[\n")
+        for line in src:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            dst.write((",\n" if count else "") + json.dumps(record, ensure_ascii=False, indent=4))
+            count += 1
+        dst.write("\n]\n")
+    os.replace(tmp_path, json_path)
+    logging.info(f"Wrote {count} chunks to {json_path}")
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+INDEX_MANIFEST_FILE = "index_manifest.json"
+
+def lazy_encoder(model: SentenceTransformer = None):
+    """Encode function that only loads the SentenceTransformer when something needs encoding."""
+    state = {"model": model}
+
+    def encode(texts):
+        if state["model"] is None:
+            state["model"] = SentenceTransformer(MODEL_NAME)
+        return state["model"].encode(texts, convert_to_numpy=True)
+
+    return encode
+
+def process_prebuilt_chunks(chunks_json: Path, summary_faiss_path: Path, usecase_faiss_path: Path,
+                            index_type: str = "flat", fused: bool = False, index_params: dict = None,
+                            model: SentenceTransformer = None, incremental: bool = False, cache_dir: Path = None):
+    """
+    Loads prebuilt chunks and generates FAISS indexes.
+
+    By default two flat indexes are written, one over summaries and one over
+    use cases. `index_type` selects an approximate index instead (see
+    app.utils.faiss_utils.INDEX_TYPES) and `fused` writes a single index
+    holding both vector kinds, with ids that map back to chunk positions.
+    The chosen layout is recorded in index_meta.json for DocumentRetriever,
+    together with a DocStore copy of the chunks that the API reads instead
+    of the full JSON, a BM25 index over chunk titles, summaries and code
+    snippets for hybrid retrieval, and the embedded chunk titles that the
+    fast query parser matches prompts against.
+
+    With `incremental`, embeddings are cached by content hash in `cache_dir`
+    and only new or edited texts are encoded. Existing indexes are updated in
+    place by removing and re-adding the changed ids when the build settings
+    match the previous run.
+    """
     logging.info(f"Loading prebuilt chunks from {chunks_json}")
+    index_params = index_params or {}
     
     try:
         with open(chunks_json, "r", encoding="utf-8") as f:
@@ -93,31 +252,137 @@ def process_prebuilt_chunks(chunks_json: Path, summary_faiss_path: Path, usecase
     
     summaries = [chunk["summary"] for chunk in chunks]
     use_cases = [chunk["use_case"] for chunk in chunks]
+    # Chunk titles are the known syntax elements of the fast query parser
+    elements = syntax_elements_from_chunks(chunks)
+    element_texts = [element_text(title) for title in elements]
     
     logging.info("Creating FAISS index for summaries and use cases...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    
-    # Create FAISS index for summaries
-    summary_vectors = np.array(model.encode(summaries, convert_to_numpy=True)).astype('float32')
-    dimension = summary_vectors.shape[1] if summary_vectors.size > 0 else 384
-    summary_index = faiss.IndexFlatIP(dimension)
-    if summary_vectors.size > 0:
-        summary_index.add(summary_vectors)
-    faiss.write_index(summary_index, str(summary_faiss_path))
-    
-    # Create FAISS index for use cases
-    usecase_vectors = np.array(model.encode(use_cases, convert_to_numpy=True)).astype('float32')
-    usecase_index = faiss.IndexFlatIP(dimension)
-    if usecase_vectors.size > 0:
-        usecase_index.add(usecase_vectors)
-    faiss.write_index(usecase_index, str(usecase_faiss_path))
-    
-    logging.info(f"FAISS indexes saved at {summary_faiss_path} and {usecase_faiss_path}")
+    # Without a loaded model the dimension comes from the embedding cache or the first encoded batch
+    dimension = model.get_sentence_embedding_dimension() if model is not None else None
+    encode = lazy_encoder(model)
+    index_dir = Path(summary_faiss_path).parent
+    cache_dir = Path(cache_dir) if cache_dir is not None else index_dir / "embedding_cache"
+
+    if incremental:
+        store = EmbeddingStore(str(cache_dir), MODEL_NAME, dimension)
+        summary_vectors = store.get_or_encode(summaries, encode)
+        usecase_vectors = store.get_or_encode(use_cases, encode)
+        element_vectors = store.get_or_encode(element_texts, encode)
+        store.save(keep_hashes=[content_hash(text) for text in summaries + use_cases + element_texts])
+        dimension = store.dimension
+    else:
+        summary_vectors = np.array(encode(summaries)).astype('float32').reshape(len(summaries), -1)
+        if dimension is not None and summary_vectors.shape[1] != dimension:
+            raise ValueError(f"Encoder returned {summary_vectors.shape[1]}-d embeddings, expected {dimension}")
+        dimension = summary_vectors.shape[1]
+        usecase_vectors = np.array(encode(use_cases)).astype('float32').reshape(-1, dimension)
+        element_vectors = np.array(encode(element_texts)).astype('float32').reshape(-1, dimension)
+
+    # Compact memory-mapped copy of the chunks for DocumentRetriever.fetch_docs
+    doc_store_path = index_dir / (Path(chunks_json).stem + DOC_STORE_SUFFIX)
+    write_doc_store(chunks, str(doc_store_path))
+    # BM25 index over titles, summaries and code for hybrid retrieval
+    lexical_index_path = index_dir / "bm25_index.npz"
+    BM25Index.build(chunk_text(chunk) for chunk in chunks).save(str(lexical_index_path))
+    syntax_elements_path = index_dir / "syntax_elements.npz"
+    save_syntax_elements(str(syntax_elements_path), elements, element_vectors)
+
+    meta = {"layout": "fused" if fused else "split", "index_type": index_type, "params": index_params,
+            "dimension": dimension, "num_chunks": len(chunks), "doc_store": doc_store_path.name,
+            "lexical_index": lexical_index_path.name, "syntax_elements": syntax_elements_path.name}
+    build_settings = {key: meta[key] for key in ("layout", "index_type", "params", "dimension")}
+    # Each vector kind is kept with its per-position content hashes and id mapping
+    kinds = {
+        "summary": (summary_vectors, [content_hash(text) for text in summaries],
+                    (lambda p: fused_id(p, SUMMARY_KIND)) if fused else (lambda p: p)),
+        "usecase": (usecase_vectors, [content_hash(text) for text in use_cases],
+                    (lambda p: fused_id(p, USECASE_KIND)) if fused else (lambda p: p)),
+    }
+
+    if fused:
+        fused_faiss_path = index_dir / "fused_index.index"
+        targets = {fused_faiss_path: ["summary", "usecase"]}
+        meta["fused_index"] = fused_faiss_path.name
+    else:
+        targets = {Path(summary_faiss_path): ["summary"], Path(usecase_faiss_path): ["usecase"]}
+        meta.update({"summary_index": Path(summary_faiss_path).name, "usecase_index": Path(usecase_faiss_path).name})
+
+    previous = None
+    manifest_path = cache_dir / INDEX_MANIFEST_FILE
+    if incremental and manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("settings") != build_settings:
+            logging.info("Index settings changed since the last build; rebuilding from cached embeddings.")
+            previous = None
+    elif not incremental and manifest_path.exists():
+        # This build replaces the indexes without ids, so the manifest no longer describes them
+        manifest_path.unlink()
+
+    for path, kind_names in targets.items():
+        index = None
+        if previous is not None and path.exists():
+            index = faiss.read_index(str(path))
+            for name in kind_names:
+                vectors, hashes, id_fn = kinds[name]
+                if not update_index(index, previous["hashes"][name], hashes, vectors, id_fn):
+                    index = None
+                    break
+        if index is None:
+            positions = np.arange(len(chunks), dtype="int64")
+            vectors = np.vstack([kinds[name][0] for name in kind_names]).reshape(-1, dimension)
+            # Incremental and fused builds need stable ids to add/remove by
+            ids = np.concatenate([kinds[name][2](positions) for name in kind_names]) if (incremental or fused) else None
+            index = build_index(vectors, index_type, ids=ids, **index_params)
+        faiss.write_index(index, str(path))
+        logging.info(f"FAISS index saved at {path}")
+
+    if incremental:
+        write_json_atomic(str(manifest_path), {"settings": build_settings, "hashes": {name: kind[1] for name, kind in kinds.items()}})
+    write_index_meta(str(index_dir), meta)
+    logging.info(f"FAISS {meta['layout']} {index_type} index build finished for {len(chunks)} chunks")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build FAISS indexes from documentation_chunks.json")
+    parser.add_argument("--ingest", action="store_true",
+                        help="First chunk data/raw_docs and generate chunk metadata with the LLM (resumable)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent metadata requests during --ingest")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Maximum chunk length in characters")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="Characters shared by consecutive chunks")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="FAISS index type to build")
+    parser.add_argument("--fused", action="store_true", help="Build one index over summaries and use cases")
+    parser.add_argument("--nlist", type=int, default=256, help="Number of IVF lists (ivf, ivfpq)")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="Neighbours per HNSW node (hnsw)")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build-time search depth (hnsw)")
+    parser.add_argument("--pq-m", type=int, default=16, help="PQ sub-quantizers; must divide the dimension (pq, ivfpq)")
+    parser.add_argument("--pq-bits", type=int, default=8, help="Bits per PQ code (pq, ivfpq)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse cached embeddings and update existing indexes for changed chunks only")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Embedding cache directory (default: <index dir>/embedding_cache)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
     BASE_DIR = Path(__file__).parent.parent
     chunks_json = BASE_DIR / "data" / "faiss_index" / "documentation_chunks.json"
     summary_faiss_path = BASE_DIR / "data" / "faiss_index" / "summary_index.index"
     usecase_faiss_path = BASE_DIR / "data" / "faiss_index" / "usecase_index.index"
     
-    process_prebuilt_chunks(chunks_json, summary_faiss_path, usecase_faiss_path)
+    if args.ingest:
+        chunks_jsonl = BASE_DIR / "data" / "faiss_index" / "documentation_chunks.jsonl"
+        asyncio.run(ingest_raw_docs(BASE_DIR / "data" / "raw_docs", chunks_jsonl, BASE_DIR / "scripts" / "prompt.txt",
+                                    workers=args.workers, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap))
+        jsonl_to_json(chunks_jsonl, chunks_json)
+
+    index_params = {}
+    if args.index_type in ("ivf", "ivfpq"):
+        index_params["nlist"] = args.nlist
+    if args.index_type == "hnsw":
+        index_params.update({"hnsw_m": args.hnsw_m, "ef_construction": args.ef_construction})
+    if args.index_type in ("pq", "ivfpq"):
+        index_params.update({"pq_m": args.pq_m, "pq_bits": args.pq_bits})
+
+    process_prebuilt_chunks(chunks_json, summary_faiss_path, usecase_faiss_path,
+                            index_type=args.index_type, fused=args.fused, index_params=index_params,
+                            incremental=args.incremental, cache_dir=args.cache_dir)
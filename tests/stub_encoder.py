@@ -0,0 +1,33 @@
+import re
+import zlib
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+class HashingEncoder:
+    """
+    Offline stand-in for SentenceTransformer used by tests and benchmarks.
+
+    Texts are embedded as L2-normalised hashed bags of words, so texts that
+    share words are close and identical texts embed identically. No model is
+    downloaded and encoding is fast enough for corpora of a million chunks.
+    """
+
+    def __init__(self, model_name: str = "hashing", dimension: int = 384, **kwargs):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False, convert_to_numpy: bool = True,
+               **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in WORD_PATTERN.findall(text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
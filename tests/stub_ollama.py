@@ -0,0 +1,158 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _tokenize(text: str) -> list:
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def _token_counts(prompt: str, completion: str) -> dict:
+    # Ollama reports these on the final response of every generation
+    return {"prompt_eval_count": len(_tokenize(prompt)), "eval_count": len(_tokenize(completion))}
+
+
+class StubOllamaServer:
+    """
+    Minimal local stand-in for the Ollama HTTP API used by tests and benchmarks.
+
+    Serves `/api/generate` and `/api/chat` with a fixed reply after a
+    configurable delay. Each request is handled on its own thread, so
+    concurrent clients are served concurrently like a real model server.
+    Requests with `"stream": true` get the reply as chunked NDJSON, one
+    token per line, with `token_latency` seconds between tokens; buffered
+    requests wait for the same total generation time before replying.
+
+    Faults can be injected to exercise client resilience: `inject` queues
+    faults for the next requests, and `error_rate` fails that fraction of
+    requests with a 503.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05,
+                 generate_text: str = "print('hello world')", chat_text: str = '["file handling", "CSV parsing"]',
+                 token_latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._faults = deque()
+        self.token_latency = token_latency
+        self.generate_text = generate_text
+        self.chat_text = chat_text
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def inject(self, *faults):
+        """
+        Apply one fault to each of the next requests, in order.
+
+        A fault is an HTTP status code to reply with, "drop" to close the
+        connection without replying, a number of seconds to delay the
+        request by before serving it normally, or a `bytes` body to send
+        as-is with status 200 (a malformed reply).
+        """
+        with self._lock:
+            self._faults.extend(faults)
+
+    def _next_fault(self):
+        with self._lock:
+            self.request_count += 1
+            if self._faults:
+                return self._faults.popleft()
+        if self.error_rate and random.random() < self.error_rate:
+            return 503
+        return None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                fault = stub._next_fault()
+                if fault == "drop":
+                    self.close_connection = True
+                    return
+                if isinstance(fault, bytes):
+                    self._send_body(fault, "application/json")
+                    return
+                if isinstance(fault, int):
+                    self._send_json({"error": f"injected status {fault}"}, status=fault)
+                    return
+                time.sleep(stub.latency + (fault or 0))
+
+                if self.path == "/api/generate" and payload.get("stream"):
+                    self._send_stream(payload, stub.generate_text)
+                    return
+                if self.path == "/api/generate":
+                    time.sleep(stub.token_latency * len(_tokenize(stub.generate_text)))
+                    body = {"model": payload.get("model"), "response": stub.generate_text, "done": True,
+                            **_token_counts(payload.get("prompt", ""), stub.generate_text)}
+                elif self.path == "/api/chat":
+                    prompt = " ".join(message["content"] for message in payload.get("messages", []))
+                    body = {"model": payload.get("model"), "message": {"role": "assistant", "content": stub.chat_text}, "done": True,
+                            **_token_counts(prompt, stub.chat_text)}
+                else:
+                    self.send_error(404)
+                    return
+                self._send_json(body)
+
+            def _send_json(self, body: dict, status: int = 200):
+                self._send_body(json.dumps(body).encode("utf-8"), "application/json", status)
+
+            def _send_body(self, data: bytes, content_type: str, status: int = 200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload: dict, text: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in _tokenize(text):
+                    self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                    time.sleep(stub.token_latency)
+                self._write_chunk({"model": payload.get("model"), "response": "", "done": True,
+                                   **_token_counts(payload.get("prompt", ""), text)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, body: dict):
+                data = json.dumps(body).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,185 @@
+import asyncio
+import functools
+import json
+
+import httpx
+import pytest
+
+from app import config, main
+from app.models.llama_handler import OllamaHandler
+from app.services import container, document_retrieval
+from app.services.container import ServiceContainer
+from tests.stub_encoder import HashingEncoder
+from tests.stub_ollama import StubOllamaServer
+from tests.test_index import build_indexes
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Serve the API from a fresh ServiceContainer over the test corpus, with a stub Ollama server."""
+    index_dir = tmp_path / "index"
+    index_dir.mkdir()
+    build_indexes(index_dir)
+    server = StubOllamaServer(latency=0, generate_text="rows = list(csv.reader(f))", chat_text='["CSV parsing"]')
+    server.start()
+    monkeypatch.setattr(document_retrieval, "SentenceTransformer", HashingEncoder)
+    monkeypatch.setattr(container, "OllamaHandler", functools.partial(OllamaHandler, host=server.url, retry_backoff=0.01))
+    monkeypatch.setattr(config, "INDEX_DIR", str(index_dir))
+    monkeypatch.setattr(config, "RETRIEVAL_SCORE_THRESHOLD", 0.3)
+    # Caches and history are written under tmp_path
+    monkeypatch.setattr(main, "services", ServiceContainer(tmp_path))
+    yield server
+    server.stop()
+
+
+def call_api(requests):
+    """Run `requests(client)` against the app in process and return its result."""
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            try:
+                return await requests(client)
+            finally:
+                await main.services.aclose()
+
+    return asyncio.run(run())
+
+
+async def poll_ready(client) -> httpx.Response:
+    for _ in range(200):
+        response = await client.get("/ready")
+        if response.json()["status"] not in ("starting", "not_started"):
+            return response
+        await asyncio.sleep(0.05)
+    return response
+
+
+def test_ready_starts_loading_in_lazy_mode(api, monkeypatch):
+    monkeypatch.setattr(config, "STARTUP_MODE", "lazy")
+
+    async def requests(client):
+        return await client.get("/ready"), await poll_ready(client)
+
+    first, last = call_api(requests)
+    assert first.status_code == 503 and first.json()["status"] == "starting"
+    assert last.status_code == 200 and last.json() == {"status": "ready"}
+
+
+def test_ready_reports_a_failed_warm_up(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "STARTUP_MODE", "lazy")
+    monkeypatch.setattr(config, "INDEX_DIR", str(tmp_path / "missing"))
+
+    response = call_api(poll_ready)
+    assert response.status_code == 503
+    assert response.json()["status"] == "failed" and response.json()["error"]
+
+
+def events(response: httpx.Response) -> list:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_sends_events_in_order(api):
+    async def requests(client):
+        return await client.post("/generate/stream", json={"prompt": "CSV parsing"})
+
+    stream = events(call_api(requests))
+    names = [event["event"] for event in stream]
+    # Consecutive code and explanation tokens collapsed
+    assert [name for i, name in enumerate(names) if i == 0 or names[i - 1] != name] == [
+        "syntax_elements", "references", "code", "explanation", "done"]
+    assert "".join(event["data"] for event in stream if event["event"] == "code") == api.generate_text
+    assert stream[1]["data"] == ["csv.txt"]
+    done = stream[-1]["data"]
+    assert done["generation_id"] and done["prompt_tokens"]["context_tokens"] > 0
+
+
+def test_stream_reports_failures_as_an_error_event(api):
+    api.error_rate = 1.0
+
+    async def requests(client):
+        return await client.post("/generate/stream", json={"prompt": "CSV parsing"})
+
+    response = call_api(requests)
+    assert response.status_code == 200
+    assert events(response)[-1]["event"] == "error"
+
+
+def test_deferred_explanation_endpoint(api):
+    async def requests(client):
+        generated = (await client.post("/generate", json={"prompt": "CSV parsing", "explanation_mode": "lazy"})).json()
+        generation_id = generated["generation_id"]
+        pending = await client.get(f"/generate/{generation_id}/explanation", params={"wait": "false"})
+        api.error_rate = 1.0
+        failed = await client.get(f"/generate/{generation_id}/explanation")
+        api.error_rate = 0.0
+        # The circuit breaker has not opened after one failed call, so this goes through
+        explained = await client.get(f"/generate/{generation_id}/explanation")
+        unknown = await client.get("/generate/unknown/explanation")
+        return generated, pending, failed, explained, unknown
+
+    generated, pending, failed, explained, unknown = call_api(requests)
+    assert generated["explanation_pending"] and generated["explanation"] == ""
+    assert pending.json()["explanation_pending"]
+    assert failed.status_code == 503
+    assert explained.status_code == 200 and explained.json()["explanation"] == api.generate_text
+    assert unknown.status_code == 404
+
+
+def test_generate_reports_model_failures_as_errors(api):
+    api.error_rate = 1.0
+
+    async def requests(client):
+        return await client.post("/generate", json={"prompt": "CSV parsing"})
+
+    response = call_api(requests)
+    assert response.status_code == 503
+    assert "chat" in response.json()["detail"]
+
+
+def test_history_endpoint(api):
+    async def requests(client):
+        generated = (await client.post("/generate", json={"prompt": "CSV parsing"})).json()
+        return generated, await client.get(f"/history/{generated['generation_id']}"), await client.get("/history/unknown")
+
+    generated, record, unknown = call_api(requests)
+    assert record.status_code == 200
+    record = record.json()
+    assert record["endpoint"] == "/generate" and record["prompt"] == "CSV parsing"
+    assert record["generated_code"] == generated["generated_code"] and record["references"] == ["csv.txt"]
+    # Micro-batched retrieval stages are attributed to the request
+    assert {"parse", "retrieve", "embed", "faiss_search", "generate_code"} <= set(record["timings"])
+    assert unknown.status_code == 404
+
+
+def test_metrics_endpoint(api):
+    api.error_rate = 1.0
+
+    async def requests(client):
+        await client.post("/generate", json={"prompt": "CSV parsing"})
+        return await client.get("/metrics")
+
+    response = call_api(requests)
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert 'codegen_stage_duration_seconds_count{stage="request"}' in response.text
+    # The failed prompt parsing shows up as a stage error and a failed LLM call
+    assert 'codegen_stage_errors_total{stage="parse"}' in response.text
+    assert 'codegen_llm_requests_total{endpoint="chat",outcome="error"}' in response.text
+
+
+def test_batch_endpoint(api, monkeypatch):
+    lines = '{"prompt": "CSV parsing"}\n{"prompt": "JSON parsing", "explanation_mode": "lazy"}\n'
+
+    async def requests(client):
+        ok = await client.post("/generate/batch", files={"file": ("prompts.jsonl", lines)})
+        invalid = await client.post("/generate/batch", files={"file": ("prompts.jsonl", '{"prompt": "ok"}\nnot json\n')})
+        monkeypatch.setattr(config, "BATCH_MAX_REQUESTS", 1)
+        too_many = await client.post("/generate/batch", files={"file": ("prompts.jsonl", lines)})
+        return ok, invalid, too_many
+
+    ok, invalid, too_many = call_api(requests)
+    results = sorted(events(ok), key=lambda result: result["index"])
+    assert [result["index"] for result in results] == [0, 1]
+    assert results[0]["generated_code"] == api.generate_text and results[0]["explanation"] == api.generate_text
+    assert results[1]["explanation_pending"]
+    assert invalid.status_code == 400 and "line 2" in invalid.json()["detail"]
+    assert too_many.status_code == 413
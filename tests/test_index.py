@@ -1,15 +1,220 @@
+import json
+
+import faiss
+import pytest
+
+from app.services import document_retrieval
 from app.services.document_retrieval import DocumentRetriever
+from scripts import preprocess_docs
+from scripts.preprocess_docs import process_prebuilt_chunks
+from tests.stub_encoder import HashingEncoder
+
+CHUNKS = [
+    {"chunk_title": "Reading CSV files", "summary": "CSV parsing of rows with csv.reader.",
+     "use_case": "Parse a CSV file row by row.", "code_snippet": "rows = list(csv.reader(f))", "source": "csv.txt"},
+    {"chunk_title": "Dict rows", "summary": "Map CSV rows to dictionaries.",
+     "use_case": "Read records keyed by header.", "code_snippet": "csv.DictReader(f)", "source": "csv.txt"},
+    {"chunk_title": "Parsing JSON", "summary": "JSON parsing of strings into Python objects.",
+     "use_case": "Decode a JSON document.", "code_snippet": "json.loads(text)", "source": "json.txt"},
+    {"chunk_title": "Arrays", "summary": "Typed numeric arrays.",
+     "use_case": "Store many integers compactly.", "code_snippet": "array.array('i')", "source": "array.txt"},
+]
+
+
+def build_indexes(tmp_path, chunks=CHUNKS, **kwargs):
+    chunks_json = tmp_path / "documentation_chunks.json"
+    chunks_json.write_text(json.dumps(chunks), encoding="utf-8")
+    process_prebuilt_chunks(chunks_json, tmp_path / "summary_index.index", tmp_path / "usecase_index.index",
+                            model=HashingEncoder(), **kwargs)
+    return json.loads((tmp_path / "index_meta.json").read_text(encoding="utf-8"))
 
 
-def test_document_retriever():
-    retriever = DocumentRetriever(
-        docs_path="C:\\code_gen_backend\\backend2\\data\\faiss_index\\documentation_chunks.json",
-        index_path="C:\\code_gen_backend\\backend2\\data\\faiss_index\\documentation.index",
+def test_document_retriever(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_retrieval, "SentenceTransformer", HashingEncoder)
+    meta = build_indexes(tmp_path)
+    paths = dict(
+        summary_index_path=str(tmp_path / meta["summary_index"]),
+        usecase_index_path=str(tmp_path / meta["usecase_index"]),
+        docs_path=str(tmp_path / meta["doc_store"]),
+        score_threshold=0.3,
     )
+    retriever = DocumentRetriever(**paths)
+
+    indices = retriever.retrieve("CSV parsing", k=2)
+    assert indices[0] == 0
+    assert retriever.fetch_docs(indices)[0]["chunk_title"] == "Reading CSV files"
+    assert retriever.retrieve_batch(["CSV parsing", "JSON parsing"], k=2) == [
+        indices, retriever.retrieve("JSON parsing", k=2)]
+    # Nothing in the corpus is close to this
+    assert retriever.retrieve("thread pool", k=2) == []
+
+    # The API name only appears in code, which is not embedded: BM25 finds it
+    hybrid = DocumentRetriever(lexical_index_path=str(tmp_path / meta["lexical_index"]), **paths)
+    assert retriever.retrieve("DictReader", k=2) == []
+    assert hybrid.retrieve("DictReader", k=2) == [1]
+    # Sharing a common word or a one-letter name with a chunk is not a lexical match
+    for query in ("f", "compactly sorting rows", "thread pool"):
+        assert hybrid.retrieve(query, k=2) == retriever.retrieve(query, k=2) == []
+    assert hybrid.retrieve("JSON parsing", k=2) == [2]
+    retriever.executor.shutdown()
+    hybrid.executor.shutdown()
+
+
+@pytest.mark.parametrize("index_type,fused,index_params", [
+    ("flat", True, {}),
+    ("ivf", False, {"nlist": 2}),
+    ("ivf", True, {"nlist": 2}),
+    ("hnsw", False, {"hnsw_m": 8}),
+])
+def test_document_retriever_loads_every_index_layout(tmp_path, monkeypatch, index_type, fused, index_params):
+    monkeypatch.setattr(document_retrieval, "SentenceTransformer", HashingEncoder)
+    queries = ["CSV parsing", "JSON parsing", "typed numeric arrays"]
+
+    def retrieve_all(directory, **kwargs):
+        directory.mkdir()
+        meta = build_indexes(directory, **kwargs)
+        assert meta["layout"] == ("fused" if kwargs.get("fused") else "split")
+        retriever = DocumentRetriever(
+            summary_index_path=str(directory / meta["summary_index"]) if "summary_index" in meta else None,
+            usecase_index_path=str(directory / meta["usecase_index"]) if "usecase_index" in meta else None,
+            fused_index_path=str(directory / meta["fused_index"]) if "fused_index" in meta else None,
+            docs_path=str(directory / meta["doc_store"]),
+            # Probe every list, so the approximate indexes are exact on this tiny corpus
+            nprobe=2, ef_search=16, score_threshold=0.3,
+        )
+        try:
+            return [retriever.retrieve(query, k=2) for query in queries]
+        finally:
+            retriever.executor.shutdown()
+
+    expected = retrieve_all(tmp_path / "flat")
+    assert expected == [[0, 1], [2, 2], [3]]
+    assert retrieve_all(tmp_path / "other", index_type=index_type, fused=fused, index_params=index_params) == expected
+
+
+def test_incremental_builds_follow_edits(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_retrieval, "SentenceTransformer", HashingEncoder)
+
+    def build_and_check(chunks, incremental=True):
+        meta = build_indexes(tmp_path, chunks=chunks, incremental=incremental)
+        retriever = DocumentRetriever(str(tmp_path / meta["summary_index"]), str(tmp_path / meta["usecase_index"]),
+                                      str(tmp_path / meta["doc_store"]), score_threshold=0.3)
+        assert retriever.summary_index.ntotal == retriever.usecase_index.ntotal == len(chunks)
+        for position, chunk in enumerate(chunks):
+            assert retriever.retrieve(chunk["summary"], k=1) == [position]
+        retriever.executor.shutdown()
+
+    chunks = [dict(chunk) for chunk in CHUNKS]
+    build_and_check(chunks)
+    # Edit one chunk and add one
+    chunks[2]["summary"] = "Serialize Python objects to JSON text with json.dumps."
+    chunks.append({"chunk_title": "Thread pools", "summary": "Run callables on a pool of worker threads.",
+                   "use_case": "Execute tasks concurrently.", "code_snippet": "ThreadPoolExecutor()", "source": "futures.txt"})
+    build_and_check(chunks)
+    # Remove one, shifting the positions after it
+    del chunks[1]
+    build_and_check(chunks)
+
+    # A normal build in between replaces the indexes with ones that have no ids
+    build_and_check(chunks, incremental=False)
+    chunks[0]["summary"] = "Split CSV rows into fields with csv.reader."
+    build_and_check(chunks)
+
+
+def test_builds_take_the_dimension_from_the_encoder(tmp_path, monkeypatch):
+    chunks_json = tmp_path / "documentation_chunks.json"
+    chunks_json.write_text(json.dumps(CHUNKS), encoding="utf-8")
+
+    def build(dimension, **kwargs):
+        # The CLI path: no model is passed and the encoder is loaded on first use
+        monkeypatch.setattr(preprocess_docs, "SentenceTransformer", lambda name: HashingEncoder(dimension=dimension))
+        process_prebuilt_chunks(chunks_json, tmp_path / "summary_index.index", tmp_path / "usecase_index.index", **kwargs)
+        meta = json.loads((tmp_path / "index_meta.json").read_text(encoding="utf-8"))
+        return meta["dimension"], faiss.read_index(str(tmp_path / meta["summary_index"])).d
+
+    assert build(64) == (64, 64)
+    assert build(32, incremental=True) == (32, 32)
+    # Everything is cached, so the dimension comes from the embedding store without encoding
+    assert build(None, incremental=True) == (32, 32)
+    # Texts encoded at another width than the cached ones are refused, not mis-shaped
+    edited = [dict(CHUNKS[0], summary="Split CSV rows into fields.")] + CHUNKS[1:]
+    chunks_json.write_text(json.dumps(edited), encoding="utf-8")
+    with pytest.raises(ValueError, match="64-d embeddings"):
+        build(64, incremental=True)
+
+
+def test_embedding_store_encodes_only_new_texts(tmp_path):
+    import numpy as np
+    from app.utils.embedding_store import EmbeddingStore
+
+    encoded = []
+
+    def encode(texts):
+        encoded.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype="float32")
+
+    store = EmbeddingStore(str(tmp_path), "test-model", dimension=2)
+    first = store.get_or_encode(["a", "bb", "a"], encode)
+    store.save()
+
+    reopened = EmbeddingStore(str(tmp_path), "test-model", dimension=2)
+    second = reopened.get_or_encode(["bb", "ccc"], encode)
+    reopened.save(keep_hashes=[])
+
+    assert encoded == [["a", "bb"], ["ccc"]]
+    assert first.tolist() == [[1, 1], [2, 1], [1, 1]]
+    assert second.tolist() == [[2, 1], [3, 1]]
+    assert EmbeddingStore(str(tmp_path), "test-model", dimension=2).count == 0
+    assert EmbeddingStore(str(tmp_path), "other-model", dimension=2).rows == {}
+
+
+def test_doc_store_matches_json(tmp_path):
+    import json
+    from app.utils.doc_store import DocStore, convert_json_to_doc_store
+
+    records = [{"chunk": f"chunk {i}", "summary": "ünïcode ✓", "source": f"doc{i}.txt"} for i in range(5)]
+    json_path = tmp_path / "chunks.json"
+    json_path.write_text(json.dumps(records), encoding="utf-8")
+
+    store_path = str(tmp_path / "chunks.store")
+    assert convert_json_to_doc_store(str(json_path), store_path) == 5
+
+    store = DocStore(store_path)
+    assert len(store) == 5
+    assert store[3] == records[3]
+    assert store[-1] == records[-1]
+    assert store.get_many([4, 0]) == [records[4], records[0]]
+    store.close()
+
+
+def test_mmap_read_index_matches_in_memory(tmp_path):
+    import faiss
+    import numpy as np
+    from app.utils.faiss_utils import build_index, read_index
+
+    vectors = np.random.default_rng(0).standard_normal((200, 16)).astype("float32")
+    path = str(tmp_path / "test.index")
+    faiss.write_index(build_index(vectors, "flat", ids=np.arange(200) * 2), path)
+
+    in_memory = read_index(path)
+    mapped = read_index(path, mmap=True)
+    assert np.array_equal(in_memory.search(vectors[:5], 3)[1], mapped.search(vectors[:5], 3)[1])
+
+
+def test_bm25_finds_exact_api_names_and_fuses_by_rank(tmp_path):
+    from app.utils.bm25_index import BM25Index, chunk_text, reciprocal_rank_fusion
+
+    chunks = [
+        {"chunk_title": "Reading CSV files", "summary": "Read rows with csv.reader.", "code_snippet": "csv.reader(f)"},
+        {"chunk_title": "Dict rows", "summary": "Map rows to dicts.", "code_snippet": "csv.DictReader(f)"},
+        {"chunk_title": "Arrays", "summary": "Typed numeric arrays.", "code_snippet": "array.array('i')"},
+    ]
+    path = str(tmp_path / "bm25_index.npz")
+    BM25Index.build(chunk_text(chunk) for chunk in chunks).save(path)
+    index = BM25Index.load(path)
+
+    assert index.search("csv.DictReader", k=3)[0][0] == 1
+    assert index.search("DictReader", k=3)[0][0] == 1
+    assert index.search("unrelated words", k=3) == []
 
-    snippets = []
-    for element in ["CSV parsing"]:
-        retrieved_snippets = retriever.retrieve(element, k=2)
-        snippets.extend(retrieved_snippets)
-    print(snippets)
-        
\ No newline at end of file
+    assert reciprocal_rank_fusion([[2, 0], [1, 0]], k=2) == [0, 2]
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from app.models.llama_handler import OllamaHandler
+from scripts.preprocess_docs import ingest_raw_docs, jsonl_to_json, stream_chunks
+from tests.stub_ollama import StubOllamaServer
+
+METADATA = '```json\n{"summary": "s", "code_snippet": "c", "chunk_title": "t", "use_case": "u"}\n```'
+
+
+def test_stream_chunks_bounds_size_and_overlaps(tmp_path):
+    doc = tmp_path / "doc.txt"
+    doc.write_text("\n\n".join(f"paragraph {i} " + "word " * 40 for i in range(30)), encoding="utf-8")
+
+    chunks = list(stream_chunks(doc, chunk_size=500, chunk_overlap=50))
+
+    assert len(chunks) > 5
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "paragraph 29" in chunks[-1]
+    # Consecutive chunks share text from the overlap
+    assert chunks[0][-20:] in chunks[1]
+
+
+def test_ingestion_writes_jsonl_and_resumes(tmp_path):
+    raw_dir = tmp_path / "raw_docs"
+    (raw_dir / "docs").mkdir(parents=True)
+    for name in ("a.txt", "b.txt"):
+        (raw_dir / "docs" / name).write_text("\n\n".join("text " * 100 for _ in range(5)), encoding="utf-8")
+    prompt = tmp_path / "prompt.txt"
+    prompt.write_text("extract metadata", encoding="utf-8")
+    output = tmp_path / "chunks.jsonl"
+
+    with StubOllamaServer(latency=0, chat_text=METADATA) as server:
+        def run():
+            # The chunks repeat the same text; count one server call per chunk rather than sharing them
+            llama = OllamaHandler(host=server.url, max_concurrency=3, coalesce=False)
+            return asyncio.run(ingest_raw_docs(raw_dir, output, prompt, workers=3, chunk_size=600, chunk_overlap=60, llama=llama))
+
+        first = run()
+        calls_after_first = server.request_count
+        # Simulate a crash that lost the last record and left a partial line behind
+        lines = output.read_text(encoding="utf-8").splitlines(keepends=True)
+        output.write_text("".join(lines[:-1]) + lines[-1][:10], encoding="utf-8")
+        second = run()
+
+    assert first == calls_after_first
+    assert second == 1
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert len({r["chunk_id"] for r in records}) == first
+    assert records[0]["summary"] == "s" and records[0]["source"].endswith("a.txt")
+
+    chunks_json = tmp_path / "chunks.json"
+    jsonl_to_json(output, chunks_json)
+    assert len(json.loads(chunks_json.read_text(encoding="utf-8"))) == first
@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.llama_handler import OllamaHandler
+from app.models.resilience import CircuitBreaker, LLMError, LLMTimeoutError, LLMUnavailableError
+from app.utils.metrics import LLM_REQUESTS
+from tests.stub_ollama import StubOllamaServer
+
+
+def test_async_generate_runs_concurrently():
+    with StubOllamaServer(latency=0.3, generate_text="x = 1") as server:
+        handler = OllamaHandler(host=server.url, max_concurrency=8)
+
+        async def run():
+            try:
+                return await asyncio.gather(*(handler.agenerate(f"prompt {i}") for i in range(8)))
+            finally:
+                await handler.aclose()
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+    assert results == ["x = 1"] * 8
+    # Eight 0.3s calls served in parallel, not back to back (2.4s)
+    assert elapsed < 1.5
+
+
+def test_async_chat_response():
+    with StubOllamaServer(latency=0, chat_text='["CSV parsing"]') as server:
+        handler = OllamaHandler(host=server.url)
+
+        async def run():
+            try:
+                return await handler.agenerate_response("system", "user")
+            finally:
+                await handler.aclose()
+
+        assert asyncio.run(run()) == '["CSV parsing"]'
+
+
+def test_stream_generate_yields_tokens():
+    text = "import csv\nwith open('data.csv') as f:\n    rows = list(csv.reader(f))"
+    with StubOllamaServer(latency=0, generate_text=text) as server:
+        handler = OllamaHandler(host=server.url)
+
+        async def run():
+            try:
+                return [token async for token in handler.astream_generate("prompt")]
+            finally:
+                await handler.aclose()
+
+        tokens = asyncio.run(run())
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == text
+
+
+def test_retries_recover_from_server_faults():
+    with StubOllamaServer(latency=0, generate_text="x = 1") as server:
+        server.inject(503, "drop")
+        handler = OllamaHandler(host=server.url, max_retries=2, retry_backoff=0.01)
+
+        async def run():
+            try:
+                return await handler.agenerate("prompt")
+            finally:
+                await handler.aclose()
+
+        assert asyncio.run(run()) == "x = 1"
+        assert server.request_count == 3
+        # Blocking calls share the retry policy
+        server.inject(502)
+        assert handler.generate_response("system", "user") == '["file handling", "CSV parsing"]'
+
+
+def test_errors_raise_instead_of_returning_empty_text():
+    with StubOllamaServer(latency=0) as server:
+        server.inject(400, 503, 503)
+        handler = OllamaHandler(host=server.url, max_retries=1, retry_backoff=0.01)
+
+        # Client errors are not retried
+        with pytest.raises(LLMError):
+            handler.generate("prompt")
+        assert server.request_count == 1
+        with pytest.raises(LLMError):
+            handler.generate("prompt")
+        assert server.request_count == 3
+
+
+def test_malformed_replies_fail_without_retries():
+    with StubOllamaServer(latency=0) as server:
+        handler = OllamaHandler(host=server.url, max_retries=2, retry_backoff=0.01, breaker_failures=1)
+        errors = LLM_REQUESTS._series.get(("generate", "error"), 0.0)
+
+        async def run(call):
+            try:
+                return await call
+            finally:
+                await handler.aclose()
+
+        async def stream():
+            return [token async for token in handler.astream_generate("prompt")]
+
+        calls = [
+            lambda: handler.generate("prompt"),
+            lambda: asyncio.run(run(handler.agenerate("prompt"))),
+            lambda: handler.generate_response("system", "user"),
+            lambda: asyncio.run(run(handler.agenerate_response("system", "user"))),
+            lambda: asyncio.run(run(stream())),
+        ]
+        for call, body in zip(calls, [b"not json", b'{"done": true}', b'{"message": {}}', b'["content"]', b'{"response": 1}']):
+            server.inject(body)
+            server.request_count = 0
+            with pytest.raises(LLMError, match="unexpected"):
+                call()
+            assert server.request_count == 1
+        # The server answered every time, so the circuit stays closed
+        assert handler.breaker.state == CircuitBreaker.CLOSED
+        assert LLM_REQUESTS._series[("generate", "error")] == errors + 2
+
+
+def test_deadline_bounds_a_slow_call():
+    with StubOllamaServer(latency=2.0) as server:
+        handler = OllamaHandler(host=server.url, deadline=0.2)
+
+        async def run():
+            try:
+                return await handler.agenerate("prompt")
+            finally:
+                await handler.aclose()
+
+        start = time.perf_counter()
+        with pytest.raises(LLMTimeoutError):
+            asyncio.run(run())
+        assert time.perf_counter() - start < 1.0
+
+
+def test_circuit_breaker_rejects_without_calling_the_server():
+    with StubOllamaServer(latency=0) as server:
+        server.inject(503, 503)
+        handler = OllamaHandler(host=server.url, max_retries=0, breaker_failures=2, breaker_reset=0.2)
+
+        for _ in range(2):
+            with pytest.raises(LLMError):
+                handler.generate("prompt")
+        with pytest.raises(LLMUnavailableError):
+            handler.generate("prompt")
+        assert server.request_count == 2
+
+        # After the reset timeout a trial call goes through and closes the circuit
+        time.sleep(0.25)
+        assert handler.generate("prompt") == "print('hello world')"
+        assert handler.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    with StubOllamaServer(latency=0.2, generate_text="x = 1") as server:
+        handler = OllamaHandler(host=server.url)
+
+        async def run():
+            try:
+                return await asyncio.gather(*(handler.agenerate("same prompt") for _ in range(5)), handler.agenerate("other"))
+            finally:
+                await handler.aclose()
+
+        assert asyncio.run(run()) == ["x = 1"] * 6
+        assert server.request_count == 2
+
+
+def test_max_in_flight_rejects_excess_calls():
+    with StubOllamaServer(latency=0.3) as server:
+        handler = OllamaHandler(host=server.url, max_in_flight=2, coalesce=False)
+
+        async def run():
+            try:
+                return await asyncio.gather(*(handler.agenerate(f"prompt {i}") for i in range(3)), return_exceptions=True)
+            finally:
+                await handler.aclose()
+
+        results = asyncio.run(run())
+
+    assert sum(isinstance(result, LLMUnavailableError) for result in results) == 1
+    assert server.request_count == 2
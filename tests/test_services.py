@@ -0,0 +1,345 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app.models.llama_handler import OllamaHandler
+from app.services.batch_generator import BatchGenerator, read_requests
+from app.services.explanation_store import ExplanationStore
+from app.services.fast_parser import FastSyntaxParser, split_clauses
+from app.services.history_store import HistoryStore
+from app.services.parse_cache import ParseCache
+from app.services.query_parser import SyntaxQueryParser
+from app.services.response_cache import ResponseCache
+from app.services.retrieval_batcher import RetrievalBatcher
+from app.services.syntax_merger import CodeMerger
+from tests.stub_ollama import StubOllamaServer
+
+
+def make_merger(url: str) -> CodeMerger:
+    merger = CodeMerger()
+    merger.llama = OllamaHandler(host=url)
+    return merger
+
+
+def test_lazy_explanation_is_generated_on_demand():
+    with StubOllamaServer(latency=0, generate_text="explained") as server:
+        merger = make_merger(server.url)
+
+        async def run():
+            store = ExplanationStore(merger)
+            generation_id = store.register("x = 1")
+            pending_before = store.is_pending(generation_id)
+            count_before = server.request_count
+            explanation = await store.get(generation_id)
+            await merger.llama.aclose()
+            return pending_before, count_before, explanation
+
+        pending_before, count_before, explanation = asyncio.run(run())
+
+    assert pending_before is True
+    assert count_before == 0
+    assert explanation == "explained"
+
+
+def test_background_explanation_and_eviction():
+    with StubOllamaServer(latency=0, generate_text="explained") as server:
+        merger = make_merger(server.url)
+
+        async def run():
+            store = ExplanationStore(merger, max_entries=1)
+            first = store.register("x = 1")
+            second = store.register("y = 2", background=True)
+            explanation = await store.get(second)
+            await merger.llama.aclose()
+            return first in store, explanation, server.request_count
+
+        first_kept, explanation, requests_made = asyncio.run(run())
+
+    assert first_kept is False
+    assert explanation == "explained"
+    assert requests_made == 1
+
+
+def test_parse_cache_normalises_and_persists(tmp_path):
+    path = str(tmp_path / "parse_cache.json")
+    cache = ParseCache(path=path)
+    cache.put("How to open CSV file?", ["file handling", "CSV parsing"])
+
+    assert cache.get("  how to open csv   file ") == ["file handling", "CSV parsing"]
+    assert cache.get("how to sort a list") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    cache.save()
+    reloaded = ParseCache(path=path)
+    assert reloaded.get("how to open csv file") == ["file handling", "CSV parsing"]
+
+
+def test_parse_cache_semantic_and_ttl():
+    vectors = {"open csv file": [1.0, 0.0], "read a csv file": [0.99, 0.14], "sort list": [0.0, 1.0]}
+    cache = ParseCache(embed_fn=lambda text: vectors[text], similarity_threshold=0.95)
+    cache.put("open csv file", ["CSV parsing"])
+
+    assert cache.get("read a csv file") == ["CSV parsing"]
+    assert cache.get("sort list") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+    expired = ParseCache(ttl_seconds=0.01)
+    expired.put("open csv file", ["CSV parsing"])
+    time.sleep(0.02)
+    assert expired.get("open csv file") is None
+
+
+def test_response_cache_disk_tier_and_invalidation(tmp_path):
+    db_path = str(tmp_path / "responses.sqlite3")
+    key = ResponseCache.make_key("How to open CSV file?", [3, 1], "llama3.2:latest", {"temperature": 0.2})
+    assert key == ResponseCache.make_key("how to open csv file", [1, 3], "llama3.2:latest", {"temperature": 0.2})
+
+    cache = ResponseCache(db_path, index_version="v1")
+    cache.put(key, "import csv", "uses csv", ["csv.txt"])
+    cache.close()
+
+    reopened = ResponseCache(db_path, index_version="v1")
+    assert reopened.get(key) == {"generated_code": "import csv", "explanation": "uses csv", "references": ["csv.txt"]}
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+    rebuilt = ResponseCache(db_path, index_version="v2")
+    assert rebuilt.get(key) is None
+    rebuilt.close()
+
+
+def test_response_cache_keeps_explanation_on_late_put(tmp_path):
+    db_path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(db_path, index_version="v1")
+    # The code-only put lands after the one carrying the explanation
+    cache.put("key", "import csv", "uses csv", ["csv.txt"])
+    cache.put("key", "import csv", None, ["csv.txt"])
+    assert cache.get("key")["explanation"] == "uses csv"
+    cache.close()
+
+    reopened = ResponseCache(db_path, index_version="v1")
+    assert reopened.get("key")["explanation"] == "uses csv"
+    # New code does not inherit the old code's explanation
+    reopened.put("key", "import json", None, ["json.txt"])
+    assert reopened.get("key")["explanation"] is None
+    reopened.close()
+
+
+def test_retrieval_batcher_merges_concurrent_requests():
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def retrieve_batch(tasks, k):
+        calls.append((list(tasks), k))
+        return [[len(task) * 10 + k] for task in tasks]
+
+    async def run():
+        batcher = RetrievalBatcher(retrieve_batch, executor, max_batch_size=100, max_wait_ms=20)
+        return await asyncio.gather(
+            batcher.submit(["a", "bb"], k=2),
+            batcher.submit(["bb", "ccc"], k=2),
+            batcher.submit(["a"], k=3),
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        results = asyncio.run(run())
+
+    assert results == [[[12], [22]], [[22], [32]], [[13]]]
+    # One call per distinct k, with duplicates retrieved once
+    assert sorted(calls) == [(["a"], 3), (["a", "bb", "ccc"], 2)]
+
+
+def test_retrieval_batcher_attributes_spans_to_every_request():
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.metrics import collect_timings, current_span, request_id_var, span
+
+    span_request_ids = []
+
+    def retrieve_batch(tasks, k):
+        for stage in ("embed", "faiss_search"):
+            with span(stage):
+                span_request_ids.append(current_span().request_id)
+        return [[0] for _ in tasks]
+
+    async def request(batcher, request_id, task):
+        request_id_var.set(request_id)
+        timings = collect_timings()
+        await batcher.submit([task])
+        return timings
+
+    async def run():
+        batcher = RetrievalBatcher(retrieve_batch, executor, max_batch_size=100, max_wait_ms=20)
+        return await asyncio.gather(request(batcher, "req-1", "a"), request(batcher, "req-2", "b"))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        timings = asyncio.run(run())
+
+    assert span_request_ids == ["req-1,req-2", "req-1,req-2"]
+    for request_timings in timings:
+        assert set(request_timings) == {"embed", "faiss_search"}
+
+
+def test_context_builder_ranks_dedupes_and_respects_budget():
+    from app.services.context_builder import ContextBuilder, estimate_tokens
+
+    snippets = [
+        {"chunk_title": "Low", "summary": "low ranked  snippet", "code_snippet": "    low = 1\n\n\n    print(low)"},
+        {"chunk_title": "High", "summary": "High ranked snippet.", "code_snippet": "high = 2"},
+        {"chunk_title": "High", "summary": "High ranked snippet.", "code_snippet": "high = 2  "},
+        {"chunk_title": "Long", "summary": "Many lines.", "code_snippet": "\n".join(f"value_{i} = {i}" for i in range(200))},
+    ]
+    context, report = ContextBuilder(max_tokens=120, min_snippet_tokens=10).build(snippets, scores=[0.5, 2.0, 1.0, 0.1])
+
+    assert context.index("### High") < context.index("### Low")
+    assert context.count("### High") == 1 and report["snippets_duplicate"] == 1
+    # Indentation and blank-line noise is stripped
+    assert "low = 1\n\nprint(low)" in context
+    # The long snippet is cut at a line boundary and its code fence is closed
+    assert "# ... (truncated)" in context and context.rstrip().endswith("```")
+    assert report["context_tokens"] == estimate_tokens(context) <= 120
+    assert report["snippets_used"] == 3
+
+
+def test_explanation_prompt_is_truncated_to_budget():
+    merger = CodeMerger(llama=OllamaHandler(), explanation_code_tokens=50)
+    prompt = merger.build_explanation_prompt("\n".join(f"x_{i} = {i}" for i in range(100)))
+    assert "x_0 = 0" in prompt and "x_99" not in prompt and "# ... (truncated)" in prompt
+
+
+def test_spans_feed_stage_histograms_and_token_counters():
+    from app.utils.metrics import REGISTRY, request_id_var, span
+
+    with StubOllamaServer(latency=0, generate_text="one two three") as server:
+        llama = OllamaHandler(host=server.url)
+
+        async def run():
+            request_id_var.set("test-request")
+            with span("test_generate") as generate_span:
+                await llama.agenerate("a prompt of six tokens here")
+            await llama.aclose()
+            return generate_span
+
+        generate_span = asyncio.run(run())
+
+    assert generate_span.request_id == "test-request"
+    assert generate_span.attributes == {"llm_prompt_tokens": 6, "llm_completion_tokens": 3}
+    exposition = REGISTRY.render()
+    assert 'codegen_stage_duration_seconds_count{stage="test_generate"} 1' in exposition
+    assert 'codegen_stage_duration_seconds_bucket{stage="test_generate",le="+Inf"} 1' in exposition
+    assert 'codegen_llm_tokens_total{stage="test_generate",kind="prompt"} 6.0' in exposition
+
+
+def test_history_store_batches_writes_and_reads_unflushed_records(tmp_path):
+    db_path = str(tmp_path / "history.sqlite3")
+
+    async def run():
+        store = HistoryStore(db_path, flush_interval_ms=50)
+        for i in range(3):
+            store.record(f"gen-{i}", "/generate", f"prompt {i}", ["csv"], [i, 7], ["doc"], f"code {i}",
+                         timings={"parse": 1.5}, prompt_tokens={"context_tokens": 10})
+        unflushed = await store.get("gen-1")
+        await asyncio.sleep(0.2)
+        flushed = await store.get("gen-1")
+        store.update_explanation("gen-1", "explained later")
+        updated = await store.get("gen-1")
+        await store.aclose()
+        return unflushed, flushed, updated, store.stats()
+
+    unflushed, flushed, updated, stats = asyncio.run(run())
+    assert unflushed["generated_code"] == "code 1" and unflushed["explanation"] is None
+    assert flushed["doc_ids"] == [1, 7] and flushed["timings"] == {"parse": 1.5}
+    assert updated["explanation"] == "explained later"
+    # Three records in one flush, then the explanation update on close
+    assert stats == {"pending": 0, "flushes": 2, "records_written": 4}
+
+    async def reopen():
+        store = HistoryStore(db_path)
+        record, missing = await store.get("gen-1"), await store.get("unknown")
+        await store.aclose()
+        return record, missing
+
+    record, missing = asyncio.run(reopen())
+    assert record["explanation"] == "explained later" and record["prompt"] == "prompt 1"
+    assert missing is None
+
+
+class FakeParser:
+    def __init__(self):
+        self.prompts = []
+
+    async def aparse(self, prompt):
+        self.prompts.append(prompt)
+        return ["csv parsing", prompt]
+
+
+class FakeRetriever:
+    def __init__(self):
+        self.batches = []
+
+    async def aretrieve_batch(self, tasks, k=2):
+        self.batches.append(list(tasks))
+        return [[0, len(task) % 3] for task in tasks]
+
+    def fetch_docs(self, indices):
+        return [{"chunk_title": f"doc {i}", "summary": "", "code_snippet": "", "source": f"doc{i}.txt"} for i in indices]
+
+
+def test_batch_generator_dedupes_and_retrieves_once():
+    lines = ['{"prompt": "read csv"}', "", '{"prompt": "write json", "explanation_mode": "lazy"}', '{"prompt": "read csv"}']
+    requests = read_requests(lines)
+    with StubOllamaServer(latency=0, generate_text="code") as server:
+        merger = make_merger(server.url)
+        parser, retriever = FakeParser(), FakeRetriever()
+
+        async def run():
+            generator = BatchGenerator(parser, retriever, merger, max_concurrency=2)
+            results = [result async for result in generator.run(requests)]
+            await merger.llama.aclose()
+            return results
+
+        results = asyncio.run(run())
+        requests_made = server.request_count
+
+    assert sorted(parser.prompts) == ["read csv", "write json"]
+    assert retriever.batches == [["csv parsing", "read csv", "write json"]]
+    by_index = {result["index"]: result for result in results}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0]["generated_code"] == "code" and by_index[0]["explanation"] == "code"
+    assert by_index[2]["generation_id"] == by_index[0]["generation_id"]
+    # Lazy explanations are skipped without an ExplanationStore: 2 code + 1 explanation calls
+    assert by_index[1]["explanation"] == "" and requests_made == 3
+
+    with pytest.raises(ValueError, match="line 2"):
+        read_requests(['{"prompt": "ok"}', '{"explanation_mode": "inline"}'])
+
+
+def bag_of_words(texts):
+    vocabulary = ["read", "write", "csv", "json", "array", "sort"]
+    return np.array([[text.lower().count(word) for word in vocabulary] for text in texts], dtype="float32")
+
+
+def test_fast_parser_matches_clauses_and_falls_back_to_llm():
+    elements = ["Reading CSV Files", "Writing JSON", "Sorting an Array"]
+    fast_parser = FastSyntaxParser(elements, bag_of_words(elements), bag_of_words, threshold=0.7)
+    assert split_clauses("How to read a csv file, then write json?") == ["read a csv file", "write json"]
+
+    with StubOllamaServer(latency=0, chat_text='["llm element"]') as server:
+        llama = OllamaHandler(host=server.url)
+        parser = SyntaxQueryParser(llama=llama, fast_parser=fast_parser)
+
+        async def run():
+            fast = await parser.aparse("read a csv file and write json")
+            requests_after_fast = server.request_count
+            # "open a socket" matches no element: the LLM is asked
+            fallback = await parser.aparse("read a csv file and open a socket")
+            await llama.aclose()
+            return fast, requests_after_fast, fallback
+
+        fast, requests_after_fast, fallback = asyncio.run(run())
+
+    assert fast == ["Reading CSV Files", "Writing JSON"]
+    assert requests_after_fast == 0
+    assert fallback == ["llm element"]